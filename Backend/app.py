@@ -1,20 +1,111 @@
-import pandas as pd
+from __future__ import annotations
+
+import importlib
 import math
 from pathlib import Path
-from openpyxl import Workbook
-from openpyxl.styles import Alignment, Font, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
 from fastapi import FastAPI, UploadFile, File
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
 import tempfile
+import zipfile
 import os, json
+import re
+import io
+import mmap
+import sys
+import shutil
+import sqlite3
+import uuid
+import asyncio
+import threading
+import queue
+import multiprocessing
+import contextvars
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack, asynccontextmanager, closing, contextmanager
+from collections import OrderedDict
 from io import BytesIO
-from openai import OpenAI
 import hashlib
 import time
-from typing import Any, Dict, List , Optional
-client = OpenAI(api_key="")
+from datetime import date, datetime, timedelta, timezone
+import inspect
+from functools import lru_cache, partial
+from typing import Any, Dict, Iterator, List , Optional, Tuple
+
+
+# ==========================================
+# ЛЕНИВЫЕ ИМПОРТЫ
+# ==========================================
+# pandas / openpyxl / openai грузятся при первом использовании (или в warm_up),
+# чтобы импорт app и /health не ждали их после рестарта воркера.
+class _LazyModule:
+    """
+    Заглушка модуля: настоящий импорт — при первом обращении к атрибуту. importlib.util.LazyLoader
+    в 3.11 не потокобезопасен (параллельные первые обращения видят недогруженный модуль), поэтому
+    импорт обычный и под замком, а после него глобальное имя в app заменяется самим модулем —
+    дальше обращения идут без заглушки.
+    """
+
+    def __init__(self, name: str, alias: str):
+        self._name, self._alias = name, alias
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            module = importlib.import_module(self._name)
+            globals()[self._alias] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+
+def _lazy_import(name: str, alias: str):
+    if name in sys.modules:
+        return sys.modules[name]
+    return _LazyModule(name, alias)
+
+
+pd = _lazy_import("pandas", "pd")
+np = _lazy_import("numpy", "np")
+
+
+@lru_cache(maxsize=1)
+def openai_client():
+    from openai import OpenAI
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY", ""))
+
+
+_warm = threading.Event()
+_warm_thread: Optional[threading.Thread] = None
+
+
+def warm_up():
+    """Явный прогрев: тяжёлые модули, клиент OpenAI и версия оптимизатора (inspect исходников)."""
+    pd.DataFrame
+    import openpyxl.styles  # noqa: F401
+    try:
+        openai_client()
+    except Exception as e:
+        # без ключа клиент не создаётся — AI-валидация упадёт позже, но остальное прогрето
+        print(f"WARN: клиент OpenAI не создан при прогреве: {e}")
+    optimizer_version()
+    _warm.set()
+
+
+def start_warm_up():
+    global _warm_thread
+    _warm_thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    _warm_thread.start()
+
+
+def _wait_warm_up():
+    """fork посреди импорта в потоке прогрева даёт воркеру недогруженный модуль — ждём прогрев."""
+    if _warm_thread is not None and _warm_thread is not threading.current_thread():
+        _warm_thread.join()
 
 IMPORTANT_SHEETS = [
     "РУП",
@@ -24,6 +115,10 @@ IMPORTANT_SHEETS = [
     "Правила составления",
 ]
 
+# Необязательный лист: запреты слотов для преподавателей, групп и аудиторий (см. compile_rules)
+AVAILABILITY_SHEET = "Недоступность"
+OPTIONAL_SHEETS = [AVAILABILITY_SHEET]
+
 MAX_ROWS_PER_SHEET = 80
 
 SHEET_COLUMNS = {
@@ -37,11 +132,70 @@ SHEET_COLUMNS = {
 _AI_CACHE: Dict[str, Dict[str, Any]] = {}
 _AI_CACHE_TTL_SEC = 60 * 60  # 1 час
 
+# Кэш готовых ответов /process (на диске, LRU по mtime, ограничен по размеру)
+RESULT_CACHE_DIR = Path(os.getenv("SCHEDULE_CACHE_DIR", ".schedule_cache"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("SCHEDULE_CACHE_MAX_MB", "256")) * 1024 * 1024
+RESULT_SCHEMA_VERSION = 6  # поднимать при изменении формата ответа
+
+
+# Экономный по памяти режим: имена (группы, преподаватели, дисциплины, аудитории)
+# хранятся категориями с одной общей таблицей на книгу, семестры — срезами без копий.
+LEAN_FRAMES = os.getenv("SCHEDULE_LEAN_FRAMES", "1") == "1"
+
+NAME_COLUMNS = {
+    "РУП": ["Дисциплина"],
+    "Нагруженность преподователей": ["Дисциплина", "ФИО преподавателя", "группа"],
+    "Группы и направления": ["Группа"],
+    "Аудитории": ["Аудитория", "Назначение"],
+}
+
+
+def intern_names(sheets: Dict[str, pd.DataFrame]) -> Optional[pd.CategoricalDtype]:
+    """Переводит колонки NAME_COLUMNS в категории с общей таблицей (на месте). Возвращает dtype."""
+    columns = [(name, col) for name, cols in NAME_COLUMNS.items() if name in sheets
+               for col in cols if col in sheets[name].columns]
+    if not columns:
+        return None
+    values = pd.concat([sheets[name][col] for name, col in columns], ignore_index=True).dropna()
+    dtype = pd.CategoricalDtype(pd.unique(values))
+    for name, col in columns:
+        sheets[name][col] = sheets[name][col].astype(dtype)
+    return dtype
+
+
+def read_workbook_sheets(source) -> Dict[str, pd.DataFrame]:
+    """
+    Листы IMPORTANT_SHEETS (и OPTIONAL_SHEETS, если есть) за один разбор файла — общие
+    для logic_precheck_full и оптимизатора.
+    source — bytes или путь (см. open_workbook).
+    """
+    with open_workbook(source) as fh:
+        xls = pd.ExcelFile(fh)
+        sheets = {name: pd.read_excel(xls, sheet_name=name) for name in IMPORTANT_SHEETS + OPTIONAL_SHEETS
+                  if name in xls.sheet_names}
+    if LEAN_FRAMES:
+        intern_names(sheets)
+    return sheets
+
 
 def split_load_by_semester(df_teachers: pd.DataFrame) -> Dict[int, pd.DataFrame]:
     if "семестр" not in df_teachers.columns:
         return {}
 
+    if LEAN_FRAMES:
+        # одна стабильная сортировка, дальше каждый семестр — срез iloc (view, без копии)
+        ordered = df_teachers.sort_values("семестр", kind="stable", na_position="last")
+        sems = ordered["семестр"].to_numpy()
+        result = {}
+        for sem in pd.unique(ordered["семестр"].dropna()):
+            try:
+                sem_int = int(sem)
+            except:
+                continue
+            start, stop = sems.searchsorted(sem, "left"), sems.searchsorted(sem, "right")
+            result[sem_int] = ordered.iloc[start:stop]
+        return result
+
     result = {}
     for sem in sorted(df_teachers["семестр"].dropna().unique()):
         try:
@@ -51,14 +205,15 @@ def split_load_by_semester(df_teachers: pd.DataFrame) -> Dict[int, pd.DataFrame]
         result[sem_int] = df_teachers[df_teachers["семестр"] == sem].copy()
     return result
 def sheet_preview(df: pd.DataFrame, sheet_name: str) -> Dict[str, Any]:
-    df2 = df.copy()
+    # сначала режем строки до превью (срез, без копии), копируем только его
+    df2 = df.head(MAX_ROWS_PER_SHEET)
 
     wanted = SHEET_COLUMNS.get(sheet_name)
     if wanted:
         existing = [c for c in wanted if c in df2.columns]
         df2 = df2[existing]
 
-    df2 = df2.head(MAX_ROWS_PER_SHEET).copy()
+    df2 = df2.copy()
     df2.columns = [str(c) for c in df2.columns]
     rows = df2.to_dict(orient="records")
 
@@ -71,23 +226,24 @@ def sheet_preview(df: pd.DataFrame, sheet_name: str) -> Dict[str, Any]:
         "rows_preview": rows,
     }
 
-def build_payload(excel_bytes: bytes) -> Dict[str, Any]:
-    xls = pd.ExcelFile(BytesIO(excel_bytes))
-    payload = {
-        "sheet_names": xls.sheet_names,
-        "sheets": {},
-        "meta": {
-            "max_rows_per_sheet": MAX_ROWS_PER_SHEET,
-            "columns_policy": SHEET_COLUMNS,
+def build_payload(source) -> Dict[str, Any]:
+    with open_workbook(source) as fh:
+        xls = pd.ExcelFile(fh)
+        payload = {
+            "sheet_names": xls.sheet_names,
+            "sheets": {},
+            "meta": {
+                "max_rows_per_sheet": MAX_ROWS_PER_SHEET,
+                "columns_policy": SHEET_COLUMNS,
+            }
         }
-    }
 
-    for name in IMPORTANT_SHEETS:
-        if name not in xls.sheet_names:
-            payload["sheets"][name] = {"error": "sheet_missing"}
-            continue
-        df = pd.read_excel(xls, sheet_name=name)
-        payload["sheets"][name] = sheet_preview(df, name)
+        for name in IMPORTANT_SHEETS:
+            if name not in xls.sheet_names:
+                payload["sheets"][name] = {"error": "sheet_missing"}
+                continue
+            df = pd.read_excel(xls, sheet_name=name)
+            payload["sheets"][name] = sheet_preview(df, name)
 
     return payload
 
@@ -157,6 +313,185 @@ REPORT_SCHEMA = {
 def _sha256(data: bytes) -> str:
     return hashlib.sha256(data).hexdigest()
 
+
+# ==========================================
+# ЗАГРУЗКА ФАЙЛОВ
+# ==========================================
+# Загрузка не читается в память целиком: кусками пишется во временный файл,
+# sha256 считается по ходу. Дальше конвейер получает путь ("source") и открывает
+# файл один раз через mmap; в пул процессов уходит путь, а не байты.
+MAX_UPLOAD_BYTES = int(os.getenv("SCHEDULE_MAX_UPLOAD_MB", "20")) * 1024 * 1024
+# /process/batch: лимит на весь запрос (несколько книг или zip); каждая книга — не больше MAX_UPLOAD_BYTES
+MAX_BATCH_BYTES = int(os.getenv("SCHEDULE_MAX_BATCH_MB", "200")) * 1024 * 1024
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+UPLOAD_DIR = Path(os.getenv("SCHEDULE_UPLOAD_DIR", tempfile.gettempdir()))
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class SpooledUpload:
+    def __init__(self, path: str, sha256: str, size: int):
+        self.path, self.sha256, self.size = path, sha256, size
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+async def spool_upload(file: UploadFile, limit: Optional[int] = None) -> SpooledUpload:
+    limit = MAX_UPLOAD_BYTES if limit is None else limit
+    h = hashlib.sha256()
+    size = 0
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx", dir=UPLOAD_DIR) as tmp:
+        upload = SpooledUpload(tmp.name, "", 0)
+        try:
+            while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if size > limit:
+                    raise UploadTooLarge()
+                h.update(chunk)
+                tmp.write(chunk)
+        except BaseException:
+            tmp.close()
+            upload.discard()
+            raise
+    upload.sha256, upload.size = h.hexdigest(), size
+    return upload
+
+
+def is_workbook_archive(path: str) -> bool:
+    """xlsx — сам zip; архивом книг считаем zip без [Content_Types].xml в корне."""
+    if not zipfile.is_zipfile(path):
+        return False
+    with zipfile.ZipFile(path) as zf:
+        return "[Content_Types].xml" not in zf.namelist()
+
+
+def unpack_workbooks(archive_path: str) -> List[Tuple[str, Any]]:
+    """
+    Книги из zip-архива (/process/batch), каждая — во временный файл кусками, как spool_upload.
+    [(имя, SpooledUpload | (status, тело ошибки))]; папки и не-xlsx пропускаются.
+    file_size из заголовка zip не доверяем — лимит проверяется по распакованным байтам.
+    """
+    result = []
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(archive_path) as zf:
+        for info in zf.infolist():
+            name = info.filename
+            if info.is_dir() or not name.lower().endswith(".xlsx") or name.startswith("__MACOSX/"):
+                continue
+            h = hashlib.sha256()
+            size = 0
+            error = None
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx", dir=UPLOAD_DIR) as tmp:
+                upload = SpooledUpload(tmp.name, "", 0)
+                try:
+                    with zf.open(info) as src:
+                        while chunk := src.read(UPLOAD_CHUNK_BYTES):
+                            size += len(chunk)
+                            if size > MAX_UPLOAD_BYTES:
+                                error = (413, _upload_too_large_body())
+                                break
+                            h.update(chunk)
+                            tmp.write(chunk)
+                except zipfile.BadZipFile as e:
+                    error = (400, {"ok": False, "stage": "bad_archive", "message": f"Не удалось распаковать: {e}"})
+                except BaseException:
+                    tmp.close()
+                    upload.discard()
+                    raise
+            if error is not None:
+                upload.discard()
+                result.append((name, error))
+                continue
+            upload.sha256, upload.size = h.hexdigest(), size
+            result.append((name, upload))
+    return result
+
+
+def _upload_too_large_body(limit: Optional[int] = None) -> Dict[str, Any]:
+    limit = MAX_UPLOAD_BYTES if limit is None else limit
+    return {"ok": False, "stage": "upload_too_large", "message": f"Файл больше {limit // (1024 * 1024)} МБ."}
+
+
+def _upload_too_large_response(limit: Optional[int] = None):
+    return JSONResponse(status_code=413, content=_upload_too_large_body(limit))
+
+
+class UploadLimitMiddleware:
+    """413 по Content-Length ещё до приёма тела (multipart добавляет к файлу немного заголовков)."""
+    MULTIPART_OVERHEAD = 64 * 1024
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            limit = MAX_BATCH_BYTES if scope["path"] == "/process/batch" else MAX_UPLOAD_BYTES
+            length = dict(scope["headers"]).get(b"content-length")
+            if length and length.isdigit() and int(length) > limit + self.MULTIPART_OVERHEAD:
+                await _upload_too_large_response(limit)(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class _MappedFile(io.RawIOBase):
+    """Файловый объект поверх mmap: у mmap до Python 3.13 нет seekable(), а zipfile (openpyxl) его требует."""
+    def __init__(self, mm: mmap.mmap):
+        self._mm = mm
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._mm.tell()
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        self._mm.seek(pos, whence)
+        return self._mm.tell()
+
+    def readinto(self, b):
+        data = self._mm.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+@contextmanager
+def open_workbook(source):
+    """source — bytes или путь к файлу. Путь открывается один раз и отображается в память (mmap)."""
+    if isinstance(source, (bytes, bytearray)):
+        yield BytesIO(source)
+        return
+    with open(source, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # пустой файл или ФС без mmap — читаем как обычный файл
+            mm = None
+        if mm is None:
+            yield f
+            return
+        with mm:
+            yield _MappedFile(mm)
+
+
+def source_sha256(source) -> str:
+    if isinstance(source, (bytes, bytearray)):
+        return _sha256(source)
+    h = hashlib.sha256()
+    with open(source, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_BYTES):
+            h.update(chunk)
+    return h.hexdigest()
+
 REQUIRED_RULE_PARAMS = [
     "Direction_Type","Study_Days_Per_Week","Max_Lessons_Per_Day",
     "Min_Lessons_Per_Day","Lesson_Duration_Min","Semester_Weeks","Shift_Type",
@@ -211,26 +546,271 @@ def _rules_map(df_rules: pd.DataFrame) -> Dict[str, str]:
         mp[p] = ex
     return mp
 
-def logic_precheck_full(excel_bytes: bytes) -> List[Dict[str, Any]]:
-    xls = pd.ExcelFile(BytesIO(excel_bytes))
+# ==========================================
+# ПРАВИЛА СОСТАВЛЕНИЯ -> МАСКИ СЛОТОВ
+# ==========================================
+# Лист "Правила составления" и необязательный лист AVAILABILITY_SHEET компилируются
+# один раз за прогон (workbook_rules) в ScheduleRules: размеры сетки, лимиты пар,
+# смены, веса правил H*/S* и битовые маски разрешённых слотов по преподавателям,
+# группам и аудиториям. Этот же объект читают logic_precheck_full и оптимизатор.
+# Значения по умолчанию — прежние константы оптимизатора.
+DEFAULT_WEEKS = 16
+DEFAULT_DAYS_PER_WEEK = 5
+DEFAULT_MAX_PAIRS = 5
+DEFAULT_LESSON_MINUTES = 90
+SHIFT_SPLIT_PAIR = 4  # при двух сменах вторая начинается с 4-й пары
+# веса мягких правил, если в книге их нет (как в шаблоне); у H* вес HARD
+DEFAULT_RULE_WEIGHTS = {"S1": 5.0, "S2": 5.0, "S3": 4.0, "S4": 2.0}
+
+DAYS_NAMES = {1: "ПОНЕДЕЛЬНИК", 2: "ВТОРНИК", 3: "СРЕДА", 4: "ЧЕТВЕРГ", 5: "ПЯТНИЦА", 6: "СУББОТА", 7: "ВОСКРЕСЕНЬЕ"}
+DAYS_SHORT = {1: "ПН", 2: "ВТ", 3: "СР", 4: "ЧТ", 5: "ПТ", 6: "СБ", 7: "ВС"}
+
+AVAILABILITY_KINDS = {"преподаватель": "teacher", "группа": "group", "аудитория": "room"}
+AVAILABILITY_COLUMNS = ["Тип", "Название", "День", "Пары"]
+
+
+class ScheduleRules:
+    """
+    Скомпилированные правила книги. Маска — int, бит (день-1)*max_pairs + (пара-1);
+    в горячем цикле слот проверяется одним "&" с slot_bits[день][пара].
+    Сущность без запретов в masks не попадает и получает all_slots.
+    issues — ошибки разбора в формате logic_precheck_full.
+    """
+
+    def __init__(self, weeks=DEFAULT_WEEKS, days=DEFAULT_DAYS_PER_WEEK, max_pairs=DEFAULT_MAX_PAIRS,
+                 min_pairs=1, lesson_minutes=DEFAULT_LESSON_MINUTES, shifts=2, weights=None):
+        self.weeks = weeks
+        self.days = days
+        self.max_pairs = max_pairs
+        # Min_Lessons_Per_Day жадная расстановка не навязывает (проверка на каждом шаге — это
+        # перебор, а не маска): logic_precheck_full отсекает группы, которым минимум недостижим,
+        # а QualityEvaluator считает дни группы короче минимума (group_short_days, вес S3)
+        self.min_pairs = min_pairs
+        # первый ("красивый") проход _place_single_task оставляет одну пару в запасе
+        self.comfort_pairs = max(max_pairs - 1, min_pairs, 1)
+        self.lesson_minutes = lesson_minutes
+        self.shifts = shifts
+        self.shift_of_pair = {p: 1 if shifts == 1 or p < SHIFT_SPLIT_PAIR else 2 for p in range(1, max_pairs + 1)}
+        self.weights: Dict[str, Optional[float]] = {**DEFAULT_RULE_WEIGHTS, **(weights or {})}
+
+        self.slot_bits = {d: {p: 1 << ((d - 1) * max_pairs + p - 1) for p in range(1, max_pairs + 1)}
+                          for d in range(1, days + 1)}
+        self.all_slots = (1 << (days * max_pairs)) - 1
+        self.masks: Dict[str, Dict[str, int]] = {kind: {} for kind in AVAILABILITY_KINDS.values()}
+        # {(день, пара): {аудитории}} — в состоянии недели они сразу заняты (_empty_week_state)
+        self.room_blocks: Dict[Tuple[int, int], set] = {}
+        # (kind, название) -> первая строка листа недоступности: для сверки названий с книгой
+        self.forbidden_rows: Dict[Tuple[str, str], int] = {}
+        self.issues: List[Dict[str, Any]] = []
+
+    def forbid(self, kind: str, name: str, day: int, pairs) -> None:
+        bits = 0
+        for p in pairs:
+            bits |= self.slot_bits[day][p]
+            if kind == "room":
+                self.room_blocks.setdefault((day, p), set()).add(name)
+        self.masks[kind][name] = self.masks[kind].get(name, self.all_slots) & ~bits
+
+    def allowed(self, teacher: str, groups) -> int:
+        """Слоты, где доступны и преподаватель, и все группы задачи."""
+        allowed = self.masks["teacher"].get(teacher, self.all_slots)
+        group_masks = self.masks["group"]
+        for g in groups:
+            allowed &= group_masks.get(g, self.all_slots)
+        return allowed
+
+    def slot_count(self, kind: str, name: str) -> int:
+        return self.masks[kind].get(name, self.all_slots).bit_count()
+
+    def weight(self, code: str) -> Optional[float]:
+        """Вес мягкого правила; None — правило жёсткое (HARD) или неизвестно."""
+        return self.weights.get(code)
+
+    def slot_penalty(self, base: int, code: str) -> int:
+        """Штраф слота, пересчитанный на вес правила из книги (при весе по умолчанию — base)."""
+        weight = self.weight(code)
+        if weight is None:
+            return base
+        return round(base * weight / DEFAULT_RULE_WEIGHTS[code])
+
+
+def _rule_issue(column, code, message, evidence="", sheet="Правила составления", excel_row=None):
+    return {"sheet": sheet, "excel_row": excel_row, "column": column, "code": code,
+            "message": message, "evidence": evidence}
+
+
+def _rule_weights(df_rules, params: Dict[str, str]) -> Dict[str, Optional[float]]:
+    """
+    Коды H*/S* стоят в колонке "Параметр" (вес — в "Пример"), как в шаблоне,
+    или в отдельных колонках "Код" / "Вес штрафа". HARD -> None; SOFT/пусто — вес по умолчанию.
+    """
+    raw = {p: v for p, v in params.items() if re.fullmatch(r"[HS]\d+", p)}
+    if df_rules is not None and {"Код", "Вес штрафа"} <= set(df_rules.columns):
+        for _, r in df_rules.iterrows():
+            code = _norm_str(r.get("Код"))
+            if re.fullmatch(r"[HS]\d+", code):
+                raw[code] = _norm_str(r.get("Вес штрафа"))
+
+    weights: Dict[str, Optional[float]] = {}
+    for code, value in raw.items():
+        weight = _to_float(value)
+        if value.upper() == "HARD" or (weight is None and code.startswith("H")):
+            weights[code] = None
+        elif weight is not None:
+            weights[code] = weight
+    return weights
+
+
+def _parse_shifts(value: Optional[str]) -> Optional[int]:
+    """ "1 смена" -> 1, "2 смены" -> 2; пример из шаблона ("1 смена / 2 смены") и прочее — None."""
+    numbers = set(re.findall(r"\d+", value or ""))
+    if numbers == {"1"}:
+        return 1
+    if numbers == {"2"}:
+        return 2
+    return None
+
+
+def _parse_day(value) -> Optional[int]:
+    day = _to_int(value)
+    if day is not None:
+        return day
+    text = _norm_str(value).upper()
+    for d, name in DAYS_NAMES.items():
+        if text and text in (name, DAYS_SHORT[d]):
+            return d
+    return None
+
+
+def _parse_pairs(value, max_pairs: int) -> Optional[List[int]]:
+    """Пусто — весь день; "3", "1-3", "1, 2, 5", "1-2; 5". Неразборчиво — None."""
+    text = _norm_str(value)
+    if not text:
+        return list(range(1, max_pairs + 1))
+    if re.fullmatch(r"\d+(\.0+)?", text):
+        return [int(float(text))]
+    pairs = []
+    for part in re.split(r"[,;\s]+", text):
+        if not part:
+            continue
+        lo, sep, hi = part.partition("-")
+        if not lo.isdigit() or (sep and not hi.isdigit()):
+            return None
+        pairs.extend(range(int(lo), int(hi if sep else lo) + 1))
+    return pairs
+
+
+def _compile_availability(rules: ScheduleRules, df) -> None:
+    missing = [c for c in AVAILABILITY_COLUMNS if c not in df.columns]
+    if missing:
+        rules.issues.append(_rule_issue(
+            missing[0], "MISSING_COLUMN", f"На листе '{AVAILABILITY_SHEET}' нет колонок: {', '.join(missing)}.",
+            sheet=AVAILABILITY_SHEET))
+        return
+
+    for i, r in df.iterrows():
+        excel_row = i + 2
+        kind_text, name = _norm_str(r.get("Тип")), _norm_str(r.get("Название"))
+        if not kind_text and not name:
+            continue
+        kind = AVAILABILITY_KINDS.get(kind_text.lower())
+        if kind is None or not name:
+            rules.issues.append(_rule_issue(
+                "Тип" if kind is None else "Название", "AVAILABILITY_INVALID",
+                f"Строка недоступности: тип должен быть одним из {', '.join(AVAILABILITY_KINDS)}, название — непустым.",
+                f"тип={kind_text}, название={name}", AVAILABILITY_SHEET, excel_row))
+            continue
+        day = _parse_day(r.get("День"))
+        if day is None or not 1 <= day <= rules.days:
+            rules.issues.append(_rule_issue(
+                "День", "AVAILABILITY_INVALID",
+                f"Некорректный день '{r.get('День')}': ожидается 1..{rules.days} или название дня.",
+                f"{kind_text}={name}", AVAILABILITY_SHEET, excel_row))
+            continue
+        pairs = _parse_pairs(r.get("Пары"), rules.max_pairs)
+        if pairs is None or any(not 1 <= p <= rules.max_pairs for p in pairs):
+            rules.issues.append(_rule_issue(
+                "Пары", "AVAILABILITY_INVALID",
+                f"Некорректные пары '{r.get('Пары')}': ожидаются номера 1..{rules.max_pairs} (например, 1-3 или 1,4).",
+                f"{kind_text}={name}", AVAILABILITY_SHEET, excel_row))
+            continue
+        rules.forbidden_rows.setdefault((kind, name), excel_row)
+        rules.forbid(kind, name, day, pairs)
+
+
+def compile_rules(df_rules: Optional[pd.DataFrame], df_availability: Optional[pd.DataFrame] = None) -> ScheduleRules:
+    """Правила книги -> ScheduleRules. Неверные значения параметров заменяются значениями по умолчанию
+    и попадают в issues; неразборчивый Shift_Type (пример из шаблона) — просто значение по умолчанию."""
+    params = _rules_map(df_rules)
+    issues = []
+
+    def param(name, default, lo, hi):
+        raw = params.get(name)
+        value = _to_int(raw)
+        if value is None:
+            return default
+        if not lo <= value <= hi:
+            issues.append(_rule_issue("Пример", "RULE_VALUE_INVALID",
+                                      f"Параметр '{name}'={raw} вне диапазона {lo}..{hi}; взято {default}.",
+                                      f"{name}={raw}"))
+            return default
+        return value
+
+    days = param("Study_Days_Per_Week", DEFAULT_DAYS_PER_WEEK, 1, 7)
+    max_pairs = param("Max_Lessons_Per_Day", DEFAULT_MAX_PAIRS, 1, 10)
+    min_pairs = param("Min_Lessons_Per_Day", 1, 1, 10)
+    if min_pairs > max_pairs:
+        issues.append(_rule_issue("Пример", "RULE_VALUE_INVALID",
+                                  f"Min_Lessons_Per_Day={min_pairs} больше Max_Lessons_Per_Day={max_pairs}.",
+                                  f"min={min_pairs}, max={max_pairs}"))
+        min_pairs = max_pairs
+
+    rules = ScheduleRules(
+        weeks=param("Semester_Weeks", DEFAULT_WEEKS, 1, 60),
+        days=days,
+        max_pairs=max_pairs,
+        min_pairs=min_pairs,
+        lesson_minutes=param("Lesson_Duration_Min", DEFAULT_LESSON_MINUTES, 1, 600),
+        shifts=_parse_shifts(params.get("Shift_Type")) or 2,
+        weights=_rule_weights(df_rules, params),
+    )
+    rules.issues.extend(issues)
+    if df_availability is not None and not df_availability.empty:
+        _compile_availability(rules, df_availability)
+    return rules
+
+
+def workbook_rules(sheets: Dict[str, pd.DataFrame]) -> ScheduleRules:
+    """Одна компиляция правил на книгу: результат передаётся и в проверку, и в генерацию."""
+    return compile_rules(sheets.get("Правила составления"), sheets.get(AVAILABILITY_SHEET))
 
-    df_rup   = pd.read_excel(xls, sheet_name="РУП")
-    df_load  = pd.read_excel(xls, sheet_name="Нагруженность преподователей")
-    df_groups= pd.read_excel(xls, sheet_name="Группы и направления")
-    df_rooms = pd.read_excel(xls, sheet_name="Аудитории")
-    df_rules = pd.read_excel(xls, sheet_name="Правила составления")
 
-    errors: List[Dict[str, Any]] = []
+def logic_precheck_full(source, sheets: Optional[Dict[str, pd.DataFrame]] = None,
+                        rules: Optional[ScheduleRules] = None) -> List[Dict[str, Any]]:
+    """
+    source — bytes или путь к книге.
+    sheets — уже разобранные листы (read_workbook_sheets), чтобы не читать файл второй раз.
+    rules — уже скомпилированные правила (workbook_rules); те же получит оптимизатор.
+    """
+    if sheets is None:
+        sheets = read_workbook_sheets(source)
+
+    df_rup   = sheets["РУП"]
+    df_load  = sheets["Нагруженность преподователей"]
+    df_groups= sheets["Группы и направления"]
+    df_rooms = sheets["Аудитории"]
 
     # ----------------------------
-    # 0) Настройки из "Правила составления"
+    # 0) Настройки из "Правила составления" (+ лист недоступности)
     # ----------------------------
-    rules = _rules_map(df_rules)
+    if rules is None:
+        rules = workbook_rules(sheets)
+    errors: List[Dict[str, Any]] = list(rules.issues)
 
-    WEEKS = _to_int(rules.get("Semester_Weeks")) or 16
-    DAYS_PER_WEEK = _to_int(rules.get("Study_Days_Per_Week")) or 5
-    MAX_LESSONS_PER_DAY = _to_int(rules.get("Max_Lessons_Per_Day")) or 5
-    LESSON_MIN = _to_int(rules.get("Lesson_Duration_Min")) or 90
+    WEEKS = rules.weeks
+    DAYS_PER_WEEK = rules.days
+    MAX_LESSONS_PER_DAY = rules.max_pairs
+    LESSON_MIN = rules.lesson_minutes
 
     # Переводим "кол-во часов" в пары.
     # Предположение: "количество часов" в Excel = АСТРОНОМИЧЕСКИЕ минуты? Нет.
@@ -377,8 +957,11 @@ def logic_precheck_full(excel_bytes: bytes) -> List[Dict[str, Any]]:
     # ----------------------------
     # 4) Проверка: "физически не влезает по слотам" (группа)
     # ----------------------------
+    # слотов — по маске группы: SLOTS_PER_WEEK минус строки листа недоступности
     for grp, pairs_w in weekly_pairs_by_group.items():
-        if pairs_w > SLOTS_PER_WEEK:
+        slots = rules.slot_count("group", grp)
+        if pairs_w > slots:
+            unavailable = f", из них недоступно {SLOTS_PER_WEEK - slots}" if slots < SLOTS_PER_WEEK else ""
             errors.append({
                 "sheet": "Нагруженность преподователей",
                 "excel_row": None,
@@ -386,19 +969,20 @@ def logic_precheck_full(excel_bytes: bytes) -> List[Dict[str, Any]]:
                 "code": "GROUP_OVERLOAD_WEEKLY",
                 "message": (
                     f"Группа '{grp}' (текущий семестр={group_current_sem.get(grp)}) требует "
-                    f"≈{pairs_w} пар/нед, но максимум слотов {SLOTS_PER_WEEK} "
-                    f"({DAYS_PER_WEEK} дней × {MAX_LESSONS_PER_DAY} пар). Расписание невозможно."
+                    f"≈{pairs_w} пар/нед, но максимум слотов {slots} "
+                    f"({DAYS_PER_WEEK} дней × {MAX_LESSONS_PER_DAY} пар{unavailable}). Расписание невозможно."
                 ),
-                "evidence": f"группа={grp}, pairs_per_week≈{pairs_w}, max={SLOTS_PER_WEEK}"
+                "evidence": f"группа={grp}, pairs_per_week≈{pairs_w}, max={slots}"
             })
 
     # ----------------------------
     # 5) (Опционально) Проверка: перегрузка преподавателя по слотам (упрощённо)
     # ----------------------------
-    # Это грубая логика: у преподавателя максимум те же SLOTS_PER_WEEK (если он работает 5x5).
+    # Это грубая логика: у преподавателя максимум те же SLOTS_PER_WEEK за вычетом его недоступности.
     # Если у вас есть отдельные нормы/ставки — вынесите в правила.
     for t, pairs_w in weekly_pairs_by_teacher.items():
-        if pairs_w > SLOTS_PER_WEEK:
+        slots = rules.slot_count("teacher", t)
+        if pairs_w > slots:
             errors.append({
                 "sheet": "Нагруженность преподователей",
                 "excel_row": None,
@@ -406,11 +990,45 @@ def logic_precheck_full(excel_bytes: bytes) -> List[Dict[str, Any]]:
                 "code": "TEACHER_OVERLOAD_WEEKLY",
                 "message": (
                     f"Преподаватель '{t}' в текущих семестрах групп требует ≈{pairs_w} пар/нед, "
-                    f"что больше максимума {SLOTS_PER_WEEK}. Проверьте нагрузку/ставки."
+                    f"что больше максимума {slots}. Проверьте нагрузку/ставки."
+                ),
+                "evidence": f"teacher={t}, pairs_per_week≈{pairs_w}, max={slots}"
+            })
+
+    # ----------------------------
+    # 6) Min_Lessons_Per_Day: у группы меньше пар в неделю, чем минимум на один день
+    # ----------------------------
+    # любой учебный день такой группы окажется короче минимума
+    for grp, pairs_w in weekly_pairs_by_group.items():
+        if 0 < pairs_w < rules.min_pairs:
+            errors.append({
+                "sheet": "Нагруженность преподователей",
+                "excel_row": None,
+                "column": None,
+                "code": "GROUP_UNDERLOAD_DAILY",
+                "message": (
+                    f"Группа '{grp}' (текущий семестр={group_current_sem.get(grp)}) требует ≈{pairs_w} пар/нед, "
+                    f"меньше Min_Lessons_Per_Day={rules.min_pairs}: минимум пар в день недостижим."
                 ),
-                "evidence": f"teacher={t}, pairs_per_week≈{pairs_w}, max={SLOTS_PER_WEEK}"
+                "evidence": f"группа={grp}, pairs_per_week≈{pairs_w}, min_per_day={rules.min_pairs}"
             })
 
+    # ----------------------------
+    # 7) Лист недоступности: названия должны быть в книге (опечатка = запрет молча не работает)
+    # ----------------------------
+    known = {
+        "group": set(group_current_sem),
+        "teacher": {_norm_str(t) for t in df_load["ФИО преподавателя"]},
+        "room": ({_norm_str(r) for r in df_rooms["Аудитория"]} if "Аудитория" in df_rooms.columns else set()),
+    }
+    kind_names = {kind: text for text, kind in AVAILABILITY_KINDS.items()}
+    for (kind, name), excel_row in rules.forbidden_rows.items():
+        if name not in known[kind]:
+            errors.append(_rule_issue(
+                "Название", "AVAILABILITY_UNKNOWN",
+                f"На листе '{AVAILABILITY_SHEET}' указан(а) {kind_names[kind]} '{name}', которого нет в книге.",
+                f"{kind_names[kind]}={name}", AVAILABILITY_SHEET, excel_row))
+
     return errors
 def local_precheck(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
     errors = []
@@ -484,19 +1102,22 @@ H* должны быть HARD, S* должны быть SOFT/или пустой
 """
 
 
-def ai_validate_excel(excel_bytes: bytes) -> Dict[str, Any]:
-    file_hash = _sha256(excel_bytes)
+def ai_validate_excel(source, file_hash: Optional[str] = None) -> Dict[str, Any]:
+    """source — bytes или путь; file_hash — если уже посчитан при загрузке."""
+    file_hash = file_hash or source_sha256(source)
 
     # кэш (если один и тот же файл гоняете несколько раз)
     cached = _AI_CACHE.get(file_hash)
     if cached and (time.time() - cached["ts"] < _AI_CACHE_TTL_SEC):
+        AI_CACHE_LOOKUPS.inc("hit")
         return cached["report"]
 
-    payload = build_payload(excel_bytes)
+    payload = build_payload(source)
 
     # локальные ошибки — сразу возвращаем без оплаты
     local_errors = local_precheck(payload)
     if local_errors:
+        AI_CACHE_LOOKUPS.inc("local")
         report = {
             "summary": {"errors": len(local_errors), "warnings": 0, "notes": 0},
             "errors": local_errors,
@@ -507,7 +1128,8 @@ def ai_validate_excel(excel_bytes: bytes) -> Dict[str, Any]:
         _AI_CACHE[file_hash] = {"ts": time.time(), "report": report}
         return report
 
-    resp = client.responses.create(
+    AI_CACHE_LOOKUPS.inc("miss")
+    resp = openai_client().responses.create(
         model="gpt-4.1-mini",
         input=[
             {"role": "system", "content": SYSTEM_PROMPT},
@@ -529,22 +1151,218 @@ def ai_validate_excel(excel_bytes: bytes) -> Dict[str, Any]:
     return report
 
 
+class GenerationCancelled(Exception):
+    pass
+
+
+# Штрафы слота (calculate_slot_score) — их же считает QualityEvaluator по готовому расписанию
+PENALTY_WINDOW = 100       # у группы появляется окно
+PENALTY_EDGE = 5           # первая или последняя пара
+BONUS_ADJACENT = -50       # пара впритык к другой паре группы
+BONUS_FIRST_OF_DAY = -10   # первая пара группы за день — на 2-й или 3-й паре
+
+
+def is_sport_subject(subject: str) -> bool:
+    subj_lower = subject.lower()
+    return any(x in subj_lower for x in ['физическ', 'физк', 'спорт', 'нвп'])
+
+
+def week_components(tasks, room_candidates=None) -> List[List[int]]:
+    """
+    Связные компоненты задач недели (union-find): задачи связаны общей группой,
+    общим преподавателем или аудиторией, которую обе могут занять.
+    room_candidates(task) -> (ключ, аудитории) — аудитории задачи, кроме общих
+    (ScheduleOptimizer.shared_rooms: спортзал); у задач с одинаковым ключом набор
+    одинаковый и склеивается один раз. Компоненты не делят ни групп, ни преподавателей,
+    ни аудиторий, кроме общих, поэтому решаются независимо; общие аудитории
+    согласуются при слиянии — ScheduleOptimizer._merge_components.
+    Порядок компонент и задач внутри — по первому появлению в tasks (детерминированно).
+    """
+    parent: Dict[Tuple[str, Any], Tuple[str, Any]] = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(root, x):
+        other = find(x)
+        if other != root:
+            parent[other] = root
+
+    for task in tasks:
+        root = find(("teacher", task['teacher']))
+        for g in task['groups']:
+            union(root, ("group", g))
+        if room_candidates is not None:
+            key, rooms = room_candidates(task)
+            if not rooms:
+                continue
+            node = ("rooms", key)
+            if node not in parent:
+                node_root = find(node)
+                for r in rooms:
+                    union(node_root, ("room", r))
+            union(root, node)
+
+    components: Dict[Tuple[str, Any], List[int]] = {}
+    for i, task in enumerate(tasks):
+        components.setdefault(find(("teacher", task['teacher'])), []).append(i)
+    return list(components.values())
+
+
+# >1 — неделя делится на независимые компоненты, которые решаются в отдельных процессах
+# (fork: оптимизатор с таблицами наследуется без сериализации). Время растёт с размером
+# самой большой компоненты, а не всего колледжа. Аудитории — тоже связь: компоненты делят
+# только общие (спортзал), их согласует слияние. Подбор аудитории — по вместимости, поэтому
+# обычные занятия почти всегда попадают в одну компоненту, и разбиение выигрывает лишь
+# на частях недели, которым нужны только общие аудитории. Одна компонента — тот же
+# сквозной проход, что и при 1. Настройка входит в версию кэша.
+# 1 — без разбиения. Генерация уже идёт в воркере CPU-пула: вложенный параллелизм — по настройке.
+COMPONENT_WORKERS = int(os.getenv("SCHEDULE_COMPONENT_WORKERS", "1"))
+
+_COMPONENT_OPTIMIZER: Optional["ScheduleOptimizer"] = None
+
+
+def _solve_component_in_worker(week_num, tasks, reserved):
+    return _COMPONENT_OPTIMIZER._solve_component(week_num, tasks, reserved)
+
+
+# Общий реестр занятости преподавателей и аудиторий между семестрами:
+#   term — общий у семестров одной чётности (1, 3, 5… идут одновременно осенью, 2, 4, 6… — весной);
+#   all  — один на все семестры книги;  off — семестры независимы (как раньше).
+LEDGER_SCOPE = os.getenv("SCHEDULE_LEDGER_SCOPE", "term")
+LEDGER_RETRIES = 3
+# >1 — семестры генерируются параллельно в отдельных процессах (бронирование — через реестр)
+SEMESTER_WORKERS = int(os.getenv("SCHEDULE_SEMESTER_WORKERS", "1"))
+
+
+def ledger_term(semester) -> int:
+    return int(semester) % 2 if LEDGER_SCOPE == "term" else 0
+
+
+class ResourceLedger:
+    """
+    Занятость (преподаватель | аудитория) × (term, неделя, день, пара) — байт на ячейку
+    в общей памяти (RawArray). Воркеры семестров получают реестр при fork.
+    Чтение — без замка (снимок для посева недели), бронирование — claim под замком:
+    всё или ничего, при конфликте возвращается список занятых ресурсов.
+    """
+
+    def __init__(self, teachers, rooms, terms, weeks, days, pairs):
+        names = [("teacher", t) for t in sorted(teachers)] + [("room", r) for r in sorted(rooms)]
+        self.index = {key: i for i, key in enumerate(names)}
+        self.names = names
+        self.weeks, self.days, self.pairs = weeks, days, pairs
+        self.cells = multiprocessing.RawArray("B", terms * weeks * days * pairs * len(names))
+        self.lock = multiprocessing.Lock()
+
+    def _base(self, term, week, day, pair):
+        return (((term * self.weeks + week - 1) * self.days + day - 1) * self.pairs + pair - 1) * len(self.names)
+
+    def reserved(self, term, week):
+        """({(day, pair): {преподаватели}}, {(day, pair): {аудитории}}) — уже забронированное."""
+        teachers, rooms = {}, {}
+        for day in range(1, self.days + 1):
+            for pair in range(1, self.pairs + 1):
+                base = self._base(term, week, day, pair)
+                row = self.cells[base:base + len(self.names)]
+                for i, taken in enumerate(row):
+                    if taken:
+                        kind, name = self.names[i]
+                        (teachers if kind == "teacher" else rooms).setdefault((day, pair), set()).add(name)
+        return teachers, rooms
+
+    def _cells(self, term, week, placement):
+        day, pair, teacher, room = placement
+        base = self._base(term, week, day, pair)
+        return [base + self.index[key] for key in (("teacher", teacher), ("room", room)) if key in self.index]
+
+    def claim(self, term, week, placements):
+        """placements — [(day, pair, teacher, room)]. Пусто — забронировано; иначе — конфликты."""
+        cells = {c for placement in placements for c in self._cells(term, week, placement)}
+        with self.lock:
+            conflicts = [self.names[c % len(self.names)] for c in cells if self.cells[c]]
+            if not conflicts:
+                for c in cells:
+                    self.cells[c] = 1
+        return conflicts
+
+    def claim_free(self, term, week, placements):
+        """Бронирует занятия, у которых свободны и преподаватель, и аудитория; возвращает отклонённые."""
+        placement_cells = [(placement, self._cells(term, week, placement)) for placement in placements]
+        rejected = []
+        with self.lock:
+            for placement, cells in placement_cells:
+                if any(self.cells[c] for c in cells):
+                    rejected.append(placement)
+                else:
+                    for c in cells:
+                        self.cells[c] = 1
+        return rejected
+
+
+def _week_placements(schedule):
+    placements = set()
+    for day, pairs in schedule.items():
+        for pair, slots in pairs.items():
+            for lesson in slots.values():
+                placements.add((day, pair, lesson['teacher'], lesson['room']))
+    return sorted(placements)
+
+
 class ScheduleOptimizer:
-    def __init__(self, rup_df, teachers_df, groups_df, rooms_df, rules_df):
+    # Счётчики горячего пути (на неделю; сумма за семестр — semester_counters)
+    COUNTERS = (
+        "tasks",              # задач после объединения в потоки
+        "room_lookups",       # вызовов get_suitable_room
+        "day_full",           # день отброшен: у группы уже лимит пар
+        "teacher_conflicts",  # слот отброшен: преподаватель занят
+        "group_conflicts",    # слот отброшен: группа занята
+        "slot_unavailable",   # слот отброшен: запрещён маской (лист недоступности)
+        "room_conflicts",     # слот отброшен: нет подходящей свободной аудитории
+        "desperate_passes",   # задача не встала "красиво" и ушла в Desperate Mode
+        "forced",             # поставлена в Desperate Mode
+        "flow_splits",        # поток не встал целиком и разбит на группы
+        "unplaced",           # не поставлено совсем (после разбиения потока — по группам)
+        "components",         # независимых компонент (группы + преподаватели) в неделе
+        "merge_repairs",      # при слиянии компонент аудитория оказалась занята другой компонентой
+        "ledger_retries",     # неделя перерешана: параллельный семестр успел занять ресурс (ResourceLedger)
+        "ledger_repairs",     # после попыток: занятие отклонено реестром и переставлено (или снято)
+    )
+
+    def __init__(self, rup_df, teachers_df, groups_df, rooms_df, rules_df, rules: Optional[ScheduleRules] = None):
         self.rup = rup_df
         self.teachers = teachers_df
         self.groups = groups_df
         self.rooms = rooms_df
-        
-        # Константы
-        self.WEEKS = 16
-        self.DAYS_PER_WEEK = 5
-        self.MAX_PAIRS = 5
-        self.PAIR_DURATION = 1.5 
+
+        # Константы — из скомпилированных правил (rules: одни на все семестры книги, см. workbook_rules)
+        self.rules = rules if rules is not None else compile_rules(rules_df)
+        self.WEEKS = self.rules.weeks
+        self.DAYS_PER_WEEK = self.rules.days
+        self.MAX_PAIRS = self.rules.max_pairs
+        self.PAIR_DURATION = self.rules.lesson_minutes / 60
+        # штрафы за окна и бонус за соседство — с весом S1 ("окна у групп") из книги
+        self.penalty_window = self.rules.slot_penalty(PENALTY_WINDOW, "S1")
+        self.bonus_adjacent = self.rules.slot_penalty(BONUS_ADJACENT, "S1")
         
         # Кэш размеров групп
         self.group_sizes = {}
         self._cache_group_sizes()
+        self.room_list = self._room_list()
+        # общие аудитории не связывают компоненты недели (week_components) — их делит слияние
+        self.shared_rooms = {name for name, _capacity, is_gym in self.room_list if is_gym}
+        self._room_candidates_cache = {}
+
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.week_counters = {}
+
+        # общий с другими семестрами реестр (generate_schedule_from_excel); None — сам по себе
+        self.ledger = None
+        self.ledger_term = 0
 
     def _cache_group_sizes(self):
         if not self.groups.empty and 'Группа' in self.groups.columns:
@@ -556,6 +1374,19 @@ class ScheduleOptimizer:
     def get_group_size(self, group_name):
         return self.group_sizes.get(group_name, 25)
 
+    def _room_list(self):
+        """(аудитория, вместимость, спортзал?) — разбираем лист один раз, а не на каждый подбор аудитории."""
+        rooms = []
+        for _, room in self.rooms.iterrows():
+            r_name = str(room['Аудитория']).strip()
+            try: r_capacity = int(room['Вместимость'])
+            except: r_capacity = 30
+
+            r_type = str(room['Назначение']) if pd.notna(room['Назначение']) else "Общая"
+            is_gym_room = 'спорт' in r_name.lower() or 'физра' in str(r_type).lower()
+            rooms.append((r_name, r_capacity, is_gym_room))
+        return rooms
+
     def calculate_weekly_needs(self, week_num):
         needs = []
         
@@ -582,8 +1413,7 @@ class ScheduleOptimizer:
             
             if pairs_this_week == 0: continue
 
-            subj_lower = subject.lower()
-            is_sport = any(x in subj_lower for x in ['физическ', 'физк', 'спорт', 'нвп'])
+            is_sport = is_sport_subject(subject)
 
             needs.append({
                 'group': group,
@@ -599,17 +1429,11 @@ class ScheduleOptimizer:
         """
         tolerance: сколько человек может "стоять", если не влезают сидя.
         """
+        self.counters["room_lookups"] += 1
         candidates = []
-        for _, room in self.rooms.iterrows():
-            r_name = str(room['Аудитория']).strip()
+        for r_name, r_capacity, is_gym_room in self.room_list:
             if r_name in occupied_rooms: continue
 
-            try: r_capacity = int(room['Вместимость'])
-            except: r_capacity = 30
-            
-            r_type = str(room['Назначение']) if pd.notna(room['Назначение']) else "Общая"
-            is_gym_room = 'спорт' in r_name.lower() or 'физра' in str(r_type).lower()
-
             if is_sport:
                 if is_gym_room: return r_name 
                 continue 
@@ -625,6 +1449,18 @@ class ScheduleOptimizer:
         candidates.sort(key=lambda x: x[1])
         return candidates[0][0] if candidates else None
 
+    def room_candidates(self, task):
+        """(ключ, аудитории), которые задача может занять в любом проходе (допуск 8), без shared_rooms."""
+        key = (sum(self.get_group_size(g) for g in task['groups']), task['is_sport'])
+        rooms = self._room_candidates_cache.get(key)
+        if rooms is None:
+            students, is_sport = key
+            rooms = self._room_candidates_cache[key] = tuple(
+                name for name, capacity, is_gym in self.room_list
+                if name not in self.shared_rooms and is_gym == is_sport and capacity + 8 >= students
+            )
+        return key, rooms
+
     def _group_into_flows(self, needs):
         grouped = {}
         for item in needs:
@@ -667,10 +1503,6 @@ class ScheduleOptimizer:
         return tasks
 
     def calculate_slot_score(self, day, pair, groups, schedule_map):
-        PENALTY_WINDOW = 100
-        PENALTY_EDGE = 5
-        BONUS_ADJACENT = -50
-        
         score = 0
         if pair == 1 or pair == self.MAX_PAIRS: score += PENALTY_EDGE
 
@@ -680,7 +1512,7 @@ class ScheduleOptimizer:
         for grp in groups:
             grp_sched = schedule_map[day].get(grp, {})
             if not grp_sched:
-                if pair in [2, 3]: score -= 10
+                if pair in [2, 3]: score += BONUS_FIRST_OF_DAY
                 continue
             
             is_adjacent = (pair - 1 in grp_sched) or (pair + 1 in grp_sched)
@@ -692,8 +1524,8 @@ class ScheduleOptimizer:
             if span > len(occupied_pairs):
                 creates_window = True
         
-        if creates_window: score += PENALTY_WINDOW
-        if has_any_adjacent: score += BONUS_ADJACENT
+        if creates_window: score += self.penalty_window
+        if has_any_adjacent: score += self.bonus_adjacent
             
         return score
 
@@ -702,26 +1534,42 @@ class ScheduleOptimizer:
         Двухэтапная попытка размещения
         """
         total_students = sum([self.get_group_size(g) for g in task_groups])
-        
+        counters = self.counters
+        rules = self.rules
+        # маска слотов, где доступны преподаватель и все группы, — одна на задачу
+        allowed = rules.allowed(teacher, task_groups)
+
         # --- ПРОХОД 1: "Красивый" (Строгие правила) ---
         best_slot = None
         min_score = float('inf')
 
         for day in range(1, self.DAYS_PER_WEEK + 1):
-            # Строгий лимит пар (макс 4)
-            if len(group_schedule_map[day].get(task_groups[0], {})) >= 4: continue
+            # Строгий лимит пар (Max_Lessons_Per_Day - 1, по умолчанию 4)
+            if len(group_schedule_map[day].get(task_groups[0], {})) >= rules.comfort_pairs:
+                counters["day_full"] += 1
+                continue
 
+            day_bits = rules.slot_bits[day]
             for pair in range(1, self.MAX_PAIRS + 1):
-                if teacher in teacher_busy[day][pair]: continue
+                if not allowed & day_bits[pair]:
+                    counters["slot_unavailable"] += 1
+                    continue
+                if teacher in teacher_busy[day][pair]:
+                    counters["teacher_conflicts"] += 1
+                    continue
                 
                 groups_busy = False
                 for g in task_groups:
                     if g in schedule[day][pair]: groups_busy = True; break
-                if groups_busy: continue
+                if groups_busy:
+                    counters["group_conflicts"] += 1
+                    continue
                 
                 # Строгая вместимость (tolerance=0)
                 suitable_room = self.get_suitable_room(total_students, is_sport, room_busy[day][pair], tolerance=0)
-                if not suitable_room: continue
+                if not suitable_room:
+                    counters["room_conflicts"] += 1
+                    continue
 
                 score = self.calculate_slot_score(day, pair, task_groups, group_schedule_map)
                 if score < min_score:
@@ -734,21 +1582,33 @@ class ScheduleOptimizer:
 
         # --- ПРОХОД 2: "Силовой" (Desperate Mode) ---
         # Если не вышло красиво, разрешаем:
-        # 1. 5 пар в день
+        # 1. Max_Lessons_Per_Day пар в день
         # 2. Переполнение аудитории на 8 человек
         # 3. Любое окно (игнорируем score)
+        # Маска доступности — жёсткое правило, её не ослабляем.
+        counters["desperate_passes"] += 1
         
         for day in range(1, self.DAYS_PER_WEEK + 1):
-            # Relaxed limit: разрешаем 5 пар, если очень надо
-            if len(group_schedule_map[day].get(task_groups[0], {})) >= 5: continue
+            # Relaxed limit: разрешаем Max_Lessons_Per_Day пар, если очень надо
+            if len(group_schedule_map[day].get(task_groups[0], {})) >= rules.max_pairs:
+                counters["day_full"] += 1
+                continue
 
+            day_bits = rules.slot_bits[day]
             for pair in range(1, self.MAX_PAIRS + 1):
-                if teacher in teacher_busy[day][pair]: continue
+                if not allowed & day_bits[pair]:
+                    counters["slot_unavailable"] += 1
+                    continue
+                if teacher in teacher_busy[day][pair]:
+                    counters["teacher_conflicts"] += 1
+                    continue
                 
                 groups_busy = False
                 for g in task_groups:
                     if g in schedule[day][pair]: groups_busy = True; break
-                if groups_busy: continue
+                if groups_busy:
+                    counters["group_conflicts"] += 1
+                    continue
                 
                 # RELAXED вместимость (tolerance=8)
                 suitable_room = self.get_suitable_room(total_students, is_sport, room_busy[day][pair], tolerance=8)
@@ -757,7 +1617,9 @@ class ScheduleOptimizer:
                     # Сразу берем первое попавшееся (Greedy)
                     best_slot = (day, pair, suitable_room)
                     self._commit_slot(best_slot, task_groups, subject, teacher, schedule, teacher_busy, room_busy, group_schedule_map)
+                    counters["forced"] += 1
                     return True, "Forced"
+                counters["room_conflicts"] += 1
 
         return False, "No Room/Time"
 
@@ -776,54 +1638,244 @@ class ScheduleOptimizer:
         teacher_busy[day][pair].add(teacher)
         room_busy[day][pair].add(room)
 
-    def generate_week_schedule(self, week_num):
-        raw_needs = self.calculate_weekly_needs(week_num)
-        tasks = self._group_into_flows(raw_needs)
-        
+    def _empty_week_state(self, reserved=None):
+        """
+        (schedule, teacher_busy, room_busy, group_schedule_map) — в порядке аргументов _place_single_task.
+        reserved — снимок ResourceLedger.reserved: ресурсы, занятые другими семестрами, сразу заняты.
+        Так же сразу заняты аудитории из листа недоступности (rules.room_blocks).
+        """
         schedule = {d: {p: {} for p in range(1, self.MAX_PAIRS + 1)} for d in range(1, self.DAYS_PER_WEEK + 1)}
-        group_schedule_map = {d: {} for d in range(1, self.DAYS_PER_WEEK + 1)}
         teacher_busy = {d: {p: set() for p in range(1, self.MAX_PAIRS + 1)} for d in range(1, self.DAYS_PER_WEEK + 1)}
         room_busy = {d: {p: set() for p in range(1, self.MAX_PAIRS + 1)} for d in range(1, self.DAYS_PER_WEEK + 1)}
-        
+        group_schedule_map = {d: {} for d in range(1, self.DAYS_PER_WEEK + 1)}
+        if reserved is not None:
+            teachers, rooms = reserved
+            for (day, pair), names in teachers.items():
+                teacher_busy[day][pair].update(names)
+            for (day, pair), names in rooms.items():
+                room_busy[day][pair].update(names)
+        # недоступные аудитории — маска, развёрнутая в занятость: подбор аудитории не меняется
+        for (day, pair), names in self.rules.room_blocks.items():
+            room_busy[day][pair].update(names)
+        return schedule, teacher_busy, room_busy, group_schedule_map
+
+    def _schedule_task(self, task, week_num, state, unscheduled):
+        groups = task['groups']
+        subject = task['subject']
+        teacher = task['teacher']
+        is_sport = task['is_sport']
+
+        # 1. Пробуем поставить задачу (поток или соло)
+        success, msg = self._place_single_task(groups, subject, teacher, is_sport, *state)
+
+        # 2. Если это был ПОТОК и не вышло -> Разбиваем
+        if not success and task['is_flow']:
+            # print(f"DEBUG: Разбиваем поток {groups} ({msg})")
+            self.counters["flow_splits"] += 1
+            split_failed_groups = []
+            for single_group in groups:
+                sub_success, sub_msg = self._place_single_task([single_group], subject, teacher, is_sport, *state)
+                if not sub_success:
+                    split_failed_groups.append(single_group)
+
+            if split_failed_groups:
+                 self.counters["unplaced"] += len(split_failed_groups)
+                 unscheduled.append(f"Неделя {week_num} | {', '.join(split_failed_groups)}: {subject} (ERR: {sub_msg})")
+
+        elif not success:
+            self.counters["unplaced"] += 1
+            unscheduled.append(f"Неделя {week_num} | {', '.join(groups)}: {subject} ({teacher}) (ERR: {msg})")
+
+    def _solve_tasks(self, tasks, week_num, reserved=None):
+        state = self._empty_week_state(reserved)
         unscheduled = []
-
         for task in tasks:
-            groups = task['groups']
-            subject = task['subject']
-            teacher = task['teacher']
-            is_sport = task['is_sport']
-            
-            # 1. Пробуем поставить задачу (поток или соло)
-            success, msg = self._place_single_task(groups, subject, teacher, is_sport, schedule, teacher_busy, room_busy, group_schedule_map)
-
-            # 2. Если это был ПОТОК и не вышло -> Разбиваем
-            if not success and task['is_flow']:
-                # print(f"DEBUG: Разбиваем поток {groups} ({msg})")
-                split_failed_groups = []
-                for single_group in groups:
-                    sub_success, sub_msg = self._place_single_task([single_group], subject, teacher, is_sport, schedule, teacher_busy, room_busy, group_schedule_map)
-                    if not sub_success:
-                        split_failed_groups.append(single_group)
-                
-                if split_failed_groups:
-                     unscheduled.append(f"Неделя {week_num} | {', '.join(split_failed_groups)}: {subject} (ERR: {sub_msg})")
-            
-            elif not success:
-                unscheduled.append(f"Неделя {week_num} | {', '.join(groups)}: {subject} ({teacher}) (ERR: {msg})")
+            self._schedule_task(task, week_num, state, unscheduled)
+        return state[0], unscheduled
+
+    def _solve_component(self, week_num, tasks, reserved=None):
+        """Одна компонента недели со своими счётчиками (в воркере или по очереди в этом процессе)."""
+        outer = self.counters
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        try:
+            schedule, unscheduled = self._solve_tasks(tasks, week_num, reserved)
+            return schedule, unscheduled, self.counters
+        finally:
+            self.counters = outer
+
+    def _merge_components(self, week_num, results, reserved=None):
+        """
+        Слияние расписаний компонент в порядке компонент. Группы, преподаватели и
+        аудитории у них не пересекаются, кроме shared_rooms (спортзал): если общая
+        аудитория в слоте уже занята другой компонентой — берём другую подходящую
+        в том же слоте, а если её нет, занятие переставляется заново, когда все остальные
+        уже на местах.
+        """
+        state = self._empty_week_state(reserved)
+        schedule, teacher_busy, room_busy, group_schedule_map = state
+        unscheduled = []
+        displaced = []
+
+        for part_schedule, part_unscheduled, counters in results:
+            for name, n in counters.items():
+                self.counters[name] += n
+            unscheduled.extend(part_unscheduled)
+
+            for day, pairs in part_schedule.items():
+                for pair, slots in pairs.items():
+                    lessons = {}
+                    for g, lesson in slots.items():
+                        lessons.setdefault(lesson['teacher'], (lesson, []))[1].append(g)
+
+                    for teacher, (lesson, groups) in lessons.items():
+                        room = lesson['room']
+                        is_sport = is_sport_subject(lesson['subject'])
+                        if room in room_busy[day][pair]:
+                            self.counters["merge_repairs"] += 1
+                            total_students = sum(self.get_group_size(g) for g in groups)
+                            room = self.get_suitable_room(total_students, is_sport, room_busy[day][pair], tolerance=0)
+                            if room is None:
+                                displaced.append({'groups': groups, 'subject': lesson['subject'], 'teacher': teacher,
+                                                  'is_sport': is_sport, 'is_flow': len(groups) > 1})
+                                continue
+                        self._commit_slot((day, pair, room), groups, lesson['subject'], teacher, *state)
+
+        for task in displaced:
+            self._schedule_task(task, week_num, state, unscheduled)
+        return schedule, unscheduled
 
+    def generate_week_schedule(self, week_num, pool=None):
+        """
+        С реестром (self.ledger) — оптимистично: решаем неделю по снимку чужих броней и
+        бронируем всё разом; если параллельный семестр успел занять ресурс — перерешаем
+        по свежему снимку. Когда попытки кончились, неделя не перерешивается: под замком
+        бронируется только свободное (claim_free), а отклонённые занятия переставляются
+        вне замка (_repair_week) — замок держится лишь на время самой брони.
+        """
+        if self.ledger is None:
+            return self._generate_week(week_num, pool)
+
+        ledger, term = self.ledger, self.ledger_term
+        for retries in range(LEDGER_RETRIES):
+            schedule, unscheduled = self._generate_week(week_num, pool, ledger.reserved(term, week_num))
+            if not ledger.claim(term, week_num, _week_placements(schedule)):
+                self.counters["ledger_retries"] = retries
+                return schedule, unscheduled
+        self.counters["ledger_retries"] = LEDGER_RETRIES
+
+        placements, rounds = _week_placements(schedule), 0
+        while True:
+            rejected = ledger.claim_free(term, week_num, placements)
+            if not rejected:
+                return schedule, unscheduled
+            rounds += 1
+            # после LEDGER_RETRIES перестановок отклонённое снимается — неделя не держит чужое
+            schedule, placements = self._repair_week(week_num, schedule, set(rejected),
+                                                     ledger.reserved(term, week_num), unscheduled,
+                                                     place_again=rounds <= LEDGER_RETRIES)
+
+    def _repair_week(self, week_num, schedule, rejected, reserved, unscheduled, place_again=True):
+        """
+        Снимает из schedule занятия rejected ((day, pair, teacher, room), отклонены реестром) и ставит
+        их заново по снимку reserved (в нём уже и собственные брони недели). -> (schedule, новые занятия).
+        """
+        state = self._empty_week_state(reserved)
+        displaced = []
+        for day, pairs in schedule.items():
+            for pair, slots in pairs.items():
+                lessons = {}
+                for g, lesson in slots.items():
+                    lessons.setdefault(lesson['teacher'], (lesson, []))[1].append(g)
+                for teacher, (lesson, groups) in lessons.items():
+                    if (day, pair, teacher, lesson['room']) in rejected:
+                        displaced.append({'groups': groups, 'subject': lesson['subject'], 'teacher': teacher,
+                                          'is_sport': is_sport_subject(lesson['subject']), 'is_flow': len(groups) > 1})
+                    else:
+                        self._commit_slot((day, pair, lesson['room']), groups, lesson['subject'], teacher, *state)
+
+        kept = set(_week_placements(state[0]))
+        self.counters["ledger_repairs"] += len(displaced)
+        for task in displaced:
+            if place_again:
+                self._schedule_task(task, week_num, state, unscheduled)
+            else:
+                self.counters["unplaced"] += len(task['groups'])
+                unscheduled.append(f"Неделя {week_num} | {', '.join(task['groups'])}: {task['subject']} "
+                                   f"({task['teacher']}) (ERR: ресурс занят другим семестром)")
+        return state[0], sorted(set(_week_placements(state[0])) - kept)
+
+    def _generate_week(self, week_num, pool=None, reserved=None):
+        """
+        pool — ProcessPoolExecutor для компонент (см. generate_semester); без него (нет fork) —
+        по очереди. Число компонент считается всегда — по нему видно, поможет ли разбиение.
+        """
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        raw_needs = self.calculate_weekly_needs(week_num)
+        tasks = self._group_into_flows(raw_needs)
+        components = week_components(tasks, self.room_candidates)
+
+        if COMPONENT_WORKERS <= 1 or len(components) <= 1:
+            schedule, unscheduled = self._solve_tasks(tasks, week_num, reserved)
+        else:
+            parts = [[tasks[i] for i in component] for component in components]
+            # самые большие — первыми, чтобы длинная компонента не досталась воркеру последней
+            order = sorted(range(len(parts)), key=lambda i: -len(parts[i]))
+            if pool is not None:
+                solved = dict(zip(order, pool.map(_solve_component_in_worker, [week_num] * len(order),
+                                                  [parts[i] for i in order], [reserved] * len(order))))
+            else:
+                solved = {i: self._solve_component(week_num, parts[i], reserved) for i in order}
+            schedule, unscheduled = self._merge_components(week_num, [solved[i] for i in range(len(parts))], reserved)
+
+        self.counters["tasks"] = len(tasks)
+        self.counters["components"] = len(components)
+        self.week_counters[week_num] = self.counters
         return schedule, unscheduled
 
-    def generate_semester(self):
+    def semester_counters(self):
+        """{"total": {...}, "weeks": {"1": {...}, ...}} — для ответа рядом с warnings."""
+        total = dict.fromkeys(self.COUNTERS, 0)
+        for counters in self.week_counters.values():
+            for name, n in counters.items():
+                total[name] += n
+        return {"total": total, "weeks": {str(w): c for w, c in sorted(self.week_counters.items())}}
+
+    def generate_semester(self, on_week=None, should_cancel=None):
+        """
+        on_week(week_num, schedule, errors) — вызывается после каждой недели (прогресс).
+        should_cancel() — проверяется между неделями; True => GenerationCancelled.
+        """
+        global _COMPONENT_OPTIMIZER
         semester_schedule = {}
         all_errors = []
+        self.week_counters = {}
         print(f"INFO: Старт генерации семестра ({self.WEEKS} недель)...")
-        for w in range(1, self.WEEKS + 1):
-            sch, errs = self.generate_week_schedule(w)
-            semester_schedule[w] = sch
-            all_errors.extend(errs)
+
+        pool = None
+        if COMPONENT_WORKERS > 1 and "fork" in multiprocessing.get_all_start_methods():
+            # воркеры форкаются при первой отправке и получают копию self
+            _COMPONENT_OPTIMIZER = self
+            pool = ProcessPoolExecutor(max_workers=COMPONENT_WORKERS, mp_context=multiprocessing.get_context("fork"))
+        try:
+            for w in range(1, self.WEEKS + 1):
+                if should_cancel is not None and should_cancel():
+                    raise GenerationCancelled(f"Генерация отменена на неделе {w}")
+                sch, errs = self.generate_week_schedule(w, pool)
+                semester_schedule[w] = sch
+                all_errors.extend(errs)
+                if on_week is not None:
+                    on_week(w, sch, errs)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+                _COMPONENT_OPTIMIZER = None
         return semester_schedule, all_errors
 
     def save_semester_to_excel(self, semester_schedule, output_filename="Расписание_Семестр.xlsx"):
+        from openpyxl import Workbook
+        from openpyxl.styles import Alignment, Font, PatternFill, Border, Side
+        from openpyxl.utils import get_column_letter
+
         wb = Workbook()
         if "Sheet" in wb.sheetnames: wb.remove(wb["Sheet"])
         thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
@@ -831,7 +1883,6 @@ class ScheduleOptimizer:
         header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
         flow_fill = PatternFill(start_color="DDEBF7", end_color="DDEBF7", fill_type="solid") 
         center_align = Alignment(horizontal='center', vertical='center', wrap_text=True)
-        days_names = {1: "ПОНЕДЕЛЬНИК", 2: "ВТОРНИК", 3: "СРЕДА", 4: "ЧЕТВЕРГ", 5: "ПЯТНИЦА"}
 
         all_groups = set()
         for w in semester_schedule:
@@ -857,7 +1908,7 @@ class ScheduleOptimizer:
             for day in range(1, self.DAYS_PER_WEEK + 1):
                 start_row = current_row
                 for pair in range(1, self.MAX_PAIRS + 1):
-                    ws.cell(row=current_row, column=1, value=days_names.get(day)).border = thin_border
+                    ws.cell(row=current_row, column=1, value=DAYS_NAMES.get(day)).border = thin_border
                     ws.cell(row=current_row, column=2, value=pair).alignment = center_align
                     ws.cell(row=current_row, column=2).border = thin_border
                     for i, group in enumerate(sorted_groups):
@@ -897,8 +1948,6 @@ class ScheduleOptimizer:
           ]
         }
         """
-        days_names = {1: "ПОНЕДЕЛЬНИК", 2: "ВТОРНИК", 3: "СРЕДА", 4: "ЧЕТВЕРГ", 5: "ПЯТНИЦА"}
-
         # Собираем списки групп и преподавателей (для селектов)
         all_groups = set()
         all_teachers = set()
@@ -918,11 +1967,11 @@ class ScheduleOptimizer:
 
             week_obj = {"week_number": w, "days": []}
             for d in range(1, self.DAYS_PER_WEEK + 1):
-                day_obj = {"day_name": days_names.get(d, f"DAY_{d}"), "pairs": []}
+                day_obj = {"day_name": DAYS_NAMES.get(d, f"DAY_{d}"), "pairs": []}
 
                 for p in range(1, self.MAX_PAIRS + 1):
-                    # shift: 1-я смена (1-3 пары), 2-я смена (4-5 пары) — как у вас в UI
-                    shift = 2 if p >= 4 else 1
+                    # shift: по Shift_Type; при двух сменах 2-я — с SHIFT_SPLIT_PAIR (как у вас в UI)
+                    shift = self.rules.shift_of_pair[p]
 
                     slots = {}
                     # Инициализируем слоты по всем группам (чтобы фронт мог обращаться pairData.slots[group])
@@ -963,9 +2012,164 @@ class ScheduleOptimizer:
             json.dump(payload, f, ensure_ascii=False, indent=2)
 
         print(f"JSON успешно сохранён: {out_path.resolve()}")
-def build_json_for_one_semester(optimizer, semester_schedule):
-    days_names = {1: "ПОНЕДЕЛЬНИК", 2: "ВТОРНИК", 3: "СРЕДА", 4: "ЧЕТВЕРГ", 5: "ПЯТНИЦА"}
+class QualityEvaluator:
+    """
+    KPI семестра на плотных тензорах неделя × день × пара × (группа | преподаватель | аудитория).
+    Словари расписания обходятся один раз (в координаты), дальше — только операции numpy,
+    поэтому оценку можно звать в циклах поиска и в бенчмарке.
+    Штрафы — как в calculate_slot_score, но по готовому расписанию и в пересчёте на группу:
+    окно — раз за день группы, край и соседство — на каждую пару группы.
+    soft_penalty — нарушения мягких правил S1–S4 с весами из книги (ScheduleRules.weights);
+    дни короче Min_Lessons_Per_Day идут в S3 (равномерность по дням).
+    """
+
+    def __init__(self, optimizer):
+        self.optimizer = optimizer
+        self.shape = (optimizer.WEEKS, optimizer.DAYS_PER_WEEK, optimizer.MAX_PAIRS)
+        self.room_index = {name: i for i, (name, _capacity, _is_gym) in enumerate(optimizer.room_list)}
+        self.capacity = np.array([capacity for _name, capacity, _is_gym in optimizer.room_list], dtype=np.int64)
+
+    def _coordinates(self, semester_schedule):
+        """(уроки групп: [w, d, p, группа], занятия: [w, d, p, преподаватель, аудитория, студентов]) — индексы с нуля."""
+        groups, teachers = {}, {}
+        group_rows, placements = [], {}
+        for w, week in semester_schedule.items():
+            for d, pairs in week.items():
+                for p, slots in pairs.items():
+                    for g, info in slots.items():
+                        if not info:
+                            continue
+                        group_rows.append((w - 1, d - 1, p - 1, groups.setdefault(g, len(groups))))
+                        key = (w - 1, d - 1, p - 1, teachers.setdefault(info['teacher'], len(teachers)),
+                               self.room_index.get(info['room'], -1))
+                        placements[key] = placements.get(key, 0) + self.optimizer.get_group_size(g)
+        lessons = np.array(group_rows, dtype=np.int64).reshape(-1, 4)
+        sessions = np.array([(*k, n) for k, n in placements.items()], dtype=np.int64).reshape(-1, 6)
+        return lessons, len(groups), sessions, len(teachers)
+
+    @staticmethod
+    def _gaps(occupied):
+        """occupied[..., пара, x] -> (пустые пары между первой и последней [..., x], пар за день [..., x])."""
+        pairs = occupied.shape[-2]
+        count = occupied.sum(axis=-2)
+        first = occupied.argmax(axis=-2)
+        last = pairs - 1 - occupied[..., ::-1, :].argmax(axis=-2)
+        return np.where(count > 0, last - first + 1 - count, 0), count
+
+    def evaluate(self, semester_schedule) -> Dict[str, Any]:
+        lessons, n_groups, sessions, n_teachers = self._coordinates(semester_schedule)
+        weeks, days, pairs = self.shape
+
+        group_busy = np.zeros((weeks, days, pairs, n_groups), dtype=bool)
+        group_busy[tuple(lessons.T)] = True
+        windows, per_day = self._gaps(group_busy)
+        edge_pairs = int(group_busy[:, :, 0].sum() + (group_busy[:, :, -1].sum() if pairs > 1 else 0))
+        adjacent = int((group_busy[:, :, 1:] & group_busy[:, :, :-1]).sum())
+        # баланс: разброс пар по дням недели у группы (только недели, где у группы что-то есть)
+        active = per_day.sum(axis=1) > 0
+        day_spread = per_day.std(axis=1)[active]
+        # дни группы, где пары есть, но меньше Min_Lessons_Per_Day
+        short_days = int(((per_day > 0) & (per_day < self.optimizer.rules.min_pairs)).sum())
+
+        teacher_load = np.zeros((weeks, days, pairs, n_teachers), dtype=np.int32)
+        np.add.at(teacher_load, tuple(sessions[:, :4].T), 1)
+        idle, teacher_per_day = self._gaps(teacher_load > 0)
+        single_pair_days = int((teacher_per_day == 1).sum())
+
+        known = sessions[sessions[:, 4] >= 0]
+        room_sessions = np.zeros((weeks, days, pairs, len(self.capacity)), dtype=np.int32)
+        room_students = np.zeros_like(room_sessions)
+        np.add.at(room_sessions, (known[:, 0], known[:, 1], known[:, 2], known[:, 4]), 1)
+        np.add.at(room_students, (known[:, 0], known[:, 1], known[:, 2], known[:, 4]), known[:, 5])
+        used = room_sessions > 0
+        capacity = np.broadcast_to(self.capacity, used.shape)[used]
+        students = room_students[used]
+        waste = 1 - students / np.maximum(capacity, 1)
+
+        windowed_days = int((windows > 0).sum())
+        teacher_gap_days = int((idle > 0).sum())
+        weights = {code: self.optimizer.rules.weight(code) or 0 for code in DEFAULT_RULE_WEIGHTS}
+        soft_penalty = (weights["S1"] * windowed_days + weights["S2"] * teacher_gap_days
+                        + weights["S3"] * (float(day_spread.sum()) + short_days) + weights["S4"] * single_pair_days)
+        return {
+            "score": (self.optimizer.penalty_window * windowed_days + PENALTY_EDGE * edge_pairs
+                      + self.optimizer.bonus_adjacent * adjacent),
+            "soft_penalty": round(soft_penalty, 2),
+            "group_pairs": int(group_busy.sum()),
+            "group_windows": int(windows.sum()),
+            "group_days_with_windows": windowed_days,
+            "edge_pairs": edge_pairs,
+            "adjacent_pairs": adjacent,
+            "max_pairs_per_day": int(per_day.max(initial=0)),
+            "day_balance_std": round(float(day_spread.mean()), 4) if day_spread.size else 0.0,
+            "group_short_days": short_days,
+            "teacher_idle_gaps": int(idle.sum()),
+            "teacher_days_with_gaps": teacher_gap_days,
+            "teacher_single_pair_days": single_pair_days,
+            "teacher_conflicts": int((teacher_load > 1).sum()),
+            "room_conflicts": int((room_sessions > 1).sum()),
+            "room_overflows": int((students > capacity).sum()),
+            "room_waste": round(float(np.clip(waste, 0, None).mean()), 4) if waste.size else 0.0,
+            "room_utilization": round(float(used.mean()), 4) if used.size else 0.0,
+        }
+
+
+def content_fingerprint(obj) -> str:
+    """Отпечаток содержимого недели/дня: одинаковые данные — одинаковый отпечаток в любой версии результата."""
+    raw = json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def build_week_json(optimizer, w, week_schedule, groups_sorted):
+    week_obj = {"week_number": w, "days": []}
+    for d in range(1, optimizer.DAYS_PER_WEEK + 1):
+        day_obj = {"day_name": DAYS_NAMES.get(d, f"DAY_{d}"), "pairs": []}
+
+        for p in range(1, optimizer.MAX_PAIRS + 1):
+            shift = optimizer.rules.shift_of_pair[p]
+            slots = {g: None for g in groups_sorted}
+
+            for g, info in week_schedule[d][p].items():
+                if not info:
+                    continue
+                slots[g] = {
+                    "subject": info.get("subject", ""),
+                    "teacher": info.get("teacher", ""),
+                    "room": info.get("room", ""),
+                    "is_flow": bool(info.get("is_flow", False)),
+                    "shift": shift
+                }
+
+            day_obj["pairs"].append({"pair": p, "slots": slots})
+
+        day_obj["fingerprint"] = content_fingerprint(day_obj)
+        week_obj["days"].append(day_obj)
+    # неделя = номер + отпечатки дней: дни не сериализуются второй раз
+    week_obj["fingerprint"] = content_fingerprint([w, [day["fingerprint"] for day in week_obj["days"]]])
+    return week_obj
+
+
+def _semester_rooms(optimizer):
+    if "Аудитория" not in optimizer.rooms.columns:
+        return []
+    return [str(r).strip() for r in optimizer.rooms["Аудитория"] if pd.notna(r)]
+
+
+def _semester_meta(optimizer):
+    """Группы/преподаватели из нагрузки — известны до генерации (для потоковой выдачи)."""
+    groups, teachers = set(), set()
+    for col, acc in (("группа", groups), ("ФИО преподавателя", teachers)):
+        if col in optimizer.teachers.columns:
+            acc.update(str(x).strip() for x in optimizer.teachers[col] if pd.notna(x))
+    return {
+        "groups": sorted(groups),
+        "teachers": sorted(teachers),
+        "rooms": _semester_rooms(optimizer),
+        "week_numbers": list(range(1, optimizer.WEEKS + 1)),
+    }
+
 
+def build_json_for_one_semester(optimizer, semester_schedule):
     all_groups = set()
     all_teachers = set()
 
@@ -984,42 +2188,18 @@ def build_json_for_one_semester(optimizer, semester_schedule):
     for w in range(1, optimizer.WEEKS + 1):
         if w not in semester_schedule:
             continue
-
-        week_obj = {"week_number": w, "days": []}
-        for d in range(1, optimizer.DAYS_PER_WEEK + 1):
-            day_obj = {"day_name": days_names.get(d, f"DAY_{d}"), "pairs": []}
-
-            for p in range(1, optimizer.MAX_PAIRS + 1):
-                shift = 2 if p >= 4 else 1
-                slots = {g: None for g in groups_sorted}
-
-                for g, info in semester_schedule[w][d][p].items():
-                    if not info:
-                        continue
-                    slots[g] = {
-                        "subject": info.get("subject", ""),
-                        "teacher": info.get("teacher", ""),
-                        "room": info.get("room", ""),
-                        "is_flow": bool(info.get("is_flow", False)),
-                        "shift": shift
-                    }
-
-                day_obj["pairs"].append({"pair": p, "slots": slots})
-
-            week_obj["days"].append(day_obj)
-
-        weeks_out.append(week_obj)
-
-    return {"groups": groups_sorted, "teachers": teachers_sorted, "weeks": weeks_out}
-def generate_schedule_from_excel(file_path: str):
-    df_rup = pd.read_excel(file_path, sheet_name='РУП')
-    df_teachers = pd.read_excel(file_path, sheet_name='Нагруженность преподователей')
-    df_groups = pd.read_excel(file_path, sheet_name='Группы и направления')
-    df_rooms = pd.read_excel(file_path, sheet_name='Аудитории')
-    try:
-        df_rules = pd.read_excel(file_path, sheet_name='Правила составления')
-    except:
-        df_rules = pd.DataFrame()
+        weeks_out.append(build_week_json(optimizer, w, semester_schedule[w], groups_sorted))
+
+    return {"groups": groups_sorted, "teachers": teachers_sorted, "rooms": _semester_rooms(optimizer), "weeks": weeks_out}
+def read_schedule_frames(file_path: Optional[str], sheets: Optional[Dict[str, pd.DataFrame]] = None):
+    """Листы книги в том виде, в котором их ест ScheduleOptimizer (спортзал добавлен при необходимости)."""
+    if sheets is None:
+        sheets = read_workbook_sheets(file_path)
+    df_rup = sheets['РУП']
+    df_teachers = sheets['Нагруженность преподователей']
+    df_groups = sheets['Группы и направления']
+    df_rooms = sheets['Аудитории']
+    df_rules = sheets.get('Правила составления', pd.DataFrame())
 
     # гарантируем спортзал
     has_gym = False
@@ -1029,50 +2209,756 @@ def generate_schedule_from_excel(file_path: str):
         new_room = pd.DataFrame([{'Аудитория': 'Спорт зал', 'Назначение': 'Физра', 'Вместимость': 100}])
         df_rooms = pd.concat([df_rooms, new_room], ignore_index=True)
 
-    # --- SPLIT BY SEMESTER ---
-    loads_by_semester = split_load_by_semester(df_teachers)
+    return df_rup, df_teachers, df_groups, df_rooms, df_rules
 
-    semesters_payload = {}
+
+def build_ledger(optimizers) -> Optional[ResourceLedger]:
+    """Общий реестр для оптимизаторов одной книги (LEDGER_SCOPE); off или один семестр — None."""
+    if LEDGER_SCOPE == "off" or len(optimizers) < 2:
+        return None
+    teachers, rooms = set(), set()
+    for optimizer in optimizers.values():
+        teachers.update(_semester_meta(optimizer)["teachers"])
+        rooms.update(name for name, _capacity, _is_gym in optimizer.room_list)
+    ledger = ResourceLedger(
+        teachers, rooms, terms=2 if LEDGER_SCOPE == "term" else 1,
+        weeks=max(o.WEEKS for o in optimizers.values()),
+        days=max(o.DAYS_PER_WEEK for o in optimizers.values()),
+        pairs=max(o.MAX_PAIRS for o in optimizers.values()),
+    )
+    for sem, optimizer in optimizers.items():
+        optimizer.ledger, optimizer.ledger_term = ledger, ledger_term(sem)
+    return ledger
+
+
+# (optimizers, очередь событий недель, флаг отмены) — задаётся до fork воркеров семестров
+_SEMESTER_RUN = None
+
+
+def _generate_semester_in_worker(sem):
+    optimizers, events, cancelled = _SEMESTER_RUN
+    optimizer = optimizers[sem]
+    groups = _semester_meta(optimizer)["groups"]
+
+    def on_week(w, sch, _errs):
+        events.put((sem, w, optimizer.week_counters[w], build_week_json(optimizer, w, sch, groups)))
+
+    sched, warnings = optimizer.generate_semester(on_week=on_week, should_cancel=cancelled.is_set)
+    return sched, warnings, optimizer.week_counters
+
+
+def _generate_semesters_parallel(optimizers, on_week, should_cancel):
+    """
+    Семестры — в SEMESTER_WORKERS процессах; пересечения по преподавателям/аудиториям
+    разводит общий реестр. Порядок недель в on_week — по мере готовности, а сам результат
+    зависит от того, кто раньше забронировал слот (в отличие от последовательного режима).
+    """
+    global _SEMESTER_RUN
+    ctx = multiprocessing.get_context("fork")
+    events, cancelled = ctx.Queue(), ctx.Event()
+    _SEMESTER_RUN = (optimizers, events, cancelled)
+
+    def drain(timeout):
+        try:
+            while True:
+                on_week(*events.get(timeout=timeout))
+                timeout = 0
+        except queue.Empty:
+            pass
+
+    results = {}
+    try:
+        with ProcessPoolExecutor(max_workers=SEMESTER_WORKERS, mp_context=ctx) as pool:
+            futures = {pool.submit(_generate_semester_in_worker, sem): sem for sem in optimizers}
+            pending = set(futures)
+            while pending:
+                drain(0.1)
+                if should_cancel is not None and should_cancel():
+                    cancelled.set()
+                pending = {f for f in pending if not f.done()}
+            drain(0)
+            for future, sem in futures.items():
+                results[sem] = future.result()
+    finally:
+        _SEMESTER_RUN = None
+    return results
+
+
+def generate_schedule_from_excel(file_path: Optional[str], on_progress=None, should_cancel=None, sheets=None,
+                                 rules: Optional[ScheduleRules] = None):
+    """
+    sheets — уже разобранные листы (read_workbook_sheets); тогда file_path не читается.
+    rules — скомпилированные правила (workbook_rules), если уже есть после logic_precheck_full.
+    on_progress(event) — события генерации:
+      {"stage": "semester_started", "semester": s, "groups", "teachers", "rooms", "week_numbers"}
+      {"stage": "week_done", "semester": s, "week": w, "done": n, "total": N, "week_data": {...}}
+    week_data — JSON недели в формате фронта: можно показывать, не дожидаясь конца семестра.
+    should_cancel() — пробрасывается в generate_semester.
+    """
+    with stage_timer("parse"):
+        if sheets is None:
+            sheets = read_workbook_sheets(file_path)
+        df_rup, df_teachers, df_groups, df_rooms, df_rules = read_schedule_frames(None, sheets)
+        if rules is None:
+            rules = workbook_rules(sheets)
+
+        # --- SPLIT BY SEMESTER ---
+        loads_by_semester = split_load_by_semester(df_teachers)
+
+    semesters_payload = {}
     warnings_by_semester = {}
+    stats_by_semester = {}
+    quality_by_semester = {}
 
-    for sem, df_load_sem in loads_by_semester.items():
-        optimizer = ScheduleOptimizer(df_rup, df_load_sem, df_groups, df_rooms, df_rules)
-        semester_sched, warnings = optimizer.generate_semester()
+    optimizers = {
+        sem: ScheduleOptimizer(df_rup, df_load_sem, df_groups, df_rooms, df_rules, rules)
+        for sem, df_load_sem in loads_by_semester.items()
+    }
+    total_weeks = sum(o.WEEKS for o in optimizers.values())
+    done_weeks = 0
+    build_ledger(optimizers)
+
+    def week_done(sem, w, stats, week_data):
+        nonlocal done_weeks
+        done_weeks += 1
+        if on_progress is not None:
+            on_progress({"stage": "week_done", "semester": str(sem), "week": w,
+                         "done": done_weeks, "total": total_weeks, "stats": stats, "week_data": week_data})
+
+    parallel = None
+    if SEMESTER_WORKERS > 1 and len(optimizers) > 1 and "fork" in multiprocessing.get_all_start_methods():
+        if on_progress is not None:
+            for sem, optimizer in optimizers.items():
+                on_progress({"stage": "semester_started", "semester": str(sem), **_semester_meta(optimizer)})
+        with stage_timer("generate"):
+            parallel = _generate_semesters_parallel(optimizers, week_done, should_cancel)
+
+    for sem, optimizer in optimizers.items():
+        if parallel is not None:
+            semester_sched, warnings, optimizer.week_counters = parallel[sem]
+        else:
+            meta = _semester_meta(optimizer)
+
+            def on_week(w, sch, _errs, sem=sem, groups=meta["groups"], optimizer=optimizer):
+                week_done(sem, w, optimizer.week_counters[w], build_week_json(optimizer, w, sch, groups))
+
+            if on_progress is not None:
+                on_progress({"stage": "semester_started", "semester": str(sem), **meta})
+            with stage_timer("generate"):
+                semester_sched, warnings = optimizer.generate_semester(on_week=on_week, should_cancel=should_cancel)
 
         # строим JSON одного семестра (логика как в вашем save_semester_to_json)
-        sem_payload = build_json_for_one_semester(optimizer, semester_sched)
+        with stage_timer("json_build"):
+            sem_payload = build_json_for_one_semester(optimizer, semester_sched)
+        with stage_timer("evaluate"):
+            quality_by_semester[str(sem)] = QualityEvaluator(optimizer).evaluate(semester_sched)
         semesters_payload[str(sem)] = sem_payload
         warnings_by_semester[str(sem)] = warnings
+        stats_by_semester[str(sem)] = optimizer.semester_counters()
 
     final_payload = {"semesters": semesters_payload}
 
     json_path = os.path.join("vue-project", "public", "schedule_data.json")
     Path(json_path).parent.mkdir(parents=True, exist_ok=True)
-    with open(json_path, "w", encoding="utf-8") as f:
+    with stage_timer("json_write"), open(json_path, "w", encoding="utf-8") as f:
         json.dump(final_payload, f, ensure_ascii=False, indent=2)
 
-    return {"json_path": json_path, "warnings": warnings_by_semester}
-app = FastAPI()
+    return {"json_path": json_path, "warnings": warnings_by_semester, "stats": stats_by_semester,
+            "quality": quality_by_semester, "payload": final_payload}
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-@app.post("/process")
-async def process(file: UploadFile = File(...)):
-    excel_bytes = await file.read()
 
-    tech_report = ai_validate_excel(excel_bytes)
+# ==========================================
+# МЕТРИКИ И ЗАМЕРЫ СТАДИЙ
+# ==========================================
+# Минимальный экспорт в текстовом формате Prometheus (без prometheus_client).
+# Значения — на процесс uvicorn: при нескольких воркерах каждый отдаёт свои /metrics.
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+WORKBOOK_SIZE_BUCKETS = tuple(2 ** p * 1024 for p in range(4, 17, 2))  # 16 КБ .. 64 МБ
+
+_metrics_lock = threading.Lock()
+
+
+def _fmt_labels(label: Optional[str], value: str, extra: str = "") -> str:
+    parts = [f'{label}="{value}"'] if label else []
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label: Optional[str] = None):
+        self.name, self.help, self.label = name, help_text, label
+        self._values: Dict[str, float] = {}
+
+    def inc(self, label_value: str = "", amount: float = 1):
+        with _metrics_lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def value(self, label_value: str = "") -> float:
+        return self._values.get(label_value, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with _metrics_lock:
+            for lv, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_fmt_labels(self.label, lv)} {v}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets, label: Optional[str] = None):
+        self.name, self.help, self.label = name, help_text, label
+        self.buckets = tuple(buckets)
+        self._series: Dict[str, Dict[str, Any]] = {}
+
+    def observe(self, value: float, label_value: str = ""):
+        with _metrics_lock:
+            s = self._series.setdefault(label_value, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    s["counts"][i] += 1
+            s["sum"] += value
+            s["count"] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with _metrics_lock:
+            for lv, s in sorted(self._series.items()):
+                for upper, n in zip(self.buckets, s["counts"]):
+                    le = 'le="%s"' % upper
+                    lines.append(f"{self.name}_bucket{_fmt_labels(self.label, lv, le)} {n}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.label, lv, le)} {s['count']}")
+                lines.append(f"{self.name}_sum{_fmt_labels(self.label, lv)} {s['sum']}")
+                lines.append(f"{self.name}_count{_fmt_labels(self.label, lv)} {s['count']}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("schedule_stage_seconds", "Длительность стадий конвейера /process", STAGE_BUCKETS, "stage")
+HTTP_SECONDS = Histogram("schedule_http_request_seconds", "Время до начала ответа по маршрутам", STAGE_BUCKETS, "route")
+WORKBOOK_BYTES = Histogram("schedule_workbook_bytes", "Размер загруженных книг", WORKBOOK_SIZE_BUCKETS)
+AI_CACHE_LOOKUPS = Counter("schedule_ai_cache_lookups_total", "Обращения к кэшу AI-валидации (hit/miss/local)", "result")
+MEMORY_BUCKETS = tuple(2 ** p * 1024 * 1024 for p in range(4, 13))  # 16 МБ .. 4 ГБ
+PEAK_RSS_BYTES = Histogram("schedule_generation_peak_rss_bytes", "Пик RSS процесса пула за генерацию", MEMORY_BUCKETS)
+RSS_GROWTH_BYTES = Histogram("schedule_generation_rss_growth_bytes", "Прирост RSS за генерацию (пик минус старт)", MEMORY_BUCKETS)
+RESULT_CACHE_LOOKUPS = Counter("schedule_result_cache_lookups_total", "Обращения к кэшу готовых расписаний", "result")
+
+# замеры текущего запроса/задачи; в процессе пула свой набор (см. timed_call)
+_STAGE_TIMINGS: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("stage_timings", default=None)
+
+
+@contextmanager
+def stage_timer(stage: str, timings: Optional[Dict[str, float]] = None):
+    """Добавляет длительность блока к стадии stage (в timings или в замеры текущего контекста)."""
+    target = timings if timings is not None else _STAGE_TIMINGS.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if target is not None:
+            target[stage] = target.get(stage, 0.0) + time.perf_counter() - started
+
+
+def timed_call(fn, *args):
+    """fn(*args) с отдельным набором замеров стадий. Возвращает (результат, {стадия: секунды})."""
+    timings: Dict[str, float] = {}
+    token = _STAGE_TIMINGS.set(timings)
+    try:
+        return fn(*args), timings
+    finally:
+        _STAGE_TIMINGS.reset(token)
+
+
+def _merge_timings(timings: Dict[str, float]):
+    target = _STAGE_TIMINGS.get()
+    if target is not None:
+        for stage, sec in timings.items():
+            target[stage] = target.get(stage, 0.0) + sec
+
+
+def observe_stages(timings: Dict[str, float]):
+    for stage, sec in timings.items():
+        STAGE_SECONDS.observe(sec, stage)
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{stage};dur={sec * 1000:.1f}" for stage, sec in timings.items())
+
+
+def _with_timings(response: Response, timings: Dict[str, float]) -> Response:
+    observe_stages(timings)
+    if timings:
+        response.headers.append("Server-Timing", server_timing(timings))
+    return response
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI-обёртка (не BaseHTTPMiddleware — она мешает потоковым ответам):
+    добавляет Server-Timing total к каждому ответу и пишет время до заголовков в гистограмму маршрута.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - started
+                MutableHeaders(scope=message).append("Server-Timing", f"total;dur={elapsed * 1000:.1f}")
+                route = scope.get("route")
+                HTTP_SECONDS.observe(elapsed, getattr(route, "path", "unmatched"))
+            await send(message)
+
+        await self.app(scope, receive, send_with_timing)
+
+
+def _current_rss() -> Optional[int]:
+    """RSS процесса в байтах (Linux, /proc); на других ОС — None."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class PeakRssMeter:
+    """Пик RSS за время блока: фоновый опрос раз в interval (ru_maxrss не сбрасывается между запросами)."""
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.start = self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-meter", daemon=True)
+
+    def _sample(self):
+        rss = _current_rss()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self.start = self.peak = _current_rss()
+        if self.start is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None:
+            self._stop.set()
+            self._thread.join()
+            self._sample()
+
+    def report(self) -> Dict[str, float]:
+        if self.start is None:
+            return {}
+        mb = 1024 * 1024
+        return {"peak_rss_mb": round(self.peak / mb, 1), "rss_growth_mb": round((self.peak - self.start) / mb, 1)}
+
+
+def take_resources(content: Dict[str, Any]) -> Dict[str, float]:
+    """Забирает body["resources"] из ответа (в кэш не попадает) и пишет в метрики."""
+    resources = content.pop("resources", None) or {}
+    if resources:
+        PEAK_RSS_BYTES.observe(resources["peak_rss_mb"] * 1024 * 1024)
+        RSS_GROWTH_BYTES.observe(resources["rss_growth_mb"] * 1024 * 1024)
+    return resources
+
+
+def resources_header(resources: Dict[str, float]) -> str:
+    return ", ".join(f"{k}={v}" for k, v in resources.items())
+
+
+# ==========================================
+# ПРОФИЛИРОВАНИЕ ПО ЗАПРОСУ
+# ==========================================
+# /process?profile=1: один прогон генерации под сэмплирующим профайлером.
+# Поток-сэмплер раз в PROFILE_INTERVAL_SEC снимает стек рабочего потока; результат —
+# свёрнутые стеки ("a;b;c N"), их понимают flamegraph.pl и speedscope.
+PROFILE_DIR = Path(os.getenv("SCHEDULE_PROFILE_DIR", ".schedule_profiles"))
+PROFILE_INTERVAL_SEC = float(os.getenv("SCHEDULE_PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_KEEP = int(os.getenv("SCHEDULE_PROFILE_KEEP", "20"))
+
+
+class StackSampler:
+    """root — код функции, выше которой стек не нужен (рамки пула/фреймворка)."""
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL_SEC, root=None):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.root = root
+        self.samples: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                if code is self.root:
+                    break
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in sorted(self.samples.items(), key=lambda kv: -kv[1]))
+
+
+def _profile_path(profile_id: str) -> Path:
+    return PROFILE_DIR / f"{profile_id}.folded"
+
+
+def check_and_generate_profiled(source, on_progress=None, should_cancel=None) -> Tuple[int, Dict[str, Any]]:
+    """check_and_generate под StackSampler; id профиля — в body["profile_id"]."""
+    profile_id = uuid.uuid4().hex
+    with StackSampler(threading.get_ident(), root=_check_and_generate.__code__) as sampler:
+        status, body = check_and_generate(source, on_progress, should_cancel)
+
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    _profile_path(profile_id).write_text(sampler.collapsed(), encoding="utf-8")
+    # храним только последние PROFILE_KEEP профилей
+    for old in sorted(PROFILE_DIR.glob("*.folded"), key=lambda p: p.stat().st_mtime)[:-PROFILE_KEEP]:
+        old.unlink(missing_ok=True)
+    return status, {**body, "profile_id": profile_id}
+
+
+# ==========================================
+# КЭШ РЕЗУЛЬТАТОВ
+# ==========================================
+# Ключ = sha256 файла + версия оптимизатора. Версия считается по исходному коду
+# всех функций, влияющих на результат, поэтому любая правка оптимизатора
+# автоматически делает старые записи недостижимыми (их потом вытеснит LRU).
+_VERSIONED_CODE = [
+    split_load_by_semester,
+    ScheduleRules,
+    _rule_weights,
+    _parse_shifts,
+    _parse_day,
+    _parse_pairs,
+    _compile_availability,
+    compile_rules,
+    workbook_rules,
+    logic_precheck_full,
+    is_sport_subject,
+    week_components,
+    ResourceLedger,
+    ScheduleOptimizer,
+    QualityEvaluator,
+    build_week_json,
+    build_json_for_one_semester,
+    read_schedule_frames,
+    build_ledger,
+    generate_schedule_from_excel,
+]
+
+
+def _optimizer_settings() -> Dict[str, Any]:
+    return {"schema": RESULT_SCHEMA_VERSION, "decompose": COMPONENT_WORKERS > 1,
+            "ledger": LEDGER_SCOPE, "parallel_semesters": SEMESTER_WORKERS > 1,
+            "penalties": [PENALTY_WINDOW, PENALTY_EDGE, BONUS_ADJACENT, BONUS_FIRST_OF_DAY],
+            "rules": [DEFAULT_WEEKS, DEFAULT_DAYS_PER_WEEK, DEFAULT_MAX_PAIRS, DEFAULT_LESSON_MINUTES,
+                      SHIFT_SPLIT_PAIR, DEFAULT_RULE_WEIGHTS]}
+
+
+@lru_cache(maxsize=1)
+def optimizer_version() -> str:
+    h = hashlib.sha256()
+    for obj in _VERSIONED_CODE:
+        h.update(inspect.getsource(obj).encode("utf-8"))
+    h.update(json.dumps(_optimizer_settings(), sort_keys=True).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def result_cache_key(file_hash: str) -> str:
+    return f"{file_hash}-{optimizer_version()}"
+
+
+def _result_dir(key: str) -> Path:
+    return RESULT_CACHE_DIR / key
+
+
+def result_cache_get(key: str, part: str = "response") -> Optional[bytes]:
+    """Возвращает сериализованную часть результата или None. Чтение обновляет mtime (LRU)."""
+    d = _result_dir(key)
+    try:
+        body = (d / f"{part}.json").read_bytes()
+        os.utime(d)
+    except OSError:
+        return None
+    return body
+
+
+def _write_json_atomic(path: Path, obj: Any) -> bytes:
+    body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    tmp = path.with_suffix(".tmp")
+    tmp.write_bytes(body)
+    os.replace(tmp, path)  # атомарно: параллельный читатель не увидит половину файла
+    return body
+
+
+def result_cache_put(key: str, content: Dict[str, Any]) -> bytes:
+    """
+    Сохраняет результат генерации. В папке результата лежат:
+      response.json — полный ответ /process,
+      summary.json  — облегчённый ответ (без недель),
+      index.json    — индексы для выборок по неделям/группам/преподавателям/аудиториям.
+    Индекс пишется раньше ответа: наличие response.json = результат целиком готов.
+    """
+    d = _result_dir(key)
+    d.mkdir(parents=True, exist_ok=True)
+    content = {**content, "schedule_id": key}
+    index = build_schedule_index(content["data"])
+    _write_json_atomic(d / "index.json", index)
+    _write_json_atomic(d / "summary.json", build_schedule_summary(content, index))
+    body = _write_json_atomic(d / "response.json", content)
+    _result_cache_evict()
+    return body
+
+
+def _result_cache_evict():
+    entries = []
+    total = 0
+    for d in RESULT_CACHE_DIR.iterdir():
+        if not d.is_dir():
+            continue
+        try:
+            size = sum(p.stat().st_size for p in d.iterdir())
+            mtime = d.stat().st_mtime
+        except OSError:
+            continue
+        entries.append((mtime, size, d))
+        total += size
+
+    # самые давно использованные — первыми на выход
+    entries.sort(key=lambda x: x[0])
+    for _, size, d in entries:
+        if total <= RESULT_CACHE_MAX_BYTES:
+            break
+        shutil.rmtree(d, ignore_errors=True)
+        _STORED_RESULTS.pop(d.name, None)
+        total -= size
+
+
+# ==========================================
+# ХРАНИЛИЩЕ РЕЗУЛЬТАТОВ И ВЫБОРКИ
+# ==========================================
+STORED_RESULTS_IN_MEMORY = 4
+_STORED_RESULTS: "OrderedDict[str, Tuple[Dict[str, Any], Dict[str, Any]]]" = OrderedDict()
+
+
+def build_schedule_index(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Обратные индексы строятся один раз при генерации (ячейка = [day_idx, pair_idx, группа]):
+      by_week       — номер недели -> позиция в списке weeks,
+      teacher_slots — преподаватель -> неделя -> [ячейка, ...],
+      room_slots    — аудитория -> неделя -> [ячейка, ...],
+      group_slots   — группа -> неделя -> [[day_idx, pair_idx], ...],
+      free_rooms    — неделя -> [день][пара] -> hex-битмаска свободных аудиторий
+                      (бит i = rooms[i] свободна).
+    """
+    index = {"semesters": {}}
+    for sem, sem_data in data.get("semesters", {}).items():
+        rooms = list(sem_data.get("rooms", []))
+        room_bit = {r: i for i, r in enumerate(rooms)}
+        all_rooms_mask = (1 << len(rooms)) - 1
+
+        by_week = {}
+        teacher_slots: Dict[str, Dict[str, List[list]]] = {}
+        room_slots: Dict[str, Dict[str, List[list]]] = {}
+        group_slots: Dict[str, Dict[str, List[list]]] = {}
+        free_rooms: Dict[str, List[List[str]]] = {}
+
+        for wi, week in enumerate(sem_data["weeks"]):
+            w = str(week["week_number"])
+            by_week[w] = wi
+            week_free = []
+            for di, day in enumerate(week["days"]):
+                day_free = []
+                for pi, pair in enumerate(day["pairs"]):
+                    busy = 0
+                    for g, slot in pair["slots"].items():
+                        if not slot:
+                            continue
+                        cell = [di, pi, g]
+                        teacher_slots.setdefault(slot["teacher"], {}).setdefault(w, []).append(cell)
+                        room_slots.setdefault(slot["room"], {}).setdefault(w, []).append(cell)
+                        group_slots.setdefault(g, {}).setdefault(w, []).append([di, pi])
+                        if slot["room"] in room_bit:
+                            busy |= 1 << room_bit[slot["room"]]
+                    day_free.append(format(all_rooms_mask & ~busy, "x"))
+                week_free.append(day_free)
+            free_rooms[w] = week_free
+
+        index["semesters"][sem] = {
+            "by_week": by_week,
+            "rooms": rooms,
+            "teacher_slots": teacher_slots,
+            "room_slots": room_slots,
+            "group_slots": group_slots,
+            "free_rooms": free_rooms,
+        }
+    return index
+
+
+def build_schedule_summary(content: Dict[str, Any], index: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Облегчённый ответ: всё, кроме самих недель. Недели клиент запрашивает по одной.
+    teacher_groups / room_groups — для фильтров фронта (какие группы показывать).
+    """
+    semesters = {}
+    for sem, sem_data in content["data"]["semesters"].items():
+        sem_index = index["semesters"][sem]
+        semesters[sem] = {
+            "groups": sem_data["groups"],
+            "teachers": sem_data["teachers"],
+            "rooms": sem_data.get("rooms", []),
+            "week_numbers": [w["week_number"] for w in sem_data["weeks"]],
+            "teacher_groups": _groups_of(sem_index["teacher_slots"]),
+            "room_groups": _groups_of(sem_index["room_slots"]),
+            "fingerprints": _fingerprints_of(sem_data["weeks"]),
+            "weeks": [],
+        }
+    return {**content, "data": {"semesters": semesters}}
+
+
+def _fingerprints_of(weeks: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """номер недели -> {"week": отпечаток, "days": [отпечатки дней]} (результаты до отпечатков — пусто)."""
+    return {
+        str(week["week_number"]): {"week": week["fingerprint"], "days": [day["fingerprint"] for day in week["days"]]}
+        for week in weeks if "fingerprint" in week
+    }
+
+
+def _groups_of(slots_by_entity: Dict[str, Dict[str, List[list]]]) -> Dict[str, List[str]]:
+    return {
+        name: sorted({cell[2] for cells in by_week.values() for cell in cells})
+        for name, by_week in slots_by_entity.items()
+    }
+
+
+def load_stored_result(schedule_id: str) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """(response, index) сохранённого результата; несколько последних держим разобранными в памяти."""
+    if schedule_id in _STORED_RESULTS:
+        _STORED_RESULTS.move_to_end(schedule_id)
+        return _STORED_RESULTS[schedule_id]
+
+    body = result_cache_get(schedule_id)
+    index_body = result_cache_get(schedule_id, "index")
+    if body is None or index_body is None:
+        return None
+
+    loaded = (json.loads(body), json.loads(index_body))
+    _STORED_RESULTS[schedule_id] = loaded
+    while len(_STORED_RESULTS) > STORED_RESULTS_IN_MEMORY:
+        _STORED_RESULTS.popitem(last=False)
+    return loaded
+
+
+def select_week(response: Dict[str, Any], index: Dict[str, Any], semester: str, week: int,
+                groups: Optional[List[str]] = None, teacher: Optional[str] = None,
+                room: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Одна неделя семестра, урезанная до нужных групп, преподавателя и/или аудитории."""
+    sem_data = response["data"]["semesters"].get(semester)
+    sem_index = index["semesters"].get(semester)
+    if sem_data is None or sem_index is None:
+        return None
+    wi = sem_index["by_week"].get(str(week))
+    if wi is None:
+        return None
+    week_obj = sem_data["weeks"][wi]
+
+    # берём ровно те ячейки, что указаны в индексах преподавателя/аудитории
+    keep = None
+    for by_entity, name in ((sem_index["teacher_slots"], teacher), (sem_index["room_slots"], room)):
+        if not name:
+            continue
+        cells = {}
+        for di, pi, g in by_entity.get(name, {}).get(str(week), []):
+            cells.setdefault((di, pi), set()).add(g)
+        if keep is None:
+            keep = cells
+        else:
+            keep = {k: keep[k] & v for k, v in cells.items() if k in keep}
+    wanted = set(groups) if groups else None
+
+    days = []
+    for di, day in enumerate(week_obj["days"]):
+        pairs = []
+        for pi, pair in enumerate(day["pairs"]):
+            slots = pair["slots"]
+            if keep is not None:
+                allowed = keep.get((di, pi), set())
+                slots = {g: (s if g in allowed else None) for g, s in slots.items()}
+            if wanted is not None:
+                slots = {g: s for g, s in slots.items() if g in wanted}
+            pairs.append({"pair": pair["pair"], "slots": slots})
+        days.append({"day_name": day["day_name"], "pairs": pairs})
+
+    shown_groups = [g for g in sem_data["groups"] if wanted is None or g in wanted]
+    return {"week_number": week_obj["week_number"], "groups": shown_groups, "days": days}
+
+
+def process_workbook(source, on_progress=None, should_cancel=None,
+                     executor=None) -> Tuple[int, Dict[str, Any]]:
+    """
+    Весь конвейер /process: тех. валидация -> логика -> генерация. Возвращает (status, body).
+    on_progress/should_cancel — см. generate_schedule_from_excel; дополнительно
+    сообщаются стадии "validated" и "checked".
+    executor — куда отправить CPU-часть (check_and_generate); колбэки тогда
+    должны быть picklable (функции модуля / functools.partial).
+    """
+    with stage_timer("ai"):
+        tech_report = ai_validate_excel(source)
     if tech_report.get("summary", {}).get("errors", 0) > 0:
-        return JSONResponse(
-            status_code=400,
-            content={"ok": False, "stage": "tech_validation_failed", "report": tech_report}
-        )
+        return 400, {"ok": False, "stage": "tech_validation_failed", "report": tech_report}
+    if on_progress is not None:
+        on_progress({"stage": "validated"})
+
+    if executor is None:
+        result, timings = timed_call(check_and_generate, source, on_progress, should_cancel)
+    else:
+        result, timings = executor.submit(timed_call, check_and_generate, source, on_progress, should_cancel).result()
+    _merge_timings(timings)
+    return result
 
-    logic_errors = logic_precheck_full(excel_bytes)
+
+def check_and_generate(source, on_progress=None, should_cancel=None) -> Tuple[int, Dict[str, Any]]:
+    """
+    CPU-часть конвейера (логическая проверка + генерация). Выполняется в пуле процессов.
+    source — путь к загруженному файлу (в пул уходит путь, не байты) или bytes.
+    body["resources"] — пиковая память процесса за запрос; вызывающий забирает её
+    через take_resources() до кэширования ответа.
+    """
+    with PeakRssMeter() as rss:
+        status, body = _check_and_generate(source, on_progress, should_cancel)
+    return status, {**body, "resources": rss.report()}
+
+
+def _check_and_generate(source, on_progress=None, should_cancel=None) -> Tuple[int, Dict[str, Any]]:
+    # книга разбирается один раз: те же листы (с общей таблицей имён) идут и в проверку, и в оптимизатор
+    with stage_timer("parse"):
+        sheets = read_workbook_sheets(source)
+        rules = workbook_rules(sheets)
+    with stage_timer("precheck"):
+        logic_errors = logic_precheck_full(source, sheets, rules)
     if logic_errors:
         logic_report = {
             "summary": {"errors": len(logic_errors), "warnings": 0, "notes": 0},
@@ -1081,32 +2967,1314 @@ async def process(file: UploadFile = File(...)):
             "notes": [],
             "rules_feedback": {"params": [], "hard": [], "soft": [], "issues": [], "suggestions": []},
         }
-        return JSONResponse(
-            status_code=400,
-            content={"ok": False, "stage": "logic_validation_failed", "report": logic_report}
+        return 400, {"ok": False, "stage": "logic_validation_failed", "report": logic_report}
+    if on_progress is not None:
+        on_progress({"stage": "checked"})
+
+    result = generate_schedule_from_excel(None, on_progress=on_progress, should_cancel=should_cancel,
+                                          sheets=sheets, rules=rules)
+
+    # ВАЖНО: вернуть JSON в ответ (а не файл). Файл json_path общий для всех
+    # запросов, поэтому берём payload из результата, а не перечитываем файл.
+    schedule_json = result["payload"]
+
+    return 200, {"ok": True, "stage": "generated", "data": schedule_json,
+                 "warnings": result["warnings"], "stats": result["stats"], "quality": result["quality"]}
+
+
+# ==========================================
+# ПУЛ ПРОЦЕССОВ ДЛЯ CPU-ЗАДАЧ
+# ==========================================
+# Генерация не должна выполняться в event loop: один большой файл иначе
+# замораживает воркер uvicorn для всех клиентов. Запросы сверх
+# CPU_POOL_SIZE + CPU_QUEUE_DEPTH сразу получают 503 с Retry-After.
+CPU_POOL_SIZE = int(os.getenv("SCHEDULE_POOL_SIZE", str(os.cpu_count() or 2)))
+CPU_QUEUE_DEPTH = int(os.getenv("SCHEDULE_QUEUE_DEPTH", str(CPU_POOL_SIZE * 2)))
+RETRY_AFTER_SEC = int(os.getenv("SCHEDULE_RETRY_AFTER_SEC", "30"))
+
+
+class Overloaded(Exception):
+    pass
+
+
+_cpu_pool_instance: Optional[ProcessPoolExecutor] = None
+_cpu_lock = threading.Lock()
+_cpu_slot_freed = threading.Condition(_cpu_lock)
+_cpu_inflight = 0
+
+
+def _cpu_pool() -> ProcessPoolExecutor:
+    global _cpu_pool_instance
+    _wait_warm_up()
+    with _cpu_lock:
+        if _cpu_pool_instance is None:
+            _cpu_pool_instance = ProcessPoolExecutor(max_workers=CPU_POOL_SIZE)
+        return _cpu_pool_instance
+
+
+def _reset_cpu_pool():
+    """Пул ломается, если воркер упал (OOM и т.п.) — создаём заново при следующем запросе."""
+    global _cpu_pool_instance
+    with _cpu_lock:
+        pool, _cpu_pool_instance = _cpu_pool_instance, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+@contextmanager
+def cpu_admission(wait: bool = False):
+    """
+    Место в пуле генерации. Без wait при заполненном пуле — Overloaded (503);
+    wait=True — для фоновых задач: ждут освободившегося места, но считаются в том же лимите.
+    """
+    global _cpu_inflight
+    with _cpu_slot_freed:
+        while _cpu_inflight >= CPU_POOL_SIZE + CPU_QUEUE_DEPTH:
+            if not wait:
+                raise Overloaded()
+            _cpu_slot_freed.wait()
+        _cpu_inflight += 1
+    try:
+        yield
+    finally:
+        with _cpu_slot_freed:
+            _cpu_inflight -= 1
+            _cpu_slot_freed.notify()
+
+
+async def run_cpu(fn, *args):
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_cpu_pool(), fn, *args)
+    except BrokenProcessPool:
+        _reset_cpu_pool()
+        raise
+
+
+_mp_manager_instance = None
+
+
+def _mp_manager():
+    """Менеджер для очередей/событий, которые нужно передать в процесс пула (потоковая выдача)."""
+    global _mp_manager_instance
+    _wait_warm_up()
+    with _cpu_lock:
+        if _mp_manager_instance is None:
+            _mp_manager_instance = multiprocessing.Manager()
+        return _mp_manager_instance
+
+
+def _generate_into_queue(source, events, cancel_event):
+    """
+    Запускается в пуле: события генерации уходят в очередь, None в конце — признак завершения.
+    Возвращает ((status, body), замеры стадий).
+    """
+    try:
+        return timed_call(check_and_generate, source, events.put, cancel_event.is_set)
+    finally:
+        events.put(None)
+
+
+def _overloaded_response():
+    return JSONResponse(
+        status_code=503,
+        content={"ok": False, "stage": "overloaded", "message": "Сервер занят генерацией, повторите запрос позже."},
+        headers={"Retry-After": str(RETRY_AFTER_SEC)},
+    )
+
+
+_ENTITY_INDEX = {"teacher": "teacher_slots", "room": "room_slots", "group": "group_slots"}
+
+
+def entity_timetable(response: Dict[str, Any], index: Dict[str, Any], semester: str,
+                     kind: str, name: str, week: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+    """
+    Расписание преподавателя/аудитории/группы по обратному индексу — без обхода всех слотов.
+    Поток (несколько групп в одной ячейке) схлопывается в одно занятие.
+    """
+    sem_data = response["data"]["semesters"].get(semester)
+    sem_index = index["semesters"].get(semester)
+    if sem_data is None or sem_index is None:
+        return None
+
+    by_week = sem_index[_ENTITY_INDEX[kind]].get(name, {})
+    weeks = [str(week)] if week is not None else sorted(by_week, key=int)
+
+    lessons: Dict[Tuple[int, int, int], Dict[str, Any]] = {}
+    for w in weeks:
+        wi = sem_index["by_week"].get(w)
+        if wi is None:
+            continue
+        week_obj = sem_data["weeks"][wi]
+        for cell in by_week.get(w, []):
+            di, pi = cell[0], cell[1]
+            g = cell[2] if kind != "group" else name
+            day = week_obj["days"][di]
+            pair = day["pairs"][pi]
+            slot = pair["slots"][g]
+            key = (int(w), di, pi)
+            if key not in lessons:
+                lessons[key] = {
+                    "week": int(w),
+                    "day": di + 1,
+                    "day_name": day["day_name"],
+                    "pair": pair["pair"],
+                    "groups": [],
+                    "subject": slot["subject"],
+                    "teacher": slot["teacher"],
+                    "room": slot["room"],
+                    "is_flow": slot["is_flow"],
+                }
+            lessons[key]["groups"].append(g)
+
+    return [lessons[k] for k in sorted(lessons)]
+
+
+def free_rooms_at(index: Dict[str, Any], semester: str, week: int,
+                  day: Optional[int] = None, pair: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+    """Свободные аудитории по битмаскам: на конкретный слот или на все слоты недели."""
+    sem_index = index["semesters"].get(semester)
+    if sem_index is None or str(week) not in sem_index["free_rooms"]:
+        return None
+    rooms = sem_index["rooms"]
+    out = []
+    for di, day_masks in enumerate(sem_index["free_rooms"][str(week)]):
+        if day is not None and di + 1 != day:
+            continue
+        for pi, mask_hex in enumerate(day_masks):
+            if pair is not None and pi + 1 != pair:
+                continue
+            mask = int(mask_hex, 16)
+            out.append({
+                "day": di + 1,
+                "pair": pi + 1,
+                "free_rooms": [r for i, r in enumerate(rooms) if mask >> i & 1],
+            })
+    return out
+
+
+DIFF_MAX_CHANGES = 2000
+
+
+def _same_fingerprint(old: Dict[str, Any], new: Dict[str, Any]) -> bool:
+    return new.get("fingerprint") is not None and old.get("fingerprint") == new["fingerprint"]
+
+
+def _changed_weeks(response: Dict[str, Any], previous: Dict[str, Any]):
+    """
+    (семестр, неделя, прежняя неделя | None, [индексы изменившихся дней]) — по отпечаткам,
+    совпавшие недели не разворачиваются. Результаты без отпечатков считаются изменёнными целиком.
+    """
+    old_semesters = previous["data"]["semesters"]
+    for sem, sem_data in response["data"]["semesters"].items():
+        old_weeks = {w["week_number"]: w for w in old_semesters.get(sem, {}).get("weeks", [])}
+        for week in sem_data["weeks"]:
+            old = old_weeks.get(week["week_number"])
+            if old is not None and _same_fingerprint(old, week):
+                continue
+            old_days = old["days"] if old is not None else []
+            changed = [di for di, day in enumerate(week["days"])
+                       if di >= len(old_days) or not _same_fingerprint(old_days[di], day)]
+            yield sem, week, old, changed
+
+
+def _removed_weeks(response: Dict[str, Any], previous: Dict[str, Any]) -> Dict[str, List[int]]:
+    removed = {}
+    for sem, old_data in previous["data"]["semesters"].items():
+        new_data = response["data"]["semesters"].get(sem)
+        if new_data is None:
+            continue
+        kept = {w["week_number"] for w in new_data["weeks"]}
+        gone = sorted(w["week_number"] for w in old_data["weeks"] if w["week_number"] not in kept)
+        if gone:
+            removed[sem] = gone
+    return removed
+
+
+def schedule_delta(response: Dict[str, Any], summary: Dict[str, Any], previous: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Ответ относительно прежней версии (previous): изменившиеся недели целиком, если в них
+    изменились все дни или неделя новая, иначе — только изменившиеся дни. Сводка семестров
+    (группы, индексы фильтров, отпечатки) передаётся всегда: она маленькая, а недели — нет.
+    """
+    semesters = {
+        sem: {**{k: v for k, v in sem_summary.items() if k != "weeks"}, "weeks": [], "days": [], "removed_weeks": []}
+        for sem, sem_summary in summary["data"]["semesters"].items()
+    }
+    for sem, week, old, changed in _changed_weeks(response, previous):
+        if old is None or len(old["days"]) != len(week["days"]) or len(changed) == len(week["days"]):
+            semesters[sem]["weeks"].append(week)
+            continue
+        for di in changed:
+            semesters[sem]["days"].append({"week_number": week["week_number"], "week_fingerprint": week["fingerprint"],
+                                           "day_index": di, "day": week["days"][di]})
+    for sem, gone in _removed_weeks(response, previous).items():
+        semesters[sem]["removed_weeks"] = gone
+
+    return {
+        "ok": True,
+        "schedule_id": response["schedule_id"],
+        "since": previous["schedule_id"],
+        "warnings": response["warnings"],
+        "stats": response.get("stats", {}),
+        "semesters": semesters,
+        "removed_semesters": sorted(set(previous["data"]["semesters"]) - set(response["data"]["semesters"])),
+    }
+
+
+def schedule_diff(response: Dict[str, Any], previous: Dict[str, Any], limit: int = DIFF_MAX_CHANGES) -> Dict[str, Any]:
+    """Что изменилось по ячейкам: до limit записей {semester, week, day, pair, group, before, after}."""
+    changes = []
+    total = 0
+    weeks_changed = set()
+    for sem, week, old, changed in _changed_weeks(response, previous):
+        for di in changed:
+            day = week["days"][di]
+            old_day = old["days"][di] if old is not None and di < len(old["days"]) else {"pairs": []}
+            old_pairs = {pair["pair"]: pair["slots"] for pair in old_day["pairs"]}
+            for pair in day["pairs"]:
+                before_slots = old_pairs.get(pair["pair"], {})
+                for g in sorted(set(pair["slots"]) | set(before_slots)):
+                    before, after = before_slots.get(g), pair["slots"].get(g)
+                    if before == after:
+                        continue
+                    total += 1
+                    weeks_changed.add((sem, week["week_number"]))
+                    if len(changes) < limit:
+                        changes.append({"semester": sem, "week": week["week_number"], "day": di + 1,
+                                        "day_name": day["day_name"], "pair": pair["pair"], "group": g,
+                                        "before": before, "after": after})
+    return {
+        "ok": True,
+        "schedule_id": response["schedule_id"],
+        "since": previous["schedule_id"],
+        "total": total,
+        "weeks_changed": len(weeks_changed),
+        "truncated": total > len(changes),
+        "changes": changes,
+        "removed_weeks": _removed_weeks(response, previous),
+    }
+
+
+# ==========================================
+# ЭКСПОРТ: ФАЙЛ НА КАЖДУЮ ГРУППУ / ПРЕПОДАВАТЕЛЯ
+# ==========================================
+# Файлы строятся по одному (генератор) по обратным индексам сохранённого результата
+# и сразу пишутся в zip, который уходит клиенту кусками: в памяти — один файл, а не архив.
+EXPORT_FORMATS = ("ics", "xlsx")
+EXPORT_KINDS = {"group": "groups", "teacher": "teachers"}
+# время пар (как в ScheduleTable на фронте); дальше пятой — с тем же шагом
+PAIR_TIMES = ((8 * 60, 9 * 60 + 30), (9 * 60 + 45, 11 * 60 + 15), (11 * 60 + 30, 13 * 60),
+              (13 * 60 + 30, 15 * 60), (15 * 60 + 15, 16 * 60 + 45))
+PAIR_STEP_MINUTES = 105
+
+
+def pair_time(pair: int) -> Tuple[int, int]:
+    """(начало, конец) пары в минутах от полуночи."""
+    if pair <= len(PAIR_TIMES):
+        return PAIR_TIMES[pair - 1]
+    start = PAIR_TIMES[-1][0] + (pair - len(PAIR_TIMES)) * PAIR_STEP_MINUTES
+    return start, start + 90
+
+
+def parse_export_starts(start: Optional[str], semesters: List[str]) -> Dict[str, date]:
+    """
+    Понедельник первой недели для ICS: "2026-09-07" — для всех семестров,
+    "1:2026-09-07,2:2027-01-11" — по семестрам. Без даты — понедельник текущей недели.
+    """
+    today = date.today()
+    default = today - timedelta(days=today.weekday())
+    starts = dict.fromkeys(semesters, default)
+    for part in (start or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        sem, _, value = part.rpartition(":")
+        day = date.fromisoformat(value)
+        if sem:
+            starts[sem] = day
+        else:
+            starts = dict.fromkeys(semesters, day)
+    return starts
+
+
+def _ics_text(value: str) -> str:
+    return value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _ics_fold(line: str) -> str:
+    """RFC 5545: строки не длиннее 75 октетов, продолжение — с пробела (UTF-8 не режем посреди символа)."""
+    raw = line.encode("utf-8")
+    if len(raw) <= 75:
+        return line
+    parts, limit = [], 75
+    while len(raw) > limit:
+        cut = limit
+        while raw[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(raw[:cut])
+        raw, limit = raw[cut:], 74
+    parts.append(raw)
+    return b"\r\n ".join(parts).decode("utf-8")
+
+
+def timetable_ics(title: str, lessons: List[Dict[str, Any]], week1: date, uid_prefix: str) -> bytes:
+    """Календарь занятий; время «плавающее» (локальное время колледжа, без TZID)."""
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//Schedule Generator//RU", "CALSCALE:GREGORIAN",
+             f"X-WR-CALNAME:{_ics_text(title)}"]
+    for lesson in lessons:
+        day = week1 + timedelta(weeks=lesson["week"] - 1, days=lesson["day"] - 1)
+        begin, end = pair_time(lesson["pair"])
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:{uid_prefix}-{lesson['week']}-{lesson['day']}-{lesson['pair']}@schedule",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART:{day:%Y%m%d}T{begin // 60:02d}{begin % 60:02d}00",
+            f"DTEND:{day:%Y%m%d}T{end // 60:02d}{end % 60:02d}00",
+            f"SUMMARY:{_ics_text(lesson['subject'])}",
+            f"LOCATION:{_ics_text(lesson['room'])}",
+            f"DESCRIPTION:{_ics_text(lesson['teacher'] + ' — ' + ', '.join(lesson['groups']))}",
+            "END:VEVENT",
+        ]
+    lines.append("END:VCALENDAR")
+    return ("\r\n".join(_ics_fold(line) for line in lines) + "\r\n").encode("utf-8")
+
+
+def timetable_xlsx(lessons: List[Dict[str, Any]]) -> bytes:
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Расписание")
+    ws.append(["Неделя", "День", "Пара", "Время", "Дисциплина", "Преподаватель", "Группы", "Аудитория"])
+    for lesson in lessons:
+        begin, end = pair_time(lesson["pair"])
+        ws.append([lesson["week"], lesson["day_name"], lesson["pair"],
+                   f"{begin // 60}:{begin % 60:02d} - {end // 60}:{end % 60:02d}",
+                   lesson["subject"], lesson["teacher"], ", ".join(lesson["groups"]), lesson["room"]])
+    buf = BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def _export_name(name: str) -> str:
+    """Имя файла в архиве: без разделителей пути и управляющих символов."""
+    cleaned = "".join("_" if ch in '\\/:*?"<>|' or ord(ch) < 32 else ch for ch in name).strip(" .")
+    return cleaned or "_"
+
+
+def export_files(schedule_id: str, response: Dict[str, Any], index: Dict[str, Any], semesters: List[str],
+                 kinds: List[str], formats: List[str], starts: Dict[str, date]) -> Iterator[Tuple[str, bytes]]:
+    """(путь в архиве, содержимое) — по одному файлу на (семестр, группа/преподаватель, формат)."""
+    for sem in semesters:
+        sem_index = index["semesters"][sem]
+        for kind in kinds:
+            folder = EXPORT_KINDS[kind]
+            names = sorted(sem_index[_ENTITY_INDEX[kind]])
+            for name in names:
+                lessons = entity_timetable(response, index, sem, kind, name)
+                base = f"semester_{sem}/{folder}/{_export_name(name)}"
+                if "ics" in formats:
+                    uid = f"{schedule_id[:16]}-{sem}-{kind}-{hashlib.sha256(name.encode('utf-8')).hexdigest()[:8]}"
+                    yield f"{base}.ics", timetable_ics(f"{name} — семестр {sem}", lessons, starts[sem], uid)
+                if "xlsx" in formats:
+                    yield f"{base}.xlsx", timetable_xlsx(lessons)
+
+
+class _ZipSink:
+    """Файловый объект без seek для zipfile: записанное забирается drain() и уходит в ответ."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def stream_zip(files: Iterator[Tuple[str, bytes]]) -> Iterator[bytes]:
+    """Zip по мере готовности файлов: после каждого файла отдаём всё, что накопилось в приёмнике."""
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for path, content in files:
+            zf.writestr(path, content)
+            yield sink.drain()
+    yield sink.drain()
+
+
+# ==========================================
+# ФОНОВЫЕ ЗАДАЧИ ГЕНЕРАЦИИ
+# ==========================================
+# Состояние задач хранится в SQLite, загруженные файлы — рядом на диске,
+# поэтому после перезапуска воркера незавершённые задачи ставятся в очередь заново.
+# База общая для всех воркеров uvicorn: running-задача принадлежит запуску (owner) и,
+# пока он жив, раз в JOB_HEARTBEAT_SEC обновляет heartbeat_at. Заново в очередь ставятся
+# только задачи, чей heartbeat старше JOB_STALE_SEC, — чужие живые генерации не трогаем.
+JOBS_DIR = Path(os.getenv("SCHEDULE_JOBS_DIR", ".schedule_jobs"))
+JOB_WORKERS = int(os.getenv("SCHEDULE_JOB_WORKERS", "2"))
+JOB_ACTIVE_STATUSES = ("queued", "running")
+JOB_HEARTBEAT_SEC = float(os.getenv("SCHEDULE_JOB_HEARTBEAT_SEC", "10"))
+JOB_STALE_SEC = float(os.getenv("SCHEDULE_JOB_STALE_SEC", "60"))
+
+_job_pool_instance: Optional[ThreadPoolExecutor] = None
+
+
+def _job_pool() -> ThreadPoolExecutor:
+    global _job_pool_instance
+    if _job_pool_instance is None:
+        _job_pool_instance = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="schedule-job")
+    return _job_pool_instance
+
+
+def _jobs_db() -> sqlite3.Connection:
+    JOBS_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(JOBS_DIR / "jobs.db", timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id          TEXT PRIMARY KEY,
+            status      TEXT NOT NULL,
+            stage       TEXT,
+            done        INTEGER NOT NULL DEFAULT 0,
+            total       INTEGER NOT NULL DEFAULT 0,
+            file_hash   TEXT NOT NULL,
+            upload_path TEXT,
+            result_id   TEXT,
+            http_status INTEGER,
+            error_body  TEXT,
+            created_at  REAL NOT NULL,
+            updated_at  REAL NOT NULL,
+            owner       TEXT,
+            heartbeat_at REAL
+        )
+    """)
+    # база, созданная до появления владельца задачи
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+    for column, decl in (("owner", "TEXT"), ("heartbeat_at", "REAL")):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {decl}")
+    return conn
+
+
+def _job_update(job_id: str, **fields):
+    fields["updated_at"] = time.time()
+    cols = ", ".join(f"{k} = ?" for k in fields)
+    with closing(_jobs_db()) as conn, conn:
+        conn.execute(f"UPDATE jobs SET {cols} WHERE id = ?", (*fields.values(), job_id))
+
+
+def _job_transition(job_id: str, expected: str, held_by: Optional[str] = None, **fields) -> bool:
+    """
+    Как _job_update, но только из статуса expected: отмена, успевшая раньше, не перетирается.
+    held_by — ещё и только пока задачей владеет этот запуск (её не переставили в очередь).
+    """
+    fields["updated_at"] = time.time()
+    cols = ", ".join(f"{k} = ?" for k in fields)
+    where, params = "id = ? AND status = ?", [job_id, expected]
+    if held_by is not None:
+        where, params = where + " AND owner = ?", params + [held_by]
+    with closing(_jobs_db()) as conn, conn:
+        cur = conn.execute(f"UPDATE jobs SET {cols} WHERE {where}", (*fields.values(), *params))
+    return cur.rowcount == 1
+
+
+def _job_heartbeat(job_id: str, owner: str, stop: threading.Event):
+    """Поток при running-задаче: пока воркер жив, задача не считается брошенной (_resume_jobs)."""
+    while not stop.wait(JOB_HEARTBEAT_SEC):
+        with closing(_jobs_db()) as conn, conn:
+            conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND owner = ?", (time.time(), job_id, owner))
+
+
+def job_get(job_id: str) -> Optional[Dict[str, Any]]:
+    with closing(_jobs_db()) as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def job_public(job: Dict[str, Any]) -> Dict[str, Any]:
+    total = job["total"] or 0
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": round(job["done"] / total, 4) if total else (1.0 if job["status"] == "done" else 0.0),
+        "weeks_done": job["done"],
+        "weeks_total": total,
+        "schedule_id": job["result_id"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+
+def job_submit(upload: SpooledUpload) -> Dict[str, Any]:
+    """Файл загрузки переносится в JOBS_DIR (переживает рестарт); upload.discard() после — безопасен."""
+    file_hash = upload.sha256
+    job_id = uuid.uuid4().hex
+    now = time.time()
+
+    # готовый результат уже есть — задача сразу завершена
+    key = result_cache_key(file_hash)
+    if result_cache_get(key, "summary") is not None:
+        with closing(_jobs_db()) as conn, conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, stage, file_hash, result_id, http_status, created_at, updated_at)"
+                " VALUES (?, 'done', 'generated', ?, ?, 200, ?, ?)",
+                (job_id, file_hash, key, now, now),
+            )
+        return job_get(job_id)
+
+    # подсчёт и вставка — одна транзакция с блокировкой на запись: одновременные
+    # запросы не проскочат лимит, посчитав одно и то же число активных задач
+    upload_path = JOBS_DIR / f"{job_id}.xlsx"
+    with closing(_jobs_db()) as conn, conn:
+        conn.execute("BEGIN IMMEDIATE")
+        active = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", JOB_ACTIVE_STATUSES
+        ).fetchone()[0]
+        if active >= JOB_WORKERS + CPU_QUEUE_DEPTH:
+            raise Overloaded()
+        conn.execute(
+            "INSERT INTO jobs (id, status, stage, file_hash, upload_path, created_at, updated_at)"
+            " VALUES (?, 'queued', NULL, ?, ?, ?, ?)",
+            (job_id, file_hash, str(upload_path), now, now),
         )
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp_xlsx:
-        tmp_xlsx.write(excel_bytes)
-        tmp_path = tmp_xlsx.name
+    try:
+        shutil.move(upload.path, upload_path)
+    except OSError as e:
+        _job_update(job_id, status="failed", stage="error", http_status=500,
+                    error_body=json.dumps({"ok": False, "stage": "error", "message": str(e)}, ensure_ascii=False))
+        raise
+    _job_pool().submit(_run_job, job_id)
+    return job_get(job_id)
+
+
+def job_cancel(job_id: str) -> Optional[Dict[str, Any]]:
+    """Отмена: queued — сразу, running — воркер заметит между неделями."""
+    with closing(_jobs_db()) as conn, conn:
+        conn.execute(
+            "UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE id = ? AND status IN (?, ?)",
+            (time.time(), job_id, *JOB_ACTIVE_STATUSES),
+        )
+    return job_get(job_id)
+
+
+def _job_is_cancelled(job_id: str, owner: str) -> bool:
+    """Отменена — или переставлена в очередь и отдана другому запуску: этот генерировать перестаёт."""
+    job = job_get(job_id)
+    return job is None or job["status"] == "cancelled" or job["owner"] != owner
+
+
+def _job_on_progress(job_id: str, owner: str, event: Dict[str, Any]):
+    if event["stage"] == "week_done":
+        _job_transition(job_id, "running", owner, stage="generating", done=event["done"], total=event["total"])
+    else:
+        _job_transition(job_id, "running", owner, stage=event["stage"])
+
+
+def _run_job(job_id: str):
+    job = job_get(job_id)
+    if job is None:
+        return
+    owner = f"{os.getpid()}-{uuid.uuid4().hex}"
+    if not _job_transition(job_id, "queued", status="running", stage="started",
+                           owner=owner, heartbeat_at=time.time()):
+        # отменили, пока задача ждала в очереди (в том числе между job_get и этим переходом),
+        # или её уже взял другой воркер — тогда файл загрузки нужен ему
+        job = job_get(job_id)
+        if job is not None and job["status"] == "cancelled" and job["upload_path"]:
+            Path(job["upload_path"]).unlink(missing_ok=True)
+        return
+
+    upload_path = Path(job["upload_path"])
+    heartbeat_stop = threading.Event()
+    threading.Thread(target=_job_heartbeat, args=(job_id, owner, heartbeat_stop), daemon=True).start()
+    try:
+        # колбэки — partial от функций модуля: их можно передать в процесс пула,
+        # а состояние задачи всё равно общее через SQLite.
+        # Задача занимает место в пуле так же, как /process: иначе её генерации не видны
+        # лимиту CPU_POOL_SIZE + CPU_QUEUE_DEPTH, и синхронные запросы проходят сверх него
+        with cpu_admission(wait=True):
+            (status, content), timings = timed_call(
+                process_workbook,
+                str(upload_path),
+                partial(_job_on_progress, job_id, owner),
+                partial(_job_is_cancelled, job_id, owner),
+                _cpu_pool(),
+            )
+        observe_stages(timings)
+        take_resources(content)
+        if status == 200:
+            key = result_cache_key(job["file_hash"])
+            # результат в кэше в любом случае; статус — только если задачу не отменили после последней проверки
+            result_cache_put(key, content)
+            _job_transition(job_id, "running", owner, status="done", stage="generated", result_id=key, http_status=200)
+        else:
+            _job_transition(job_id, "running", owner, status="failed", stage=content.get("stage"), http_status=status,
+                            error_body=json.dumps(content, ensure_ascii=False))
+    except GenerationCancelled:
+        _job_transition(job_id, "running", owner, status="cancelled")
+    except BrokenProcessPool:
+        _reset_cpu_pool()
+        _job_transition(job_id, "running", owner, status="failed", stage="error", http_status=500,
+                        error_body=json.dumps({"ok": False, "stage": "error", "message": "Процесс генерации аварийно завершился"}, ensure_ascii=False))
+    except Exception as e:
+        _job_transition(job_id, "running", owner, status="failed", stage="error", http_status=500,
+                        error_body=json.dumps({"ok": False, "stage": "error", "message": str(e)}, ensure_ascii=False))
+    finally:
+        heartbeat_stop.set()
+        # задачу переставили в очередь (этот запуск сочли брошенным) — файл нужен новому запуску
+        job = job_get(job_id)
+        if job is None or job["status"] not in JOB_ACTIVE_STATUSES:
+            upload_path.unlink(missing_ok=True)
+
+
+def _requeue_stale_jobs() -> List[str]:
+    """running-задачи без heartbeat дольше JOB_STALE_SEC: их воркер умер — снова в очередь."""
+    now = time.time()
+    with closing(_jobs_db()) as conn, conn:
+        rows = conn.execute(
+            "UPDATE jobs SET status = 'queued', owner = NULL, updated_at = ?"
+            " WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?) RETURNING id",
+            (now, now - JOB_STALE_SEC),
+        ).fetchall()
+    return [r["id"] for r in rows]
+
+
+def _resume_jobs():
+    """
+    Старт воркера: брошенные running-задачи — в очередь, и все queued — в пул этого воркера.
+    Задачу, которую успел взять другой воркер, _run_job пропустит (переход из queued условный).
+    """
+    _requeue_stale_jobs()
+    with closing(_jobs_db()) as conn:
+        ids = [r["id"] for r in conn.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at")]
+    for job_id in ids:
+        _job_pool().submit(_run_job, job_id)
+
+
+async def _watch_stale_jobs():
+    """Воркер, упавший посреди генерации, не перезапустит её сам — подбирают живые."""
+    while True:
+        await asyncio.sleep(JOB_STALE_SEC)
+        for job_id in await run_in_threadpool(_requeue_stale_jobs):
+            _job_pool().submit(_run_job, job_id)
+
+
+WARMUP_ON_START = os.getenv("SCHEDULE_WARMUP", "1") == "1"
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    if WARMUP_ON_START:
+        # в фоне: /health отвечает сразу, первый /process уже не платит за импорты
+        start_warm_up()
+    _resume_jobs()
+    stale_watch = asyncio.create_task(_watch_stale_jobs())
+    yield
+    stale_watch.cancel()
+    if _job_pool_instance is not None:
+        _job_pool_instance.shutdown(wait=False, cancel_futures=True)
+    _reset_cpu_pool()
+    if _mp_manager_instance is not None:
+        _mp_manager_instance.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# порядок: последняя добавленная — внешняя; лимит внутри CORS, чтобы у 413 были CORS-заголовки
+app.add_middleware(UploadLimitMiddleware)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Schedule-Cache", "X-Schedule-Profile", "X-Schedule-Memory"],
+)
+app.add_middleware(ServerTimingMiddleware)
+
+
+@app.get("/health")
+def health():
+    """Дешёвая проверка живости: не трогает pandas/openpyxl/openai и диск."""
+    return {"ok": True, "warm": _warm.is_set()}
+
+
+@app.get("/version")
+def version():
+    """Версия результата: клиент строит из неё и sha256 файла schedule_id и ищет расписание у себя в кэше."""
+    return {"ok": True, "optimizer_version": optimizer_version()}
+
+
+@app.get("/metrics")
+def metrics():
+    lines: List[str] = []
+    for metric in (STAGE_SECONDS, HTTP_SECONDS, WORKBOOK_BYTES, PEAK_RSS_BYTES, RSS_GROWTH_BYTES,
+                   AI_CACHE_LOOKUPS, RESULT_CACHE_LOOKUPS):
+        lines.extend(metric.render())
+
+    ai_total = sum(AI_CACHE_LOOKUPS.value(r) for r in ("hit", "miss", "local"))
+    lines += ["# HELP schedule_ai_cache_hit_ratio Доля попаданий в кэш AI-валидации",
+              "# TYPE schedule_ai_cache_hit_ratio gauge",
+              f"schedule_ai_cache_hit_ratio {AI_CACHE_LOOKUPS.value('hit') / ai_total if ai_total else 0.0}"]
 
+    lines += ["# HELP schedule_cpu_inflight Запросы, занявшие место в пуле генерации (выполняются + ждут)",
+              "# TYPE schedule_cpu_inflight gauge",
+              f"schedule_cpu_inflight {_cpu_inflight}",
+              "# HELP schedule_cpu_capacity Предел schedule_cpu_inflight, после которого отдаётся 503",
+              "# TYPE schedule_cpu_capacity gauge",
+              f"schedule_cpu_capacity {CPU_POOL_SIZE + CPU_QUEUE_DEPTH}"]
+
+    with closing(_jobs_db()) as conn:
+        by_status = dict(conn.execute(
+            "SELECT status, COUNT(*) FROM jobs WHERE status IN (?, ?) GROUP BY status", JOB_ACTIVE_STATUSES
+        ).fetchall())
+    lines += ["# HELP schedule_jobs Фоновые задачи по статусам", "# TYPE schedule_jobs gauge"]
+    lines += [f'schedule_jobs{{status="{st}"}} {by_status.get(st, 0)}' for st in JOB_ACTIVE_STATUSES]
+
+    return Response(content="\n".join(lines) + "\n", media_type="text/plain; version=0.0.4; charset=utf-8")
+@app.post("/process")
+async def process(file: UploadFile = File(...), lean: bool = False, profile: bool = False):
+    """
+    lean=true — вернуть только сводку (без недель); недели берутся через /schedules/...
+    profile=true — генерация идёт под профайлером даже при готовом результате в кэше;
+    id профиля — в заголовке X-Schedule-Profile, сам профиль — GET /profiles/{id}.
+    """
+    timings: Dict[str, float] = {}
+    try:
+        with stage_timer("upload", timings):
+            upload = await spool_upload(file)
+    except UploadTooLarge:
+        return _upload_too_large_response()
+    WORKBOOK_BYTES.observe(upload.size)
     try:
-        result = generate_schedule_from_excel(tmp_path)
+        return await _process_upload(upload, lean, profile, timings)
+    finally:
+        upload.discard()
+
+
+async def _process_upload(upload: SpooledUpload, lean: bool, profile: bool, timings: Dict[str, float]):
+    part = "summary" if lean else "response"
 
-        # ВАЖНО: вернуть JSON в ответ (а не файл)
-        json_path = result["json_path"]
-        with open(json_path, "r", encoding="utf-8") as f:
-            schedule_json = json.load(f)
+    # повторная загрузка того же файла — отдаём готовый ответ без генерации
+    with stage_timer("cache", timings):
+        cache_key = result_cache_key(upload.sha256)
+        cached = result_cache_get(cache_key, part)
+    RESULT_CACHE_LOOKUPS.inc("hit" if cached is not None else "miss")
+    if cached is not None and not profile:
+        return _with_timings(
+            Response(content=cached, media_type="application/json", headers={"X-Schedule-Cache": "hit"}), timings
+        )
 
+    try:
+        with cpu_admission():
+            # AI-валидация — сетевой вызов, держим в потоке; логика и генерация — в пуле процессов
+            with stage_timer("ai", timings):
+                tech_report = await run_in_threadpool(ai_validate_excel, upload.path, upload.sha256)
+            if tech_report.get("summary", {}).get("errors", 0) > 0:
+                return _with_timings(JSONResponse(
+                    status_code=400,
+                    content={"ok": False, "stage": "tech_validation_failed", "report": tech_report}
+                ), timings)
+            generate = check_and_generate_profiled if profile else check_and_generate
+            (status, content), cpu_timings = await run_cpu(timed_call, generate, upload.path)
+            timings.update(cpu_timings)
+    except Overloaded:
+        return _overloaded_response()
+
+    headers = {"X-Schedule-Cache": "miss"}
+    profile_id = content.pop("profile_id", None)
+    if profile_id:
+        headers["X-Schedule-Profile"] = profile_id
+    resources = take_resources(content)
+    if resources:
+        headers["X-Schedule-Memory"] = resources_header(resources)
+
+    if status != 200:
+        return _with_timings(JSONResponse(status_code=status, content=content, headers=headers), timings)
+
+    with stage_timer("serialize", timings):
+        body = await run_in_threadpool(result_cache_put, cache_key, content)
+        if lean:
+            body = result_cache_get(cache_key, "summary")
+    return _with_timings(Response(content=body, media_type="application/json", headers=headers), timings)
+
+
+@app.get("/profiles/{profile_id}")
+def get_profile(profile_id: str):
+    path = _profile_path(profile_id)
+    if not profile_id.isalnum() or not path.exists():
         return JSONResponse(
-            status_code=200,
-            content={"ok": True, "stage": "generated", "data": schedule_json, "warnings": result["warnings"]}
+            status_code=404,
+            content={"ok": False, "stage": "not_found", "message": f"Профиль '{profile_id}' не найден."}
         )
+    return FileResponse(path, media_type="text/plain; charset=utf-8", filename=f"profile_{profile_id}.folded")
+
+
+def _ndjson(event: Dict[str, Any]) -> bytes:
+    return (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _stream_stored(cache_key: str):
+    """Повтор уже готового результата в том же формате событий, что и живая генерация."""
+    response, _ = load_stored_result(cache_key)
+    summary = json.loads(result_cache_get(cache_key, "summary"))
+    for sem, sem_data in response["data"]["semesters"].items():
+        meta = {k: v for k, v in summary["data"]["semesters"][sem].items() if k != "weeks"}
+        yield _ndjson({"event": "semester_started", "semester": sem, **meta})
+        for week in sem_data["weeks"]:
+            yield _ndjson({"event": "week_done", "semester": sem, "week": week["week_number"], "week_data": week})
+    yield _ndjson({"event": "done", "schedule_id": cache_key, "cache": "hit", "warnings": response["warnings"],
+                   "stats": response.get("stats", {}), "quality": response.get("quality", {}), "summary": summary["data"]})
+
+
+async def _stream_generation(upload: SpooledUpload, cache_key: str, admission: ExitStack):
+    """Заголовки уже ушли, поэтому замеры стадий отдаются в событии done (поле timings)."""
+    timings: Dict[str, float] = {}
+    manager = _mp_manager()
+    events = manager.Queue()
+    cancel_event = manager.Event()
+    future = None
+    try:
+        yield _ndjson({"event": "received"})
+
+        with stage_timer("ai", timings):
+            tech_report = await run_in_threadpool(ai_validate_excel, upload.path, upload.sha256)
+        if tech_report.get("summary", {}).get("errors", 0) > 0:
+            yield _ndjson({"event": "error", "status": 400,
+                           "body": {"ok": False, "stage": "tech_validation_failed", "report": tech_report}})
+            return
+        yield _ndjson({"event": "validated"})
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(_cpu_pool(), _generate_into_queue, upload.path, events, cancel_event)
+        while True:
+            event = await run_in_threadpool(events.get)
+            if event is None:
+                break
+            stage = event.pop("stage")
+            yield _ndjson({"event": stage, **event})
+
+        (status, content), cpu_timings = await future
+        timings.update(cpu_timings)
+        resources = take_resources(content)
+        if status != 200:
+            yield _ndjson({"event": "error", "status": status, "body": content})
+            return
+
+        with stage_timer("serialize", timings):
+            await run_in_threadpool(result_cache_put, cache_key, content)
+            summary = json.loads(result_cache_get(cache_key, "summary"))
+        yield _ndjson({"event": "done", "schedule_id": cache_key, "cache": "miss",
+                       "warnings": content["warnings"], "stats": content["stats"], "quality": content["quality"],
+                       "summary": summary["data"],
+                       "timings": {k: round(v, 4) for k, v in timings.items()}, "resources": resources})
+    except BrokenProcessPool:
+        _reset_cpu_pool()
+        yield _ndjson({"event": "error", "status": 500,
+                       "body": {"ok": False, "stage": "error", "message": "Процесс генерации аварийно завершился"}})
+    except Exception as e:
+        # иначе поток просто обрывается: клиент не узнает ни статуса, ни причины
+        yield _ndjson({"event": "error", "status": 500, "body": {"ok": False, "stage": "error", "message": str(e)}})
     finally:
+        # клиент отключился или всё закончилось — генерацию в пуле можно бросать
+        cancel_event.set()
+        if future is not None and not future.done():
+            future.add_done_callback(lambda f: f.exception())  # GenerationCancelled никому не нужен
+        observe_stages(timings)
+        admission.close()
+        upload.discard()
+
+
+@app.post("/process/stream")
+async def process_stream(file: UploadFile = File(...)):
+    """
+    Потоковый вариант /process (NDJSON, одно событие на строку):
+      received -> validated -> checked -> (semester_started -> week_done × N)... -> done
+    Каждое week_done несёт week_data — готовую неделю, её можно сразу показывать.
+    Ошибки валидации приходят событием error со status и телом как у /process.
+    """
+    try:
+        upload = await spool_upload(file)
+    except UploadTooLarge:
+        return _upload_too_large_response()
+    WORKBOOK_BYTES.observe(upload.size)
+    cache_key = result_cache_key(upload.sha256)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+    cached = result_cache_get(cache_key, "summary") is not None
+    RESULT_CACHE_LOOKUPS.inc("hit" if cached else "miss")
+    if cached:
+        upload.discard()
+        return StreamingResponse(_stream_stored(cache_key), media_type="application/x-ndjson", headers=headers)
+
+    admission = ExitStack()
+    try:
+        admission.enter_context(cpu_admission())
+    except Overloaded:
+        upload.discard()
+        return _overloaded_response()
+    return StreamingResponse(
+        _stream_generation(upload, cache_key, admission),
+        media_type="application/x-ndjson",
+        headers=headers,
+    )
+
+
+# ==========================================
+# ПАКЕТНАЯ ОБРАБОТКА: МНОГО КНИГ ЗА ОДИН ЗАПРОС
+# ==========================================
+# Книги (по кафедрам) обрабатываются параллельно: AI-валидация всех книг идёт сразу
+# (это сетевое ожидание), а генерация — не больше BATCH_CONCURRENCY книг одновременно
+# в общем пуле процессов. Одинаковые файлы (по sha256) обрабатываются один раз.
+BATCH_CONCURRENCY = int(os.getenv("SCHEDULE_BATCH_CONCURRENCY", str(CPU_POOL_SIZE)))
+MAX_BATCH_WORKBOOKS = int(os.getenv("SCHEDULE_MAX_BATCH_WORKBOOKS", "100"))
+BATCH_ADMISSION_POLL_SEC = 0.5
+
+
+async def _batch_admission(stack: ExitStack):
+    """Пакет не получает 503 — его книги ждут свободного места в очереди пула."""
+    while True:
         try:
-            os.remove(tmp_path)
-        except:
-            pass
+            stack.enter_context(cpu_admission())
+            return
+        except Overloaded:
+            await asyncio.sleep(BATCH_ADMISSION_POLL_SEC)
+
+
+async def _batch_workbook(upload: SpooledUpload, names: List[str], slots: asyncio.Semaphore) -> Dict[str, Any]:
+    """Одна книга пакета: как /process?lean=true, результат — событие workbook."""
+    timings: Dict[str, float] = {}
+    cache_key = result_cache_key(upload.sha256)
+    event = {"event": "workbook", "names": names, "sha256": upload.sha256}
+    try:
+        cached = result_cache_get(cache_key, "summary")
+        RESULT_CACHE_LOOKUPS.inc("hit" if cached is not None else "miss")
+        if cached is not None:
+            return {**event, "status": 200, "cache": "hit", "body": json.loads(cached)}
+
+        with stage_timer("ai", timings):
+            tech_report = await run_in_threadpool(ai_validate_excel, upload.path, upload.sha256)
+        if tech_report.get("summary", {}).get("errors", 0) > 0:
+            return {**event, "status": 400,
+                    "body": {"ok": False, "stage": "tech_validation_failed", "report": tech_report}}
+
+        async with slots:
+            with ExitStack() as admission:
+                await _batch_admission(admission)
+                (status, content), cpu_timings = await run_cpu(timed_call, check_and_generate, upload.path)
+        timings.update(cpu_timings)
+        resources = take_resources(content)
+        if status != 200:
+            return {**event, "status": status, "body": content}
+
+        with stage_timer("serialize", timings):
+            await run_in_threadpool(result_cache_put, cache_key, content)
+            summary = json.loads(result_cache_get(cache_key, "summary"))
+        return {**event, "status": 200, "cache": "miss", "body": summary,
+                "timings": {k: round(v, 4) for k, v in timings.items()}, "resources": resources}
+    except BrokenProcessPool:
+        return {**event, "status": 500,
+                "body": {"ok": False, "stage": "error", "message": "Процесс генерации аварийно завершился"}}
+    except Exception as e:
+        return {**event, "status": 500, "body": {"ok": False, "stage": "error", "message": str(e)}}
+    finally:
+        observe_stages(timings)
+        upload.discard()
+
+
+async def _stream_batch(uploads: "OrderedDict[str, Tuple[SpooledUpload, List[str]]]", rejected: List[Dict[str, Any]]):
+    started = time.perf_counter()
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+    tasks = [asyncio.ensure_future(_batch_workbook(upload, names, slots)) for upload, names in uploads.values()]
+    failed = len(rejected)
+    try:
+        yield _ndjson({"event": "received", "workbooks": sum(len(names) for _, names in uploads.values()) + len(rejected),
+                       "unique": len(uploads)})
+        for event in rejected:
+            yield _ndjson(event)
+        for next_done in asyncio.as_completed(tasks):
+            event = await next_done
+            failed += event["status"] != 200
+            yield _ndjson(event)
+        yield _ndjson({"event": "done", "processed": len(uploads) + len(rejected), "failed": failed,
+                       "timings": {"batch": round(time.perf_counter() - started, 4)}})
+    finally:
+        # клиент отключился — оставшиеся книги не нужны; неначатые задачи файлы сами не удалят
+        for task in tasks:
+            task.cancel()
+        for upload, _ in uploads.values():
+            upload.discard()
+
+
+@app.post("/process/batch")
+async def process_batch(files: List[UploadFile] = File(...)):
+    """
+    Много книг за один запрос: несколько файлов и/или zip-архивы с .xlsx.
+    Ответ — NDJSON: received -> workbook × N (в порядке готовности) -> done.
+    workbook: names (все имена файлов с этим содержимым), sha256, status и body —
+    как у /process?lean=true (недели — через /schedules/{body.schedule_id}/...).
+    """
+    uploads: "OrderedDict[str, Tuple[SpooledUpload, List[str]]]" = OrderedDict()
+    rejected: List[Dict[str, Any]] = []
+    total = 0
+
+    def add(name: str, item):
+        nonlocal total
+        total += 1
+        if not isinstance(item, SpooledUpload):
+            status, body = item
+            rejected.append({"event": "workbook", "names": [name], "status": status, "body": body})
+        elif item.sha256 in uploads:
+            item.discard()
+            uploads[item.sha256][1].append(name)
+        else:
+            WORKBOOK_BYTES.observe(item.size)
+            uploads[item.sha256] = (item, [name])
+
+    try:
+        for file in files:
+            name = file.filename or "workbook.xlsx"
+            try:
+                upload = await spool_upload(file, MAX_BATCH_BYTES)
+            except UploadTooLarge:
+                add(name, (413, _upload_too_large_body(MAX_BATCH_BYTES)))
+                continue
+            if await run_in_threadpool(is_workbook_archive, upload.path):
+                try:
+                    members = await run_in_threadpool(unpack_workbooks, upload.path)
+                finally:
+                    upload.discard()
+                for member, item in members:
+                    add(f"{name}/{member}", item)
+            elif upload.size > MAX_UPLOAD_BYTES:
+                upload.discard()
+                add(name, (413, _upload_too_large_body()))
+            else:
+                add(name, upload)
+            if total > MAX_BATCH_WORKBOOKS:
+                raise ValueError(f"В пакете больше {MAX_BATCH_WORKBOOKS} книг.")
+    except (ValueError, zipfile.BadZipFile) as e:
+        for upload, _ in uploads.values():
+            upload.discard()
+        return JSONResponse(status_code=400, content={"ok": False, "stage": "bad_batch", "message": str(e)})
+    except BaseException:
+        for upload, _ in uploads.values():
+            upload.discard()
+        raise
+
+    return StreamingResponse(
+        _stream_batch(uploads, rejected),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _schedule_not_found(schedule_id: str):
+    return JSONResponse(
+        status_code=404,
+        content={"ok": False, "stage": "not_found", "message": f"Расписание '{schedule_id}' не найдено (устарело или не создавалось)."}
+    )
+
+
+@app.get("/schedules/{schedule_id}")
+def get_schedule(schedule_id: str, lean: bool = False):
+    body = result_cache_get(schedule_id, "summary" if lean else "response")
+    if body is None:
+        return _schedule_not_found(schedule_id)
+    return Response(content=body, media_type="application/json")
+
+
+@app.get("/schedules/{schedule_id}/semesters/{semester}/weeks/{week}")
+def get_schedule_week(schedule_id: str, semester: str, week: int,
+                      groups: Optional[str] = None, teacher: Optional[str] = None, room: Optional[str] = None):
+    """
+    Одна неделя семестра. groups — список групп через запятую, teacher — ФИО, room — аудитория.
+    """
+    stored = load_stored_result(schedule_id)
+    if stored is None:
+        return _schedule_not_found(schedule_id)
+    response, index = stored
+
+    group_list = [g.strip() for g in groups.split(",") if g.strip()] if groups else None
+    week_obj = select_week(response, index, semester, week, group_list, teacher, room)
+    if week_obj is None:
+        return JSONResponse(
+            status_code=404,
+            content={"ok": False, "stage": "not_found", "message": f"Нет недели {week} в семестре {semester}."}
+        )
+    return {"ok": True, "schedule_id": schedule_id, "semester": semester, "week": week_obj}
+
+
+def _entity_endpoint(schedule_id: str, semester: str, kind: str, name: str, week: Optional[int]):
+    stored = load_stored_result(schedule_id)
+    if stored is None:
+        return _schedule_not_found(schedule_id)
+    lessons = entity_timetable(stored[0], stored[1], semester, kind, name, week)
+    if lessons is None:
+        return JSONResponse(
+            status_code=404,
+            content={"ok": False, "stage": "not_found", "message": f"Нет семестра {semester}."}
+        )
+    return {"ok": True, "schedule_id": schedule_id, "semester": semester, kind: name, "lessons": lessons}
+
+
+@app.get("/schedules/{schedule_id}/semesters/{semester}/teachers/{teacher}")
+def get_teacher_timetable(schedule_id: str, semester: str, teacher: str, week: Optional[int] = None):
+    return _entity_endpoint(schedule_id, semester, "teacher", teacher, week)
+
+
+@app.get("/schedules/{schedule_id}/semesters/{semester}/rooms/{room}")
+def get_room_timetable(schedule_id: str, semester: str, room: str, week: Optional[int] = None):
+    return _entity_endpoint(schedule_id, semester, "room", room, week)
+
+
+@app.get("/schedules/{schedule_id}/semesters/{semester}/groups/{group}")
+def get_group_timetable(schedule_id: str, semester: str, group: str, week: Optional[int] = None):
+    return _entity_endpoint(schedule_id, semester, "group", group, week)
+
+
+@app.get("/schedules/{schedule_id}/semesters/{semester}/free-rooms")
+def get_free_rooms(schedule_id: str, semester: str, week: int,
+                   day: Optional[int] = None, pair: Optional[int] = None):
+    stored = load_stored_result(schedule_id)
+    if stored is None:
+        return _schedule_not_found(schedule_id)
+    slots = free_rooms_at(stored[1], semester, week, day, pair)
+    if slots is None:
+        return JSONResponse(
+            status_code=404,
+            content={"ok": False, "stage": "not_found", "message": f"Нет недели {week} в семестре {semester}."}
+        )
+    return {"ok": True, "schedule_id": schedule_id, "semester": semester, "week": week, "slots": slots}
+def _load_pair(schedule_id: str, since: str):
+    """(текущий ответ, прежний ответ) или готовый 404."""
+    current = load_stored_result(schedule_id)
+    if current is None:
+        return None, _schedule_not_found(schedule_id)
+    previous = load_stored_result(since)
+    if previous is None:
+        return None, _schedule_not_found(since)
+    return (current[0], previous[0]), None
+
+
+@app.get("/schedules/{schedule_id}/delta")
+def get_schedule_delta(schedule_id: str, since: str):
+    """
+    Только изменившиеся недели/дни относительно версии since (schedule_id, который уже есть у клиента).
+    404 по since — прежняя версия вытеснена из кэша, клиенту нужен полный /schedules/{id}.
+    """
+    pair, error = _load_pair(schedule_id, since)
+    if error is not None:
+        return error
+    summary = json.loads(result_cache_get(schedule_id, "summary"))
+    return schedule_delta(pair[0], summary, pair[1])
+
+
+@app.get("/schedules/{schedule_id}/diff")
+def get_schedule_diff(schedule_id: str, since: str, limit: int = DIFF_MAX_CHANGES):
+    pair, error = _load_pair(schedule_id, since)
+    if error is not None:
+        return error
+    return schedule_diff(pair[0], pair[1], max(0, min(limit, DIFF_MAX_CHANGES)))
+
+
+@app.get("/schedules/{schedule_id}/export")
+def export_schedule(schedule_id: str, format: str = "ics,xlsx", kind: str = "group,teacher",
+                    semester: Optional[str] = None, start: Optional[str] = None):
+    """
+    Zip с расписанием каждой группы/преподавателя: format — ics и/или xlsx, kind — group и/или teacher,
+    semester — один семестр (по умолчанию все), start — понедельник первой недели для ICS
+    (см. parse_export_starts). Архив отдаётся потоком по мере сборки файлов.
+    """
+    stored = load_stored_result(schedule_id)
+    if stored is None:
+        return _schedule_not_found(schedule_id)
+    response, index = stored
+
+    formats = [f.strip() for f in format.split(",") if f.strip()]
+    kinds = [k.strip() for k in kind.split(",") if k.strip()]
+    semesters = [semester] if semester else sorted(index["semesters"], key=lambda s: (len(s), s))
+    try:
+        if not formats or set(formats) - set(EXPORT_FORMATS):
+            raise ValueError(f"format: допустимо {', '.join(EXPORT_FORMATS)}")
+        if not kinds or set(kinds) - set(EXPORT_KINDS):
+            raise ValueError(f"kind: допустимо {', '.join(EXPORT_KINDS)}")
+        starts = parse_export_starts(start, semesters)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"ok": False, "stage": "bad_request", "message": str(e)})
+    if any(sem not in index["semesters"] for sem in semesters):
+        return JSONResponse(
+            status_code=404,
+            content={"ok": False, "stage": "not_found", "message": f"Нет семестра {semester}."}
+        )
+
+    files = export_files(schedule_id, response, index, semesters, kinds, formats, starts)
+    return StreamingResponse(
+        stream_zip(files),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="schedule_{schedule_id[:16]}.zip"'},
+    )
+
+
+def _job_not_found(job_id: str):
+    return JSONResponse(status_code=404, content={"ok": False, "stage": "not_found", "message": f"Задача '{job_id}' не найдена."})
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(file: UploadFile = File(...)):
+    try:
+        upload = await spool_upload(file)
+    except UploadTooLarge:
+        return _upload_too_large_response()
+    WORKBOOK_BYTES.observe(upload.size)
+    try:
+        job = await run_in_threadpool(job_submit, upload)
+    except Overloaded:
+        return _overloaded_response()
+    finally:
+        upload.discard()
+    return {"ok": True, **job_public(job)}
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_get(job_id)
+    if job is None:
+        return _job_not_found(job_id)
+    return {"ok": True, **job_public(job)}
+
+
+@app.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str, lean: bool = False):
+    job = job_get(job_id)
+    if job is None:
+        return _job_not_found(job_id)
+    if job["status"] == "done":
+        body = result_cache_get(job["result_id"], "summary" if lean else "response")
+        if body is None:
+            return _schedule_not_found(job["result_id"])
+        return Response(content=body, media_type="application/json")
+    if job["status"] == "failed":
+        return Response(content=job["error_body"], status_code=job["http_status"] or 500, media_type="application/json")
+    return JSONResponse(status_code=409, content={"ok": False, **job_public(job)})
+
+
+@app.delete("/jobs/{job_id}")
+def delete_job(job_id: str):
+    job = job_cancel(job_id)
+    if job is None:
+        return _job_not_found(job_id)
+    return {"ok": True, **job_public(job)}
 # @app.post("/generate")
 # async def generate(file: UploadFile = File(...)):
 #     excel_bytes = await file.read()
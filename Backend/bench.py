@@ -0,0 +1,216 @@
+"""
+Бенчмарк конвейера генерации на синтетических книгах (make_workbook.py).
+
+Каждый сценарий запускается в отдельном процессе — так пиковая память (ru_maxrss)
+относится только к нему. Результат сравнивается с bench_baseline.json:
+время стадий и память — с допуском --tolerance, качество (forced/unscheduled и штраф
+QualityEvaluator) — без допуска.
+
+    python bench.py                      # x1 и x10, сравнение с базовой линией
+    python bench.py --scenario x1        # только один сценарий
+    python bench.py --save-baseline      # перезаписать базовую линию
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, redirect_stdout
+from pathlib import Path
+from typing import Any, Dict, List
+
+BASELINE_PATH = Path(__file__).with_name("bench_baseline.json")
+
+# x1 — размер текущей книги (Книга (3) (1).xlsx), x10 — целевой масштаб
+SCENARIOS = {
+    "x1": {"groups": 5, "teachers": 10, "rooms": 10, "semesters": 4, "density": 0.6, "seed": 1},
+    "x10": {"groups": 50, "teachers": 100, "rooms": 100, "semesters": 4, "density": 0.6, "seed": 1},
+}
+
+STAGES = ["import_app", "parse", "logic_precheck_full", "build_ledger", "calculate_weekly_needs",
+          "generate_semester", "json_build", "evaluate", "excel_export"]
+
+# шум таймера и планировщика на маленьких стадиях не считаем регрессией:
+# рост стадии меньше этого порога не проверяется вовсе (даже если он больше tolerance)
+MIN_TIME_DELTA_SEC = 0.25
+
+
+def _peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux — килобайты, macOS — байты
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+@contextmanager
+def _timed(timings: Dict[str, float], stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - t0
+
+
+def run_scenario(params: Dict[str, Any]) -> Dict[str, Any]:
+    timings: Dict[str, float] = {}
+
+    # холодный импорт (процесс свежий): то, что платит каждый рестарт воркера до первого /health
+    with _timed(timings, "import_app"):
+        import app
+    from make_workbook import write_workbook
+
+    forced = 0
+    unscheduled = 0
+    score = 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        xlsx = write_workbook(os.path.join(tmp, "bench.xlsx"), **params)
+        excel_bytes = Path(xlsx).read_bytes()
+
+        with _timed(timings, "parse"):
+            sheets = app.read_workbook_sheets(xlsx)
+            df_rup, df_teachers, df_groups, df_rooms, df_rules = app.read_schedule_frames(None, sheets)
+            loads_by_semester = app.split_load_by_semester(df_teachers)
+
+        with _timed(timings, "logic_precheck_full"):
+            issues = app.logic_precheck_full(excel_bytes, sheets)
+        # logic_precheck_full возвращает только ошибки: любая запись — книга не прошла
+        if issues:
+            raise SystemExit(f"Синтетическая книга не прошла logic_precheck_full: {issues[:3]}")
+
+        # как generate_schedule_from_excel: все семестры книги сразу и общий реестр ресурсов
+        # (LEDGER_SCOPE) — семестры одного периода не делят преподавателей и аудитории
+        rules = app.workbook_rules(sheets)
+        optimizers = {
+            sem: app.ScheduleOptimizer(df_rup, df_load_sem, df_groups, df_rooms, df_rules, rules)
+            for sem, df_load_sem in loads_by_semester.items()
+        }
+        with _timed(timings, "build_ledger"):
+            app.build_ledger(optimizers)
+
+        for sem, optimizer in optimizers.items():
+            with _timed(timings, "calculate_weekly_needs"):
+                for w in range(1, optimizer.WEEKS + 1):
+                    optimizer.calculate_weekly_needs(w)
+
+            with _timed(timings, "generate_semester"):
+                semester_sched, warnings = optimizer.generate_semester()
+            unscheduled += len(warnings)
+            forced += optimizer.semester_counters()["total"]["forced"]
+
+            with _timed(timings, "json_build"):
+                app.build_json_for_one_semester(optimizer, semester_sched)
+
+            with _timed(timings, "evaluate"):
+                score += app.QualityEvaluator(optimizer).evaluate(semester_sched)["score"]
+
+            with _timed(timings, "excel_export"):
+                optimizer.save_semester_to_excel(semester_sched, os.path.join(tmp, f"sem_{sem}.xlsx"))
+
+    return {
+        "params": params,
+        "lean_frames": app.LEAN_FRAMES,
+        "ledger_scope": app.LEDGER_SCOPE,
+        "component_workers": app.COMPONENT_WORKERS,
+        "stages": {s: round(timings.get(s, 0.0), 3) for s in STAGES},
+        "total_sec": round(sum(timings.values()), 3),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "forced": forced,
+        "unscheduled": unscheduled,
+        "score": score,
+    }
+
+
+def _run_isolated(name: str) -> Dict[str, Any]:
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        out = f.name
+    try:
+        subprocess.run([sys.executable, __file__, "--child", name, "--out", out],
+                       check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        with open(out, encoding="utf-8") as f:
+            return json.load(f)
+    finally:
+        os.unlink(out)
+
+
+def compare(name: str, result: Dict[str, Any], base: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions = []
+    if result["params"] != base.get("params") or result["ledger_scope"] != base.get("ledger_scope"):
+        return [f"{name}: параметры сценария отличаются от базовой линии — пересохраните её (--save-baseline)"]
+
+    for stage in STAGES:
+        if stage not in base["stages"]:
+            continue
+        now, was = result["stages"][stage], base["stages"][stage]
+        if now > was * (1 + tolerance) and now - was > MIN_TIME_DELTA_SEC:
+            regressions.append(f"{name}: {stage} {was:.3f}s -> {now:.3f}s")
+
+    if result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+        regressions.append(f"{name}: peak_rss_mb {base['peak_rss_mb']} -> {result['peak_rss_mb']}")
+
+    for metric in ("forced", "unscheduled", "score"):
+        if metric in base and result[metric] > base[metric]:
+            regressions.append(f"{name}: {metric} {base[metric]} -> {result[metric]}")
+    return regressions
+
+
+def _print_result(name: str, result: Dict[str, Any], base: Dict[str, Any] = None):
+    print(f"\n=== {name} {result['params']}")
+    for stage in STAGES:
+        was = f"  (база {base['stages'][stage]:.3f}s)" if base and stage in base["stages"] else ""
+        print(f"  {stage:<24}{result['stages'][stage]:>9.3f}s{was}")
+    print(f"  {'total':<24}{result['total_sec']:>9.3f}s")
+    print(f"  peak_rss_mb={result['peak_rss_mb']}  forced={result['forced']}  unscheduled={result['unscheduled']}"
+          f"  score={result['score']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк генератора расписания")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="по умолчанию — все")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимый рост времени/памяти (доля)")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # отладочный вывод оптимизатора не нужен в отчёте
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            result = run_scenario(SCENARIOS[args.child])
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return
+
+    baseline = {}
+    if BASELINE_PATH.exists():
+        baseline = json.loads(BASELINE_PATH.read_text(encoding="utf-8"))
+
+    regressions = []
+    for name in args.scenario or list(SCENARIOS):
+        result = _run_isolated(name)
+        base = baseline.get(name)
+        _print_result(name, result, None if args.save_baseline else base)
+        if args.save_baseline:
+            baseline[name] = result
+        elif base:
+            regressions.extend(compare(name, result, base, args.tolerance))
+        else:
+            print(f"  (нет базовой линии для {name})")
+
+    if args.save_baseline:
+        BASELINE_PATH.write_text(json.dumps(baseline, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"\nБазовая линия сохранена: {BASELINE_PATH}")
+        return
+
+    if regressions:
+        print("\nРЕГРЕССИИ:")
+        for r in regressions:
+            print(f"  - {r}")
+        sys.exit(1)
+    print("\nРегрессий нет")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Генератор синтетических Excel-файлов для нагрузочных тестов.
+
+Собирает книгу с теми же пятью листами, что ждёт app.py
+("РУП", "Нагруженность преподователей", "Группы и направления",
+"Аудитории", "Правила составления") и проходит logic_precheck_full.
+
+Пример:
+    python make_workbook.py --groups 50 --teachers 100 --rooms 60 --seed 1 -o big.xlsx
+"""
+import argparse
+import math
+import random
+from typing import Any, Dict, List
+
+import pandas as pd
+
+WEEKS = 16
+DAYS_PER_WEEK = 5
+MAX_PAIRS = 5
+PAIR_HOURS = 1.5  # как ScheduleOptimizer.PAIR_DURATION
+
+SUBJECTS = [
+    "Казахский язык и литература", "Русский язык", "Иностранный язык", "История Казахстана",
+    "Математика", "Физика", "Информатика", "Химия", "Биология", "География",
+    "Основы экономики", "Основы права", "Алгоритмизация и программирование", "Базы данных",
+    "Компьютерные сети", "Операционные системы", "Веб-программирование",
+    "Проектирование программного обеспечения", "Тестирование программного обеспечения",
+    "Информационная безопасность", "Компьютерная графика", "Электротехника",
+]
+SPORT_SUBJECT = "Физическая культура"
+
+FIRST_NAMES = ["Айза", "Данияр", "Мария", "Дарья", "Райгуль", "Телеген", "Виктор", "Даулет",
+               "Акимхан", "Алия", "Ержан", "Светлана", "Нурлан", "Гульнара", "Асель", "Марат"]
+PATRONYMICS = ["Ерболкызы", "Айтахметович", "Сергеевна", "Александровна", "Болабаевна",
+               "Алматаулы", "Викторович", "Болатович", "Галымжан", "Нурлановна", "Маратович"]
+
+RULES_ROWS = [
+    ("Direction_Type", "Тип обучения", "Модульная / Дуальная"),
+    ("Study_Days_Per_Week", "Количество учебных дней в неделю", DAYS_PER_WEEK),
+    ("Max_Lessons_Per_Day", "Максимум пар в день для группы", MAX_PAIRS),
+    ("Min_Lessons_Per_Day", "Минимум пар в день", 2),
+    ("Lesson_Duration_Min", "Длительность пары (мин)", 90),
+    ("Semester_Weeks", "Длительность семестра (недели)", WEEKS),
+    ("Shift_Type", "Сменность обучения", "1 смена / 2 смены"),
+    ("Код", "Правило", "Вес штрафа"),
+    ("H1", "Один преподаватель не может вести более одной пары одновременно", "HARD"),
+    ("H2", "Одна группа не может иметь две разные пары в одно и то же время", "HARD"),
+    ("H3", "Тип аудитории должен соответствовать типу занятия", "HARD"),
+    ("H5", "Запрещено превышать Max_Lessons_Per_Day", "HARD"),
+    ("H6", "Запрещено ставить занятия вне Study_Days_Per_Week", "HARD"),
+    ("H7", "Число студентов не должно превышать вместимость аудитории", "HARD"),
+    ("H11", "В одной аудитории одновременно может находиться только один преподаватель", "HARD"),
+    ("S1", "Минимизация окон у групп", 5),
+    ("S2", "Минимизация окон у преподавателей", 5),
+    ("S3", "Равномерная нагрузка по дням", 4),
+    ("S4", "Минимизация «одной пары в день» у преподавателей", 2),
+]
+
+
+def _teacher_names(n: int, rnd: random.Random) -> List[str]:
+    names = []
+    seen = set()
+    while len(names) < n:
+        name = f"{rnd.choice(FIRST_NAMES)} {rnd.choice(PATRONYMICS)}"
+        if name in seen:
+            name = f"{name} {len(names) + 1}"
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+# доля недельных слотов, которую генератор закладывает на одного преподавателя/аудиторию
+# при расчёте их числа: остальное — запас жадному оптимизатору
+ROOM_LOAD = 0.5
+
+
+def build_workbook(groups: int = 5, teachers: int = 10, rooms: int = 10, semesters: int = 4,
+                   density: float = 0.6, seed: int = 0, departments: int = 1) -> Dict[str, pd.DataFrame]:
+    """
+    density — доля недельных слотов (5 дней × 5 пар), занятых у каждой группы.
+    Группы делятся на потоки по 2–5 групп: внутри потока дисциплины и преподаватели
+    общие, поэтому оптимизатор может объединять их в потоковые пары.
+    departments — на сколько отделений (кафедр) делятся преподаватели: поток берёт
+    преподавателей только своего отделения, общими остаются аудитории и спортзал.
+
+    Книга заведомо составима: нагрузка преподавателей и аудитории рассчитываются на
+    каждый период (term) — семестры одной чётности идут одновременно и делят преподавателей
+    и аудитории (ResourceLedger). Преподаватель берётся наименее загруженный в периоде,
+    спортзалов и аудиторий под потоки (две группы) — столько, чтобы их занятость не
+    превышала ROOM_LOAD; rooms — общее число аудиторий, если расчёт не требует больше.
+    """
+    rnd = random.Random(seed)
+    slots_per_week = DAYS_PER_WEEK * MAX_PAIRS
+    target_pairs = max(1, round(slots_per_week * density))
+
+    group_names = [f"{i + 1:02d}ТИС" for i in range(groups)]
+    teacher_names = _teacher_names(teachers, rnd)
+
+    # потоки групп
+    streams: List[List[str]] = []
+    i = 0
+    while i < groups:
+        size = rnd.randint(2, 5)
+        streams.append(group_names[i:i + size])
+        i += size
+
+    current_sem = {g: rnd.randint(1, semesters) for g in group_names}
+
+    departments = max(1, min(departments, teachers))
+    dept_teachers = [teacher_names[d::departments] for d in range(departments)]
+
+    df_groups = pd.DataFrame([{
+        "Группа": g,
+        "Курс": (current_sem[g] + 1) // 2,
+        "Семестр": current_sem[g],
+        "Размер группы": rnd.randint(18, 28),
+        "Специальность": "Разработчик программного обеспечения",
+    } for g in group_names])
+
+    # недельная нагрузка: занятий преподавателя в периоде (поток из двух групп — одно занятие)
+    # и пар по текущим семестрам групп (так считает проверка перегрузки logic_precheck_full)
+    term_sessions = {t: [0, 0] for t in teacher_names}
+    precheck_pairs = {t: 0 for t in teacher_names}
+    sport_sessions, flow_sessions, single_sessions = [0, 0], [0, 0], [0, 0]
+
+    load_rows: List[Dict[str, Any]] = []
+    rup_hours: Dict[str, List[float]] = {}
+    for stream_idx, stream in enumerate(streams):
+        pool = dept_teachers[stream_idx % departments]
+        for sem in range(1, semesters + 1):
+            term = sem % 2
+            pairs_left = target_pairs
+            subjects = rnd.sample(SUBJECTS, k=len(SUBJECTS))
+            plan = [(SPORT_SUBJECT, 2)]
+            pairs_left -= 2
+            for subj in subjects:
+                if pairs_left <= 0:
+                    break
+                pw = min(pairs_left, rnd.randint(2, 4))
+                plan.append((subj, pw))
+                pairs_left -= pw
+
+            flows, singles = len(stream) // 2, len(stream) % 2
+            for subj, pw in plan:
+                teacher = min(rnd.sample(pool, k=len(pool)),
+                              key=lambda t: (term_sessions[t][term], precheck_pairs[t]))
+                term_sessions[teacher][term] += pw * (flows + singles)
+                if subj == SPORT_SUBJECT:
+                    sport_sessions[term] += pw * (flows + singles)
+                else:
+                    flow_sessions[term] += pw * flows
+                    single_sessions[term] += pw * singles
+                hours = pw * WEEKS * PAIR_HOURS
+                rup_hours.setdefault(subj, [0.0] * semesters)[sem - 1] += hours
+                for g in stream:
+                    if current_sem[g] == sem:
+                        precheck_pairs[teacher] += math.ceil(hours * 45 / 90 / WEEKS)
+                    load_rows.append({
+                        "Индекс": f"БМ - {len(load_rows) + 1}",
+                        "Дисциплина": subj,
+                        "ФИО преподавателя": teacher,
+                        "группа": g,
+                        "семестр": sem,
+                        "количество часов": hours,
+                    })
+
+    df_load = pd.DataFrame(load_rows)
+
+    df_rup = pd.DataFrame([
+        {"Индекс": f"ООД - {i + 1}", "Дисциплина": subj, **{f"{s + 1} сем": h for s, h in enumerate(hours)}}
+        for i, (subj, hours) in enumerate(sorted(rup_hours.items()))
+    ])
+
+    def rooms_for(sessions):
+        return max(1, math.ceil(max(sessions) / (slots_per_week * ROOM_LOAD)))
+
+    gyms, big = rooms_for(sport_sessions), rooms_for(flow_sessions)
+    small = max(rooms_for(single_sessions), rooms - gyms - big)
+    room_rows = [{"Аудитория": "Спорт зал" if g == 0 else f"Спорт зал {g + 1}", "Назначение": "Физра",
+                  "Вместимость": 100} for g in range(gyms)]
+    kinds = [70] * big + [28] * small
+    rnd.shuffle(kinds)
+    for r, capacity in enumerate(kinds, 1):
+        room_rows.append({"Аудитория": str(r), "Назначение": "Общая", "Вместимость": capacity})
+    df_rooms = pd.DataFrame(room_rows)
+
+    df_rules = pd.DataFrame(RULES_ROWS, columns=["Параметр", "Описание", "Пример"])
+
+    return {
+        "РУП": df_rup,
+        "Нагруженность преподователей": df_load,
+        "Группы и направления": df_groups,
+        "Аудитории": df_rooms,
+        "Правила составления": df_rules,
+    }
+
+
+def write_workbook(path: str, **params) -> str:
+    sheets = build_workbook(**params)
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        for name, df in sheets.items():
+            df.to_excel(writer, sheet_name=name, index=False)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Синтетическая книга для генератора расписания")
+    parser.add_argument("--groups", type=int, default=5)
+    parser.add_argument("--teachers", type=int, default=10)
+    parser.add_argument("--rooms", type=int, default=10)
+    parser.add_argument("--semesters", type=int, default=4)
+    parser.add_argument("--density", type=float, default=0.6, help="доля занятых слотов недели у группы (0..1)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--departments", type=int, default=1, help="отделения со своими преподавателями")
+    parser.add_argument("-o", "--output", default="synthetic.xlsx")
+    args = parser.parse_args()
+
+    write_workbook(args.output, groups=args.groups, teachers=args.teachers, rooms=args.rooms,
+                   semesters=args.semesters, density=args.density, seed=args.seed,
+                   departments=args.departments)
+    print(f"Файл сохранён: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
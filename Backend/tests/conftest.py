@@ -0,0 +1,5 @@
+import os
+import sys
+
+# app.py и make_workbook.py лежат в Backend/, тесты — в Backend/tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,201 @@
+"""
+ResourceLedger: семестры одной чётности (LEDGER_SCOPE=term) не бронируют одного
+преподавателя или аудиторию в одну пару; claim — всё или ничего, claim_free бронирует
+свободное и возвращает ровно отклонённое, _repair_week переставляет только отклонённое.
+"""
+import contextlib
+import io
+import multiprocessing
+from collections import Counter
+
+import pandas as pd
+import pytest
+
+import app
+
+
+def _contended_workbook():
+    """Семестры 1 и 3 (один term) делят преподавателя «Иванов» и единственную обычную аудиторию."""
+    load = []
+    for g, sem in (("1А", 1), ("3А", 3)):
+        for subj, teacher in (("Математика", "Иванов"), ("Физика", f"Петров {sem}"),
+                              ("Информатика", f"Сидоров {sem}")):
+            load.append({"Дисциплина": subj, "ФИО преподавателя": teacher, "группа": g,
+                         "семестр": sem, "количество часов": 72})
+    rooms = [{"Аудитория": "Спорт зал", "Назначение": "Физра", "Вместимость": 100},
+             {"Аудитория": "101", "Назначение": "Общая", "Вместимость": 30}]
+    return {
+        "РУП": pd.DataFrame({"Дисциплина": []}),
+        "Нагруженность преподователей": pd.DataFrame(load),
+        "Группы и направления": pd.DataFrame({"Группа": ["1А", "3А"], "Семестр": [1, 3], "Размер группы": 25}),
+        "Аудитории": pd.DataFrame(rooms),
+        "Правила составления": pd.DataFrame(columns=["Параметр", "Описание", "Пример"]),
+    }
+
+
+def _generate(monkeypatch, tmp_path, scope="term", workers=1):
+    monkeypatch.setattr(app, "LEDGER_SCOPE", scope)
+    monkeypatch.setattr(app, "SEMESTER_WORKERS", workers)
+    monkeypatch.chdir(tmp_path)  # generate_schedule_from_excel пишет vue-project/ в текущую папку
+    with contextlib.redirect_stdout(io.StringIO()):
+        return app.generate_schedule_from_excel(None, sheets=_contended_workbook())
+
+
+def _double_bookings(payload, semesters=("1", "3")):
+    """Сколько раз преподаватель/аудитория стоят в одной паре у разных семестров."""
+    owners = {}
+    for sem in semesters:
+        for week in payload["semesters"][sem]["weeks"]:
+            for day in week["days"]:
+                for pair in day["pairs"]:
+                    for slot in filter(None, pair["slots"].values()):
+                        for key in (("teacher", slot["teacher"]), ("room", slot["room"])):
+                            owners.setdefault((week["week_number"], day["day_name"], pair["pair"], key), set()).add(sem)
+    return sum(1 for sems in owners.values() if len(sems) > 1)
+
+
+def _lesson_count(payload):
+    return sum(1 for sem in payload["semesters"].values() for week in sem["weeks"] for day in week["days"]
+               for pair in day["pairs"] for slot in pair["slots"].values() if slot)
+
+
+def _standalone(sheets, sem):
+    """Семестр без реестра — как генерировались все семестры до ResourceLedger."""
+    df_rup, df_load, df_groups, df_rooms, df_rules = app.read_schedule_frames(None, sheets)
+    loads = app.split_load_by_semester(df_load)
+    optimizer = app.ScheduleOptimizer(df_rup, loads[sem], df_groups, df_rooms, df_rules, app.workbook_rules(sheets))
+    with contextlib.redirect_stdout(io.StringIO()):
+        schedule, warnings = optimizer.generate_semester()
+    return app.build_json_for_one_semester(optimizer, schedule), warnings
+
+
+def test_term_scope_has_no_cross_semester_double_bookings(monkeypatch, tmp_path):
+    result = _generate(monkeypatch, tmp_path)
+    assert _double_bookings(result["payload"]) == 0
+    assert not any(result["warnings"].values())
+
+
+def test_off_scope_matches_independent_semesters(monkeypatch, tmp_path):
+    result = _generate(monkeypatch, tmp_path, scope="off")
+    for sem in (1, 3):
+        payload, warnings = _standalone(_contended_workbook(), sem)
+        assert result["payload"]["semesters"][str(sem)] == payload
+        assert result["warnings"][str(sem)] == warnings
+    # без реестра семестры действительно сталкиваются — иначе тест выше ничего не проверяет
+    assert _double_bookings(result["payload"]) > 0
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="параллельные семестры — через fork")
+def test_parallel_semesters_match_serial(monkeypatch, tmp_path):
+    serial = _generate(monkeypatch, tmp_path)
+    parallel = _generate(monkeypatch, tmp_path, workers=2)
+    assert _double_bookings(parallel["payload"]) == 0
+    assert _lesson_count(parallel["payload"]) == _lesson_count(serial["payload"])
+    assert parallel["warnings"] == serial["warnings"]
+
+
+def _ledger(terms=1):
+    return app.ResourceLedger({"Иванов", "Петров"}, {"101", "102"}, terms=terms, weeks=2, days=2, pairs=2)
+
+
+def test_claim_is_all_or_nothing():
+    ledger = _ledger()
+    assert ledger.claim(0, 1, [(1, 1, "Иванов", "101")]) == []
+
+    conflicts = ledger.claim(0, 1, [(1, 2, "Петров", "102"), (1, 1, "Петров", "101")])
+    assert conflicts == [("room", "101")]
+    # ни одно занятие конфликтной брони не записано, включая бесконфликтное (1, 2)
+    assert ledger.reserved(0, 1) == ({(1, 1): {"Иванов"}}, {(1, 1): {"101"}})
+
+
+def test_claim_is_scoped_by_term_and_week():
+    ledger = _ledger(terms=2)
+    assert ledger.claim(0, 1, [(1, 1, "Иванов", "101")]) == []
+    assert ledger.claim(1, 1, [(1, 1, "Иванов", "101")]) == []
+    assert ledger.claim(0, 2, [(1, 1, "Иванов", "101")]) == []
+    assert ledger.claim(0, 1, [(1, 1, "Иванов", "102")]) == [("teacher", "Иванов")]
+
+
+def test_claim_free_returns_exactly_rejected():
+    ledger = _ledger()
+    ledger.claim(0, 1, [(1, 1, "Иванов", "101")])
+    placements = [(1, 1, "Петров", "101"),   # аудитория занята
+                  (1, 1, "Иванов", "102"),   # преподаватель занят
+                  (1, 2, "Иванов", "101"),   # свободно
+                  (2, 1, "Петров", "102")]   # свободно
+    assert ledger.claim_free(0, 1, placements) == placements[:2]
+    teachers, rooms = ledger.reserved(0, 1)
+    assert teachers == {(1, 1): {"Иванов"}, (1, 2): {"Иванов"}, (2, 1): {"Петров"}}
+    assert rooms == {(1, 1): {"101"}, (1, 2): {"101"}, (2, 1): {"102"}}
+    assert ledger.claim_free(0, 1, []) == []
+
+
+def _optimizers(sheets):
+    df_rup, df_load, df_groups, df_rooms, df_rules = app.read_schedule_frames(None, sheets)
+    rules = app.workbook_rules(sheets)
+    return {sem: app.ScheduleOptimizer(df_rup, load, df_groups, df_rooms, df_rules, rules)
+            for sem, load in app.split_load_by_semester(df_load).items()}
+
+
+def _schedule_bookings(schedule):
+    return Counter((w, d, p, key) for w, days in schedule.items() for d, pairs in days.items()
+                   for p, slots in pairs.items()
+                   for key in {k for info in slots.values() for k in (("t", info["teacher"]), ("r", info["room"]))})
+
+
+def test_lost_race_repairs_only_rejected_lessons(monkeypatch):
+    """
+    Семестр 3 решает недели по устаревшему снимку (пустому — как будто семестр 1 забронировал
+    свои пары уже после снимка), поэтому все попытки claim проигрывают. Отклонённые claim_free
+    занятия переставляются (_repair_week): двойных броней нет, ни одно занятие не теряется молча.
+    """
+    monkeypatch.setattr(app, "LEDGER_SCOPE", "term")
+    optimizers = _optimizers(_contended_workbook())
+    ledger = app.build_ledger(optimizers)
+    with contextlib.redirect_stdout(io.StringIO()):
+        first, _ = optimizers[1].generate_semester()
+
+    snapshots = Counter()
+    real_reserved = ledger.reserved
+
+    def stale_reserved(term, week):
+        snapshots[week] += 1
+        return ({}, {}) if snapshots[week] <= app.LEDGER_RETRIES else real_reserved(term, week)
+
+    monkeypatch.setattr(ledger, "reserved", stale_reserved)
+    with contextlib.redirect_stdout(io.StringIO()):
+        third, warnings = optimizers[3].generate_semester()
+
+    counters = optimizers[3].semester_counters()["total"]
+    assert counters["ledger_retries"] == app.LEDGER_RETRIES * optimizers[3].WEEKS
+    assert counters["ledger_repairs"] > 0
+    assert not (set(_schedule_bookings(first)) & set(_schedule_bookings(third)))
+
+    standalone, _ = _standalone(_contended_workbook(), 3)
+    placed = sum(1 for days in third.values() for pairs in days.values() for slots in pairs.values() for _ in slots)
+    needed = sum(1 for week in standalone["weeks"] for day in week["days"] for pair in day["pairs"]
+                 for slot in pair["slots"].values() if slot)
+    assert placed == needed and warnings == [] and counters["unplaced"] == 0
+
+
+def test_repair_week_moves_only_rejected_lesson():
+    optimizer = _optimizers(_contended_workbook())[1]
+    with contextlib.redirect_stdout(io.StringIO()):
+        schedule, _ = optimizer.generate_semester()
+    week = schedule[1]
+    placements = app._week_placements(week)
+    rejected = placements[0]
+    day, pair, teacher, room = rejected
+    reserved = ({(day, pair): {teacher}}, {(day, pair): {room}})
+
+    unscheduled = []
+    repaired, moved = optimizer._repair_week(1, week, {rejected}, reserved, unscheduled)
+    after = app._week_placements(repaired)
+    assert unscheduled == [] and len(moved) == 1 and moved[0] != rejected
+    assert set(after) == (set(placements) - {rejected}) | set(moved)
+    assert moved[0][2] == teacher and (moved[0][0], moved[0][1]) != (day, pair)
+
+    # без перестановки (раунды кончились) отклонённое снимается с предупреждением
+    dropped, moved = optimizer._repair_week(1, week, {rejected}, reserved, unscheduled, place_again=False)
+    assert moved == [] and len(unscheduled) == 1
+    assert set(app._week_placements(dropped)) == set(placements) - {rejected}
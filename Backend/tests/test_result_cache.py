@@ -0,0 +1,91 @@
+"""
+Кэш результатов: вытеснение по размеру (SCHEDULE_CACHE_MAX_MB) в порядке mtime,
+попадание в кэш обновляет mtime, версия оптимизатора зависит от его настроек.
+"""
+import os
+
+import pytest
+
+import app
+
+
+def _content(payload_bytes=10_000):
+    return {"ok": True, "data": {"semesters": {}}, "warnings": {}, "padding": "x" * payload_bytes}
+
+
+def _entry_size(key):
+    d = app._result_dir(key)
+    return sum(p.stat().st_size for p in d.iterdir())
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "RESULT_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(app, "_STORED_RESULTS", type(app._STORED_RESULTS)())
+    return tmp_path
+
+
+def _put_aged(key, age):
+    app.result_cache_put(key, _content())
+    t = 1_000_000 + age
+    os.utime(app._result_dir(key), (t, t))
+
+
+def test_oldest_entry_evicted_past_limit(cache_dir, monkeypatch):
+    _put_aged("a", 1)
+    size = _entry_size("a")
+    monkeypatch.setattr(app, "RESULT_CACHE_MAX_BYTES", int(size * 2.5))
+    _put_aged("b", 2)
+    assert sorted(p.name for p in cache_dir.iterdir()) == ["a", "b"]
+
+    app.result_cache_put("c", _content())
+    assert sorted(p.name for p in cache_dir.iterdir()) == ["b", "c"]
+    assert app.result_cache_get("a") is None
+
+
+def test_cache_hit_refreshes_mtime(cache_dir, monkeypatch):
+    _put_aged("a", 1)
+    monkeypatch.setattr(app, "RESULT_CACHE_MAX_BYTES", int(_entry_size("a") * 2.5))
+    _put_aged("b", 2)
+
+    before = app._result_dir("a").stat().st_mtime
+    assert app.result_cache_get("a", "summary") is not None
+    assert app._result_dir("a").stat().st_mtime > before
+
+    # "a" прочитан позже "b" — вытесняется "b"
+    app.result_cache_put("c", _content())
+    assert sorted(p.name for p in cache_dir.iterdir()) == ["a", "c"]
+
+
+def test_miss_does_not_create_entry(cache_dir):
+    assert app.result_cache_get("missing") is None
+    assert list(cache_dir.iterdir()) == []
+
+
+@pytest.fixture
+def fresh_version():
+    app.optimizer_version.cache_clear()
+    yield
+    app.optimizer_version.cache_clear()
+
+
+@pytest.mark.parametrize("setting, value", [
+    ("LEDGER_SCOPE", "off"),
+    ("COMPONENT_WORKERS", 4),
+    ("PENALTY_WINDOW", 123),
+    ("RESULT_SCHEMA_VERSION", 999),
+])
+def test_optimizer_version_tracks_settings(setting, value, fresh_version, monkeypatch):
+    before = app.optimizer_version()
+    key = app.result_cache_key("0" * 64)
+
+    monkeypatch.setattr(app, setting, value)
+    app.optimizer_version.cache_clear()
+    assert app.optimizer_version() != before
+    assert app.result_cache_key("0" * 64) != key
+
+
+def test_optimizer_version_stable(fresh_version):
+    before = app.optimizer_version()
+    app.optimizer_version.cache_clear()
+    assert app.optimizer_version() == before
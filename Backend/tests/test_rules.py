@@ -0,0 +1,215 @@
+"""
+Компиляция правил книги (compile_rules): параметры листа "Правила составления",
+разбор пар и дней, лист "Недоступность" (маски), их проверка в logic_precheck_full,
+запреты в генерации и Min_Lessons_Per_Day в проверке и оценке качества.
+"""
+import contextlib
+import io
+
+import pandas as pd
+import pytest
+
+import app
+from make_workbook import RULES_ROWS, build_workbook
+
+
+def _rules_df(**overrides):
+    rows = [(p, d, overrides.get(p, v)) for p, d, v in RULES_ROWS]
+    return pd.DataFrame(rows, columns=["Параметр", "Описание", "Пример"])
+
+
+def _availability(*rows):
+    return pd.DataFrame(list(rows), columns=app.AVAILABILITY_COLUMNS)
+
+
+def test_compile_rules_reads_parameters():
+    rules = app.compile_rules(_rules_df(Study_Days_Per_Week=6, Max_Lessons_Per_Day=4, Min_Lessons_Per_Day=2,
+                                        Semester_Weeks=18, Lesson_Duration_Min=80, Shift_Type="1 смена"))
+    assert (rules.days, rules.max_pairs, rules.min_pairs, rules.weeks, rules.lesson_minutes) == (6, 4, 2, 18, 80)
+    assert rules.shifts == 1 and set(rules.shift_of_pair.values()) == {1}
+    assert rules.all_slots == (1 << 24) - 1
+    assert rules.slot_bits[2][1] == 1 << 4
+    assert rules.issues == []
+    # веса из шаблона: H* — HARD (None), S* — числа
+    assert rules.weight("H1") is None and rules.weight("S1") == 5.0 and rules.weight("S4") == 2.0
+
+
+def test_compile_rules_defaults_without_sheet():
+    rules = app.compile_rules(None)
+    assert (rules.days, rules.max_pairs, rules.min_pairs, rules.weeks) == (
+        app.DEFAULT_DAYS_PER_WEEK, app.DEFAULT_MAX_PAIRS, 1, app.DEFAULT_WEEKS)
+    assert rules.shift_of_pair == {1: 1, 2: 1, 3: 1, 4: 2, 5: 2}
+    assert rules.weights == app.DEFAULT_RULE_WEIGHTS
+    assert rules.masks == {"teacher": {}, "group": {}, "room": {}}
+
+
+def test_compile_rules_reports_invalid_values():
+    rules = app.compile_rules(_rules_df(Study_Days_Per_Week=9, Max_Lessons_Per_Day=3, Min_Lessons_Per_Day=4))
+    assert rules.days == app.DEFAULT_DAYS_PER_WEEK
+    assert rules.min_pairs == rules.max_pairs == 3
+    assert [i["code"] for i in rules.issues] == ["RULE_VALUE_INVALID", "RULE_VALUE_INVALID"]
+
+
+def test_rule_weights_from_code_columns():
+    df = _rules_df()
+    df["Код"] = ["S1", "H1"] + [""] * (len(df) - 2)
+    df["Вес штрафа"] = ["7", "HARD"] + [""] * (len(df) - 2)
+    rules = app.compile_rules(df)
+    assert rules.weight("S1") == 7.0 and rules.weight("H1") is None
+    # вес 7 вместо 5 по умолчанию — штраф слота пересчитывается пропорционально
+    assert rules.slot_penalty(100, "S1") == 140
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, [1, 2, 3, 4, 5]),
+    ("", [1, 2, 3, 4, 5]),
+    (3, [3]),
+    ("3.0", [3]),
+    ("1-3", [1, 2, 3]),
+    ("1, 2, 5", [1, 2, 5]),
+    ("1-2; 5", [1, 2, 5]),
+    ("2 4", [2, 4]),
+    ("a", None),
+    ("1-", None),
+    ("1-b", None),
+])
+def test_parse_pairs(value, expected):
+    assert app._parse_pairs(value, 5) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    (1, 1), ("3", 3), ("ПН", 1), ("вторник", 2), ("Пятница", 5), ("x", None), (None, None),
+])
+def test_parse_day(value, expected):
+    assert app._parse_day(value) == expected
+
+
+def test_availability_sheet_compiles_masks():
+    rules = app.compile_rules(None, _availability(
+        ("Преподаватель", "Иванов", "ПН", "1-2"),
+        ("преподаватель", "Иванов", 3, ""),
+        ("Группа", "1А", "ВТ", 5),
+        ("Аудитория", "101", 1, "1"),
+    ))
+    assert rules.issues == []
+    teacher = rules.masks["teacher"]["Иванов"]
+    for day, pair in [(1, 1), (1, 2)] + [(3, p) for p in range(1, 6)]:
+        assert not teacher & rules.slot_bits[day][pair]
+    assert teacher & rules.slot_bits[1][3] and teacher & rules.slot_bits[2][1]
+    assert rules.slot_count("teacher", "Иванов") == 25 - 7
+    assert rules.slot_count("teacher", "Петров") == 25
+    assert not rules.allowed("Петров", ["1А"]) & rules.slot_bits[2][5]
+    assert rules.room_blocks == {(1, 1): {"101"}}
+    assert rules.forbidden_rows == {("teacher", "Иванов"): 2, ("group", "1А"): 4, ("room", "101"): 5}
+
+
+def test_availability_sheet_reports_bad_rows():
+    rules = app.compile_rules(None, _availability(
+        ("Кафедра", "Иванов", 1, 1),
+        ("Преподаватель", "", 1, 1),
+        ("Преподаватель", "Иванов", "воскресенье", 1),
+        ("Преподаватель", "Иванов", 1, "0-2"),
+        ("Преподаватель", "Иванов", 1, "утро"),
+        (None, None, None, None),
+    ))
+    assert [(i["code"], i["column"], i["excel_row"]) for i in rules.issues] == [
+        ("AVAILABILITY_INVALID", "Тип", 2),
+        ("AVAILABILITY_INVALID", "Название", 3),
+        ("AVAILABILITY_INVALID", "День", 4),
+        ("AVAILABILITY_INVALID", "Пары", 5),
+        ("AVAILABILITY_INVALID", "Пары", 6),
+    ]
+    assert all(i["sheet"] == app.AVAILABILITY_SHEET for i in rules.issues)
+    assert rules.masks["teacher"] == {}
+
+
+def test_availability_sheet_missing_columns():
+    rules = app.compile_rules(None, pd.DataFrame({"Тип": ["Группа"], "Название": ["1А"]}))
+    assert [i["code"] for i in rules.issues] == ["MISSING_COLUMN"]
+
+
+def _sheets(**params):
+    return build_workbook(**{"groups": 5, "teachers": 10, "rooms": 10, "semesters": 2, "seed": 1, **params})
+
+
+def test_precheck_reports_unknown_availability_entities():
+    sheets = _sheets()
+    teacher = sheets["Нагруженность преподователей"]["ФИО преподавателя"].iloc[0]
+    group = sheets["Группы и направления"]["Группа"].iloc[0]
+    sheets[app.AVAILABILITY_SHEET] = _availability(
+        ("Преподаватель", teacher, 1, 1),
+        ("Группа", group, 1, 1),
+        ("Аудитория", "1", 1, 1),
+        ("Преподаватель", "Нет Такого", 1, 1),
+        ("Группа", "99ZZZ", 2, ""),
+        ("Аудитория", "Склад", 3, 2),
+    )
+    errors = app.logic_precheck_full(None, sheets)
+    assert [(e["code"], e["excel_row"]) for e in errors] == [
+        ("AVAILABILITY_UNKNOWN", 5), ("AVAILABILITY_UNKNOWN", 6), ("AVAILABILITY_UNKNOWN", 7)]
+    assert "Нет Такого" in errors[0]["message"]
+
+
+def test_blocked_teacher_slot_is_never_chosen():
+    sheets = _sheets()
+    df_load = sheets["Нагруженность преподователей"]
+    teacher = df_load["ФИО преподавателя"].value_counts().index[0]
+    # весь понедельник и первая пара каждого дня
+    sheets[app.AVAILABILITY_SHEET] = _availability(
+        ("Преподаватель", teacher, "ПН", ""), *[("Преподаватель", teacher, d, 1) for d in range(2, 6)])
+    rules = app.workbook_rules(sheets)
+    assert app.logic_precheck_full(None, sheets, rules) == []
+
+    df_rup, df_teachers, df_groups, df_rooms, df_rules = app.read_schedule_frames(None, sheets)
+    placed = 0
+    for _, load in app.split_load_by_semester(df_teachers).items():
+        optimizer = app.ScheduleOptimizer(df_rup, load, df_groups, df_rooms, df_rules, rules)
+        with contextlib.redirect_stdout(io.StringIO()):
+            schedule, _ = optimizer.generate_semester()
+        for days in schedule.values():
+            for d, pairs in days.items():
+                for p, slots in pairs.items():
+                    for info in slots.values():
+                        if info["teacher"] == teacher:
+                            placed += 1
+                            assert d != 1 and p != 1
+    assert placed > 0
+
+
+def test_precheck_reports_unreachable_daily_minimum():
+    sheets = _sheets()
+    sheets["Правила составления"] = _rules_df(Min_Lessons_Per_Day=5)
+    # у первой группы в текущем семестре остаётся одна дисциплина на 2 пары в неделю
+    groups = sheets["Группы и направления"]
+    group, sem = groups["Группа"].iloc[0], int(groups["Семестр"].iloc[0])
+    load = sheets["Нагруженность преподователей"]
+    mine = load[(load["группа"] == group) & (load["семестр"] == sem)]
+    sheets["Нагруженность преподователей"] = load.drop(mine.index[1:])
+
+    errors = app.logic_precheck_full(None, sheets)
+    assert [(e["code"], group in e["evidence"]) for e in errors] == [("GROUP_UNDERLOAD_DAILY", True)]
+
+
+def test_quality_counts_days_below_minimum():
+    sheets = _sheets()
+    sheets["Правила составления"] = _rules_df(Min_Lessons_Per_Day=3)
+    df_rup, df_teachers, df_groups, df_rooms, df_rules = app.read_schedule_frames(None, sheets)
+    rules = app.workbook_rules(sheets)
+    load = next(iter(app.split_load_by_semester(df_teachers).values()))
+    optimizer = app.ScheduleOptimizer(df_rup, load, df_groups, df_rooms, df_rules, rules)
+
+    def lesson():
+        return {"subject": "Математика", "teacher": "Т", "room": "1", "is_flow": False}
+
+    week = {d: {p: {} for p in range(1, 6)} for d in range(1, 6)}
+    week[1][1]["А"] = lesson()                                   # 1 пара — короче минимума
+    week[2][1]["А"] = week[2][2]["А"] = lesson()                 # 2 пары — короче минимума
+    week[3][1]["А"] = week[3][2]["А"] = week[3][3]["А"] = lesson()  # 3 пары — норма
+    week[1][1]["Б"] = week[1][2]["Б"] = week[1][3]["Б"] = lesson()
+    report = app.QualityEvaluator(optimizer).evaluate({1: week})
+    assert report["group_short_days"] == 2
+
+    optimizer.rules.min_pairs = 1
+    relaxed = app.QualityEvaluator(optimizer).evaluate({1: week})
+    assert relaxed["group_short_days"] == 0
+    assert report["soft_penalty"] - relaxed["soft_penalty"] == pytest.approx(2 * rules.weight("S3"))
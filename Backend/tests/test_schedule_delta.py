@@ -0,0 +1,121 @@
+"""
+Контракт отпечатков недель/дней, /delta и /diff, на который опирается воркер фронта:
+изменение одной ячейки меняет отпечаток только её дня и недели, /delta отдаёт только
+этот день, /diff — ровно эту ячейку; неизвестная или вытесненная версия since — 404.
+"""
+import contextlib
+import copy
+import io
+import shutil
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app
+from make_workbook import build_workbook
+
+CHANGED_WEEK = 3
+
+
+@pytest.fixture(scope="module")
+def semester():
+    sheets = build_workbook(groups=5, teachers=10, rooms=10, semesters=1, seed=1)
+    df_rup, df_load, df_groups, df_rooms, df_rules = app.read_schedule_frames(None, sheets)
+    optimizer = app.ScheduleOptimizer(df_rup, df_load, df_groups, df_rooms, df_rules)
+    with contextlib.redirect_stdout(io.StringIO()):
+        schedule, _ = optimizer.generate_semester()
+    return optimizer, schedule
+
+
+def _changed_copy(schedule):
+    """Та же неделя, но у одного занятия другая аудитория: (копия, (день, пара, группа))."""
+    changed = copy.deepcopy(schedule)
+    for d, pairs in changed[CHANGED_WEEK].items():
+        for p, slots in pairs.items():
+            for g, info in slots.items():
+                if info:
+                    slots[g] = {**info, "room": "Новая аудитория"}
+                    return changed, (d, p, g)
+    raise AssertionError("в неделе нет занятий")
+
+
+def _content(optimizer, schedule):
+    return {"ok": True, "warnings": {}, "stats": {},
+            "data": {"semesters": {"1": app.build_json_for_one_semester(optimizer, schedule)}}}
+
+
+@pytest.fixture
+def stored(semester, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "RESULT_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(app, "_STORED_RESULTS", type(app._STORED_RESULTS)())
+    optimizer, schedule = semester
+    changed, cell = _changed_copy(schedule)
+    app.result_cache_put("old", _content(optimizer, schedule))
+    app.result_cache_put("new", _content(optimizer, changed))
+    return cell
+
+
+def _weeks(schedule_id):
+    return app.load_stored_result(schedule_id)[0]["data"]["semesters"]["1"]["weeks"]
+
+
+def test_only_changed_day_fingerprint_differs(stored):
+    day, _, _ = stored
+    for old, new in zip(_weeks("old"), _weeks("new")):
+        changed_days = [di for di, (a, b) in enumerate(zip(old["days"], new["days"]))
+                        if a["fingerprint"] != b["fingerprint"]]
+        if old["week_number"] == CHANGED_WEEK:
+            assert changed_days == [day - 1]
+            assert old["fingerprint"] != new["fingerprint"]
+        else:
+            assert changed_days == []
+            assert old["fingerprint"] == new["fingerprint"]
+
+
+def test_fingerprint_independent_of_key_order():
+    day = {"day_name": "Пн", "pairs": [{"pair": 1, "slots": {"a": None, "b": None}}]}
+    reordered = {"pairs": [{"slots": {"b": None, "a": None}, "pair": 1}], "day_name": "Пн"}
+    assert app.content_fingerprint(day) == app.content_fingerprint(reordered)
+
+
+def test_delta_returns_only_changed_day(stored):
+    day, _, _ = stored
+    body = TestClient(app.app).get("/schedules/new/delta", params={"since": "old"}).json()
+    sem = body["semesters"]["1"]
+    assert body["schedule_id"] == "new" and body["since"] == "old"
+    assert sem["weeks"] == [] and sem["removed_weeks"] == []
+    assert [(d["week_number"], d["day_index"]) for d in sem["days"]] == [(CHANGED_WEEK, day - 1)]
+    new_week = next(w for w in _weeks("new") if w["week_number"] == CHANGED_WEEK)
+    assert sem["days"][0]["day"] == new_week["days"][day - 1]
+    assert sem["days"][0]["week_fingerprint"] == new_week["fingerprint"]
+    assert body["removed_semesters"] == []
+
+
+def test_delta_against_itself_is_empty(stored):
+    sem = TestClient(app.app).get("/schedules/new/delta", params={"since": "new"}).json()["semesters"]["1"]
+    assert sem["weeks"] == [] and sem["days"] == []
+
+
+def test_diff_lists_exactly_the_changed_cell(stored):
+    day, pair, group = stored
+    body = TestClient(app.app).get("/schedules/new/diff", params={"since": "old"}).json()
+    assert body["total"] == 1 and body["weeks_changed"] == 1 and not body["truncated"]
+    change = body["changes"][0]
+    assert (change["week"], change["day"], change["pair"], change["group"]) == (CHANGED_WEEK, day, pair, group)
+    assert change["after"] == {**change["before"], "room": "Новая аудитория"}
+
+
+def test_unknown_since_is_not_found(stored):
+    client = TestClient(app.app)
+    for path in ("/schedules/new/delta", "/schedules/new/diff"):
+        r = client.get(path, params={"since": "missing"})
+        assert r.status_code == 404 and r.json()["stage"] == "not_found"
+
+
+def test_evicted_since_is_not_found(stored):
+    shutil.rmtree(app._result_dir("old"))
+    app._STORED_RESULTS.clear()
+    client = TestClient(app.app)
+    for path in ("/schedules/new/delta", "/schedules/new/diff"):
+        r = client.get(path, params={"since": "old"})
+        assert r.status_code == 404 and r.json()["stage"] == "not_found"
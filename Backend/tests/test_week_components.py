@@ -0,0 +1,70 @@
+"""
+Разбиение недели на компоненты (SCHEDULE_COMPONENT_WORKERS > 1) не должно терять занятия
+по сравнению со сквозным проходом (= 1).
+"""
+import contextlib
+import io
+
+import pandas as pd
+import pytest
+
+import app
+from make_workbook import build_workbook
+
+
+def _optimizers(sheets):
+    df_rup, df_load, df_groups, df_rooms, df_rules = app.read_schedule_frames(None, sheets)
+    return [app.ScheduleOptimizer(df_rup, load, df_groups, df_rooms, df_rules)
+            for _, load in sorted(app.split_load_by_semester(df_load).items())]
+
+
+def _placements(optimizer, workers, monkeypatch):
+    monkeypatch.setattr(app, "COMPONENT_WORKERS", workers)
+    with contextlib.redirect_stdout(io.StringIO()):
+        schedule, warnings = optimizer.generate_semester()
+    lessons = sorted((w, d, p, g, info["teacher"], info["room"])
+                     for w, days in schedule.items() for d, pairs in days.items()
+                     for p, slots in pairs.items() for g, info in slots.items())
+    return lessons, len(warnings), optimizer.semester_counters()["total"]["components"]
+
+
+def _decomposable_workbook():
+    """Отделение А — обычные дисциплины в своих аудиториях; отделение Б — только физкультура
+    в спортзале (общая аудитория). Общих групп, преподавателей и обычных аудиторий нет."""
+    groups = [f"А{i}" for i in range(1, 5)] + [f"Б{i}" for i in range(1, 5)]
+    load = []
+    for i, g in enumerate(groups[:4]):
+        for subj, teacher in (("Математика", "Иванов"), ("Физика", "Петров"), ("Информатика", f"Сидоров {i % 2}")):
+            load.append({"Дисциплина": subj, "ФИО преподавателя": teacher, "группа": g,
+                         "семестр": 1, "количество часов": 72})
+    for i, g in enumerate(groups[4:]):
+        load.append({"Дисциплина": "Физическая культура", "ФИО преподавателя": f"Тренер {i}", "группа": g,
+                     "семестр": 1, "количество часов": 48})
+    rooms = [{"Аудитория": "Спорт зал", "Назначение": "Физра", "Вместимость": 100}]
+    rooms += [{"Аудитория": str(r), "Назначение": "Общая", "Вместимость": 60} for r in range(1, 4)]
+    return {
+        "РУП": pd.DataFrame({"Дисциплина": []}),
+        "Нагруженность преподователей": pd.DataFrame(load),
+        "Группы и направления": pd.DataFrame({"Группа": groups, "Семестр": 1, "Размер группы": 25}),
+        "Аудитории": pd.DataFrame(rooms),
+        "Правила составления": pd.DataFrame(columns=["Параметр", "Описание", "Пример"]),
+    }
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_decomposable_workbook_same_placements(workers, monkeypatch):
+    serial = _placements(_optimizers(_decomposable_workbook())[0], 1, monkeypatch)
+    split = _placements(_optimizers(_decomposable_workbook())[0], workers, monkeypatch)
+    assert split[2] > 16  # неделя действительно разбита (больше одной компоненты в неделю)
+    assert len(split[0]) == len(serial[0]) and split[1] == serial[1]
+    assert split[0] == serial[0]
+
+
+def test_departments_workbook_same_placement_count(monkeypatch):
+    # отделения делят аудитории, и аудиторий мало: связь через них не должна теряться при разбиении
+    sheets = build_workbook(groups=30, teachers=60, rooms=20, semesters=2, seed=3, departments=4)
+    sheets["Аудитории"] = sheets["Аудитории"].iloc[:14]
+    for serial_opt, split_opt in zip(_optimizers(sheets), _optimizers(sheets)):
+        serial = _placements(serial_opt, 1, monkeypatch)
+        split = _placements(split_opt, 3, monkeypatch)
+        assert (len(split[0]), split[1]) == (len(serial[0]), serial[1])
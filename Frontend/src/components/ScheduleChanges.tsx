@@ -0,0 +1,55 @@
+import { useQuery } from '@tanstack/react-query';
+import { GitCompare } from 'lucide-react';
+import { fetchScheduleDiff } from '@/lib/api';
+import { SlotInfo } from '@/types/schedule';
+
+interface ScheduleChangesProps {
+  scheduleId: string;
+  since: string;
+}
+
+function describe(slot: SlotInfo | null) {
+  return slot ? `${slot.subject} · ${slot.teacher} · ауд. ${slot.room}` : '—';
+}
+
+// Что изменилось после перегенерации: сервер сравнивает только дни с разными отпечатками
+export function ScheduleChanges({ scheduleId, since }: ScheduleChangesProps) {
+  const diffQuery = useQuery({
+    queryKey: ['schedule-diff', scheduleId, since],
+    queryFn: () => fetchScheduleDiff(scheduleId, since),
+    staleTime: Infinity,
+  });
+  const diff = diffQuery.data;
+  if (!diff) return null;
+
+  if (diff.total === 0) {
+    return (
+      <div className="flex items-center gap-2 p-4 bg-card border border-border rounded-xl text-sm text-muted-foreground">
+        <GitCompare className="w-4 h-4" />
+        Изменений по сравнению с прошлой версией нет
+      </div>
+    );
+  }
+
+  return (
+    <details className="bg-primary/5 border border-primary/20 rounded-xl">
+      <summary className="p-4 cursor-pointer text-sm font-medium text-primary hover:bg-primary/10 rounded-xl transition-colors flex items-center gap-2">
+        <GitCompare className="w-4 h-4" />
+        Изменения по сравнению с прошлой версией: {diff.total} в {diff.weeks_changed} нед.
+      </summary>
+      <div className="p-4 pt-0 space-y-1 max-h-60 overflow-y-auto">
+        {diff.changes.map((change, i) => (
+          <p key={i} className="text-sm text-muted-foreground">
+            <span className="font-medium text-foreground">
+              Сем. {change.semester}, нед. {change.week}, {change.day_name.toLowerCase()}, пара {change.pair}, {change.group}:
+            </span>{' '}
+            {describe(change.before)} → {describe(change.after)}
+          </p>
+        ))}
+        {diff.truncated && (
+          <p className="text-sm text-muted-foreground">… показаны первые {diff.changes.length} из {diff.total}</p>
+        )}
+      </div>
+    </details>
+  );
+}
@@ -1,4 +1,4 @@
-import { ChevronLeft, ChevronRight, Users, GraduationCap, Calendar } from 'lucide-react';
+import { ChevronLeft, ChevronRight, Users, GraduationCap, Calendar, DoorOpen } from 'lucide-react';
 import { Button } from '@/components/ui/button';
 import {
   Select,
@@ -21,6 +21,9 @@ interface ScheduleFiltersProps {
   teachers: string[];
   selectedTeacher: string;
   onTeacherChange: (teacher: string) => void;
+  rooms?: string[];
+  selectedRoom?: string;
+  onRoomChange?: (room: string) => void;
 }
 
 export function ScheduleFilters({
@@ -36,6 +39,9 @@ export function ScheduleFilters({
   teachers,
   selectedTeacher,
   onTeacherChange,
+  rooms = [],
+  selectedRoom = 'all',
+  onRoomChange,
 }: ScheduleFiltersProps) {
   const handlePrevWeek = () => {
     const idx = weeks.indexOf(selectedWeek);
@@ -137,6 +143,26 @@ export function ScheduleFilters({
           </SelectContent>
         </Select>
       </div>
+
+      {/* Room filter */}
+      {onRoomChange && rooms.length > 0 && (
+        <div className="flex items-center gap-2">
+          <DoorOpen className="w-4 h-4 text-muted-foreground" />
+          <Select value={selectedRoom} onValueChange={onRoomChange}>
+            <SelectTrigger className="w-[160px]">
+              <SelectValue placeholder="Все аудитории" />
+            </SelectTrigger>
+            <SelectContent>
+              <SelectItem value="all">Все аудитории</SelectItem>
+              {rooms.map((room) => (
+                <SelectItem key={room} value={room}>
+                  {room}
+                </SelectItem>
+              ))}
+            </SelectContent>
+          </Select>
+        </div>
+      )}
     </div>
   );
 }
@@ -1,6 +1,7 @@
+import { memo, useMemo } from 'react';
 import { WeekData, SlotInfo } from '@/types/schedule';
 import { cn } from '@/lib/utils';
-import { ScrollArea, ScrollBar } from '@/components/ui/scroll-area';
+import { useVirtualGrid } from '@/hooks/use-virtual-grid';
 
 interface ScheduleTableProps {
   weekData: WeekData;
@@ -9,112 +10,213 @@ interface ScheduleTableProps {
   filterTeacher: string;
 }
 
-function SlotCell({ slot, isFiltered }: { slot: SlotInfo | null; isFiltered: boolean }) {
-  if (!slot) {
-    return <div className="schedule-cell bg-muted/30" />;
-  }
+// Размеры фиксированы: по ним виртуализация считает видимое окно без замеров DOM
+const ROW_HEIGHT = 88;
+const COLUMN_WIDTH = 160;
+const HEADER_HEIGHT = 48;
+const DAY_WIDTH = 96;
+const PAIR_WIDTH = 64;
+const TIME_WIDTH = 96;
+const LEFT_WIDTH = DAY_WIDTH + PAIR_WIDTH + TIME_WIDTH;
 
-  return (
-    <div
-      className={cn(
-        "schedule-cell",
-        slot.is_flow && "schedule-flow",
-        !isFiltered && "opacity-40"
-      )}
-    >
-      <div className="space-y-1">
-        <p className="font-medium text-foreground line-clamp-2">{slot.subject}</p>
-        <p className="text-muted-foreground text-[10px]">{slot.teacher}</p>
-        <p className="text-primary font-medium text-[10px]">{slot.room}</p>
-      </div>
-    </div>
-  );
+const pairTimes = [
+  '8:00 - 9:30',
+  '9:45 - 11:15',
+  '11:30 - 13:00',
+  '13:30 - 15:00',
+  '15:15 - 16:45',
+];
+
+interface Row {
+  dayIndex: number;
+  pairIndex: number;
+  pair: number;
 }
 
+interface SlotCellProps {
+  slot: SlotInfo | null | undefined;
+  isFiltered: boolean;
+  striped: boolean;
+  top: number;
+  left: number;
+}
+
+function sameSlot(a: SlotInfo | null | undefined, b: SlotInfo | null | undefined) {
+  if (a === b) return true;
+  if (!a || !b) return !a && !b;
+  return a.subject === b.subject && a.teacher === b.teacher && a.room === b.room && a.is_flow === b.is_flow;
+}
+
+// При смене недели перерисовываются только ячейки, у которых поменялось занятие
+const SlotCell = memo(
+  function SlotCell({ slot, isFiltered, striped, top, left }: SlotCellProps) {
+    return (
+      <div
+        className={cn(
+          "absolute overflow-hidden",
+          striped ? "bg-schedule-pair-1" : "bg-schedule-pair-2",
+        )}
+        style={{ top, left, width: COLUMN_WIDTH, height: ROW_HEIGHT }}
+      >
+        {!slot ? (
+          <div className="schedule-cell h-full bg-muted/30" />
+        ) : (
+          <div
+            className={cn(
+              "schedule-cell h-full",
+              slot.is_flow && "schedule-flow",
+              !isFiltered && "opacity-40"
+            )}
+          >
+            <div className="space-y-1">
+              <p className="font-medium text-foreground line-clamp-2">{slot.subject}</p>
+              <p className="text-muted-foreground text-[10px]">{slot.teacher}</p>
+              <p className="text-primary font-medium text-[10px]">{slot.room}</p>
+            </div>
+          </div>
+        )}
+      </div>
+    );
+  },
+  (prev, next) =>
+    prev.isFiltered === next.isFiltered &&
+    prev.striped === next.striped &&
+    prev.top === next.top &&
+    prev.left === next.left &&
+    sameSlot(prev.slot, next.slot),
+);
+
 export function ScheduleTable({ weekData, groups, filterGroup, filterTeacher }: ScheduleTableProps) {
-  const displayGroups = filterGroup === 'all' ? groups : groups.filter(g => g === filterGroup);
+  const displayGroups = useMemo(
+    () => (filterGroup === 'all' ? groups : groups.filter(g => g === filterGroup)),
+    [groups, filterGroup],
+  );
+
+  const rows = useMemo(() => {
+    const result: Row[] = [];
+    weekData.days.forEach((day, dayIndex) => {
+      day.pairs.forEach((pair, pairIndex) => result.push({ dayIndex, pairIndex, pair: pair.pair }));
+    });
+    return result;
+  }, [weekData]);
+
+  const dayBlocks = useMemo(() => {
+    let start = 0;
+    return weekData.days.map(day => {
+      const block = { name: day.day_name, start, size: day.pairs.length };
+      start += day.pairs.length;
+      return block;
+    });
+  }, [weekData]);
+
+  const { containerRef, rowStart, rowEnd, colStart, colEnd } = useVirtualGrid({
+    rowCount: rows.length,
+    columnCount: displayGroups.length,
+    rowHeight: ROW_HEIGHT,
+    columnWidth: COLUMN_WIDTH,
+    headerHeight: HEADER_HEIGHT,
+    leftWidth: LEFT_WIDTH,
+  });
 
-  const isSlotFiltered = (slot: SlotInfo | null): boolean => {
+  const isSlotFiltered = (slot: SlotInfo | null | undefined): boolean => {
     if (!slot) return true;
     if (filterTeacher !== 'all' && slot.teacher !== filterTeacher) return false;
     return true;
   };
 
-  const pairTimes = [
-    '8:00 - 9:30',
-    '9:45 - 11:15',
-    '11:30 - 13:00',
-    '13:30 - 15:00',
-    '15:15 - 16:45',
-  ];
+  const bodyHeight = rows.length * ROW_HEIGHT;
+  const totalWidth = LEFT_WIDTH + displayGroups.length * COLUMN_WIDTH;
+  const visibleRows = rows.slice(rowStart, rowEnd);
+  const visibleGroups = displayGroups.slice(colStart, colEnd);
+
+  const cells: JSX.Element[] = [];
+  for (let r = 0; r < visibleRows.length; r++) {
+    const rowIndex = rowStart + r;
+    const row = visibleRows[r];
+    const slots = weekData.days[row.dayIndex].pairs[row.pairIndex].slots;
+    for (let c = 0; c < visibleGroups.length; c++) {
+      const group = visibleGroups[c];
+      const slot = slots[group];
+      cells.push(
+        <SlotCell
+          key={`${rowIndex}:${group}`}
+          slot={slot}
+          isFiltered={isSlotFiltered(slot)}
+          striped={row.pairIndex % 2 === 0}
+          top={rowIndex * ROW_HEIGHT}
+          left={LEFT_WIDTH + (colStart + c) * COLUMN_WIDTH}
+        />
+      );
+    }
+  }
 
   return (
     <div className="bg-card rounded-xl border border-border overflow-hidden animate-fade-in">
-      <ScrollArea className="w-full">
-        <div className="min-w-[800px]">
-          <table className="w-full border-collapse">
-            <thead>
-              <tr className="bg-schedule-header text-primary-foreground">
-                <th className="p-3 text-left text-sm font-semibold border-r border-primary-foreground/20 w-24">
-                  День
-                </th>
-                <th className="p-3 text-center text-sm font-semibold border-r border-primary-foreground/20 w-16">
-                  №
-                </th>
-                <th className="p-3 text-center text-sm font-semibold border-r border-primary-foreground/20 w-24">
-                  Время
-                </th>
-                {displayGroups.map((group) => (
-                  <th
-                    key={group}
-                    className="p-3 text-center text-sm font-semibold border-r border-primary-foreground/20 min-w-[150px]"
-                  >
-                    {group}
-                  </th>
-                ))}
-              </tr>
-            </thead>
-            <tbody>
-              {weekData.days.map((day, dayIndex) => (
-                day.pairs.map((pair, pairIndex) => (
-                  <tr
-                    key={`${dayIndex}-${pairIndex}`}
-                    className={cn(
-                      pairIndex % 2 === 0 ? "bg-schedule-pair-1" : "bg-schedule-pair-2"
-                    )}
-                  >
-                    {pairIndex === 0 && (
-                      <td
-                        rowSpan={day.pairs.length}
-                        className="p-3 font-semibold text-sm border-r border-border bg-card align-middle"
-                      >
-                        <div className="writing-mode-vertical">
-                          {day.day_name}
-                        </div>
-                      </td>
-                    )}
-                    <td className="p-2 text-center font-medium text-sm border-r border-border">
-                      {pair.pair}
-                    </td>
-                    <td className="p-2 text-center text-xs text-muted-foreground border-r border-border whitespace-nowrap">
-                      {pairTimes[pair.pair - 1] || ''}
-                    </td>
-                    {displayGroups.map((group) => (
-                      <td key={group} className="p-0 border-r border-border">
-                        <SlotCell
-                          slot={pair.slots[group]}
-                          isFiltered={isSlotFiltered(pair.slots[group])}
-                        />
-                      </td>
-                    ))}
-                  </tr>
-                ))
+      <div ref={containerRef} className="relative overflow-auto max-h-[70vh]">
+        <div className="relative" style={{ width: totalWidth, minWidth: '100%' }}>
+          {/* Шапка: липкая сверху, угол с «День / № / Время» — ещё и слева */}
+          <div
+            className="sticky top-0 z-20 bg-schedule-header text-primary-foreground text-sm font-semibold"
+            style={{ height: HEADER_HEIGHT }}
+          >
+            <div className="sticky left-0 z-10 flex h-full bg-schedule-header" style={{ width: LEFT_WIDTH }}>
+              <div className="p-3 text-left border-r border-primary-foreground/20" style={{ width: DAY_WIDTH }}>
+                День
+              </div>
+              <div className="p-3 text-center border-r border-primary-foreground/20" style={{ width: PAIR_WIDTH }}>
+                №
+              </div>
+              <div className="p-3 text-center border-r border-primary-foreground/20" style={{ width: TIME_WIDTH }}>
+                Время
+              </div>
+            </div>
+            {visibleGroups.map((group, c) => (
+              <div
+                key={group}
+                className="absolute top-0 p-3 text-center truncate border-r border-primary-foreground/20"
+                style={{ left: LEFT_WIDTH + (colStart + c) * COLUMN_WIDTH, width: COLUMN_WIDTH, height: HEADER_HEIGHT }}
+              >
+                {group}
+              </div>
+            ))}
+          </div>
+
+          <div className="relative" style={{ height: bodyHeight }}>
+            {/* Липкие колонки дня и пары: дни — целиком (их пять), пары — только видимые */}
+            <div className="sticky left-0 z-10 bg-card" style={{ width: LEFT_WIDTH, height: bodyHeight }}>
+              {dayBlocks.map(day => (
+                <div
+                  key={day.start}
+                  className="absolute left-0 flex items-center p-3 font-semibold text-sm border-r border-b border-border bg-card"
+                  style={{ top: day.start * ROW_HEIGHT, width: DAY_WIDTH, height: day.size * ROW_HEIGHT }}
+                >
+                  <div className="writing-mode-vertical">
+                    {day.name}
+                  </div>
+                </div>
               ))}
-            </tbody>
-          </table>
+              {visibleRows.map((row, r) => (
+                <div
+                  key={rowStart + r}
+                  className={cn(
+                    "absolute flex border-b border-border",
+                    row.pairIndex % 2 === 0 ? "bg-schedule-pair-1" : "bg-schedule-pair-2"
+                  )}
+                  style={{ top: (rowStart + r) * ROW_HEIGHT, left: DAY_WIDTH, height: ROW_HEIGHT }}
+                >
+                  <div className="flex items-center justify-center p-2 font-medium text-sm border-r border-border" style={{ width: PAIR_WIDTH }}>
+                    {row.pair}
+                  </div>
+                  <div className="flex items-center justify-center p-2 text-xs text-muted-foreground border-r border-border whitespace-nowrap" style={{ width: TIME_WIDTH }}>
+                    {pairTimes[row.pair - 1] || ''}
+                  </div>
+                </div>
+              ))}
+            </div>
+            {cells}
+          </div>
         </div>
-        <ScrollBar orientation="horizontal" />
-      </ScrollArea>
+      </div>
     </div>
   );
 }
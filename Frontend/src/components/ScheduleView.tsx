@@ -1,29 +1,63 @@
 import { useState, useMemo } from 'react';
+import { keepPreviousData, useQuery } from '@tanstack/react-query';
 import { ScheduleData } from '@/types/schedule';
+import { fetchFullSchedule, fetchScheduleWeek, scheduleExportUrl } from '@/lib/api';
 import { ScheduleFilters } from './ScheduleFilters';
 import { ScheduleTable } from './ScheduleTable';
-import { AlertTriangle, CheckCircle2, Download } from 'lucide-react';
+import { ScheduleChanges } from './ScheduleChanges';
+import { AlertTriangle, CheckCircle2, Download, FileArchive, Loader2 } from 'lucide-react';
 import { Button } from '@/components/ui/button';
 
 interface ScheduleViewProps {
   data: ScheduleData;
   warnings: Record<string, string[]>;
+  scheduleId?: string | null;
+  generation?: { done: number; total: number } | null;
+  changesSince?: string | null;
 }
 
-export function ScheduleView({ data, warnings }: ScheduleViewProps) {
+export function ScheduleView({ data, warnings, scheduleId, generation, changesSince }: ScheduleViewProps) {
   const semesters = Object.keys(data.semesters).sort();
   const [selectedSemester, setSelectedSemester] = useState(semesters[0] || '1');
 
   const semesterData = data.semesters[selectedSemester];
-  const weeks = semesterData?.weeks.map(w => w.week_number) || [];
+  const weeks = semesterData?.week_numbers ?? semesterData?.weeks.map(w => w.week_number) ?? [];
   const [selectedWeek, setSelectedWeek] = useState(weeks[0] || 1);
 
   const [selectedGroup, setSelectedGroup] = useState('all');
   const [selectedTeacher, setSelectedTeacher] = useState('all');
+  const [selectedRoom, setSelectedRoom] = useState('all');
 
-  const currentWeekData = useMemo(() => {
-    return semesterData?.weeks.find(w => w.week_number === selectedWeek);
-  }, [semesterData, selectedWeek]);
+  // Полные данные (старый формат ответа) — неделя уже на руках; индекс строим раз на семестр
+  const weeksByNumber = useMemo(() => {
+    return new Map((semesterData?.weeks ?? []).map(w => [w.week_number, w]));
+  }, [semesterData]);
+  const localWeekData = weeksByNumber.get(selectedWeek);
+
+  // Облегчённый ответ — запрашиваем у сервера только нужный срез недели
+  const weekQuery = useQuery({
+    queryKey: ['schedule-week', scheduleId, selectedSemester, selectedWeek, selectedGroup, selectedTeacher, selectedRoom],
+    queryFn: () => fetchScheduleWeek(scheduleId as string, selectedSemester, selectedWeek, {
+      groups: selectedGroup !== 'all' ? [selectedGroup] : undefined,
+      teacher: selectedTeacher !== 'all' ? selectedTeacher : undefined,
+      room: selectedRoom !== 'all' ? selectedRoom : undefined,
+    }),
+    enabled: !!scheduleId && !localWeekData,
+    staleTime: Infinity,
+    placeholderData: keepPreviousData,
+  });
+
+  const currentWeekData = localWeekData ?? weekQuery.data;
+
+  // Колонки сужаем по обратным индексам сервера: только группы выбранного преподавателя/аудитории
+  const visibleGroups = useMemo(() => {
+    let result = semesterData?.groups ?? [];
+    const teacherGroups = selectedTeacher !== 'all' ? semesterData?.teacher_groups?.[selectedTeacher] : undefined;
+    const roomGroups = selectedRoom !== 'all' ? semesterData?.room_groups?.[selectedRoom] : undefined;
+    if (teacherGroups) result = result.filter(g => teacherGroups.includes(g));
+    if (roomGroups) result = result.filter(g => roomGroups.includes(g));
+    return result;
+  }, [semesterData, selectedTeacher, selectedRoom]);
 
   const totalWarnings = useMemo(() => {
     return Object.values(warnings).flat().length;
@@ -32,15 +66,19 @@ export function ScheduleView({ data, warnings }: ScheduleViewProps) {
   const handleSemesterChange = (sem: string) => {
     setSelectedSemester(sem);
     const newSemData = data.semesters[sem];
-    if (newSemData?.weeks.length) {
-      setSelectedWeek(newSemData.weeks[0].week_number);
+    const newWeeks = newSemData?.week_numbers ?? newSemData?.weeks.map(w => w.week_number) ?? [];
+    if (newWeeks.length) {
+      setSelectedWeek(newWeeks[0]);
     }
     setSelectedGroup('all');
     setSelectedTeacher('all');
+    setSelectedRoom('all');
   };
 
-  const handleExportJSON = () => {
-    const blob = new Blob([JSON.stringify(data, null, 2)], { type: 'application/json' });
+  const handleExportJSON = async () => {
+    // в облегчённом режиме недель на клиенте нет — берём полный результат с сервера
+    const fullData = scheduleId ? await fetchFullSchedule(scheduleId) : data;
+    const blob = new Blob([JSON.stringify(fullData, null, 2)], { type: 'application/json' });
     const url = URL.createObjectURL(blob);
     const a = document.createElement('a');
     a.href = url;
@@ -62,10 +100,19 @@ export function ScheduleView({ data, warnings }: ScheduleViewProps) {
       {/* Header with status */}
       <div className="flex items-center justify-between">
         <div className="flex items-center gap-4">
-          <div className="flex items-center gap-2 px-4 py-2 bg-success/10 text-success rounded-lg">
-            <CheckCircle2 className="w-5 h-5" />
-            <span className="font-medium">Расписание успешно сгенерировано</span>
-          </div>
+          {generation ? (
+            <div className="flex items-center gap-2 px-4 py-2 bg-primary/10 text-primary rounded-lg">
+              <Loader2 className="w-5 h-5 animate-spin" />
+              <span className="font-medium">
+                Генерация: {generation.done} из {generation.total} недель
+              </span>
+            </div>
+          ) : (
+            <div className="flex items-center gap-2 px-4 py-2 bg-success/10 text-success rounded-lg">
+              <CheckCircle2 className="w-5 h-5" />
+              <span className="font-medium">Расписание успешно сгенерировано</span>
+            </div>
+          )}
           {totalWarnings > 0 && (
             <div className="flex items-center gap-2 px-4 py-2 bg-warning/10 text-warning rounded-lg">
               <AlertTriangle className="w-5 h-5" />
@@ -73,10 +120,20 @@ export function ScheduleView({ data, warnings }: ScheduleViewProps) {
             </div>
           )}
         </div>
-        <Button onClick={handleExportJSON} variant="outline" className="gap-2">
-          <Download className="w-4 h-4" />
-          Экспорт JSON
-        </Button>
+        <div className="flex items-center gap-2">
+          {scheduleId && !generation && (
+            <Button asChild variant="outline" className="gap-2">
+              <a href={scheduleExportUrl(scheduleId, selectedSemester)} download>
+                <FileArchive className="w-4 h-4" />
+                Файлы групп и преподавателей
+              </a>
+            </Button>
+          )}
+          <Button onClick={handleExportJSON} variant="outline" className="gap-2" disabled={!!generation}>
+            <Download className="w-4 h-4" />
+            Экспорт JSON
+          </Button>
+        </div>
       </div>
 
       {/* Warnings accordion */}
@@ -97,6 +154,9 @@ export function ScheduleView({ data, warnings }: ScheduleViewProps) {
         </details>
       )}
 
+      {/* Changes since the previous version */}
+      {scheduleId && changesSince && <ScheduleChanges scheduleId={scheduleId} since={changesSince} />}
+
       {/* Filters */}
       <ScheduleFilters
         semesters={semesters}
@@ -111,13 +171,21 @@ export function ScheduleView({ data, warnings }: ScheduleViewProps) {
         teachers={semesterData.teachers}
         selectedTeacher={selectedTeacher}
         onTeacherChange={setSelectedTeacher}
+        rooms={semesterData.rooms}
+        selectedRoom={selectedRoom}
+        onRoomChange={scheduleId ? setSelectedRoom : undefined}
       />
 
       {/* Schedule Table */}
+      {!currentWeekData && (weekQuery.isFetching || generation) && (
+        <div className="p-8 text-center text-muted-foreground">
+          {generation ? `Неделя ${selectedWeek} ещё генерируется...` : `Загрузка недели ${selectedWeek}...`}
+        </div>
+      )}
       {currentWeekData && (
         <ScheduleTable
           weekData={currentWeekData}
-          groups={semesterData.groups}
+          groups={visibleGroups}
           filterGroup={selectedGroup}
           filterTeacher={selectedTeacher}
         />
@@ -0,0 +1,90 @@
+import * as React from "react";
+
+interface VirtualGridOptions {
+  rowCount: number;
+  columnCount: number;
+  rowHeight: number;
+  columnWidth: number;
+  // место под липкую шапку / липкие колонки слева — они закрывают часть окна прокрутки
+  headerHeight?: number;
+  leftWidth?: number;
+  overscan?: number;
+}
+
+export interface VirtualRange {
+  rowStart: number;
+  rowEnd: number;
+  colStart: number;
+  colEnd: number;
+}
+
+function clampRange(start: number, end: number, count: number, overscan: number): [number, number] {
+  return [Math.max(0, start - overscan), Math.min(count, end + overscan)];
+}
+
+// Окно видимых строк/колонок для сетки с фиксированным размером ячеек.
+// Пересчёт — не чаще раза за кадр; при тех же границах состояние не меняется и рендера нет.
+export function useVirtualGrid<T extends HTMLElement = HTMLDivElement>({
+  rowCount,
+  columnCount,
+  rowHeight,
+  columnWidth,
+  headerHeight = 0,
+  leftWidth = 0,
+  overscan = 2,
+}: VirtualGridOptions) {
+  const containerRef = React.useRef<T>(null);
+  const [range, setRange] = React.useState<VirtualRange>({ rowStart: 0, rowEnd: 0, colStart: 0, colEnd: 0 });
+
+  const measure = React.useCallback(() => {
+    const el = containerRef.current;
+    if (!el) return;
+    const bodyHeight = Math.max(0, el.clientHeight - headerHeight);
+    const bodyWidth = Math.max(0, el.clientWidth - leftWidth);
+
+    const [rowStart, rowEnd] = clampRange(
+      Math.floor(el.scrollTop / rowHeight),
+      Math.ceil((el.scrollTop + bodyHeight) / rowHeight),
+      rowCount,
+      overscan,
+    );
+    const [colStart, colEnd] = clampRange(
+      Math.floor(el.scrollLeft / columnWidth),
+      Math.ceil((el.scrollLeft + bodyWidth) / columnWidth),
+      columnCount,
+      overscan,
+    );
+
+    setRange(prev =>
+      prev.rowStart === rowStart && prev.rowEnd === rowEnd && prev.colStart === colStart && prev.colEnd === colEnd
+        ? prev
+        : { rowStart, rowEnd, colStart, colEnd },
+    );
+  }, [rowCount, columnCount, rowHeight, columnWidth, headerHeight, leftWidth, overscan]);
+
+  React.useLayoutEffect(() => {
+    const el = containerRef.current;
+    if (!el) return;
+
+    let frame = 0;
+    const onScroll = () => {
+      if (frame) return;
+      frame = requestAnimationFrame(() => {
+        frame = 0;
+        measure();
+      });
+    };
+
+    measure();
+    el.addEventListener("scroll", onScroll, { passive: true });
+    const observer = new ResizeObserver(onScroll);
+    observer.observe(el);
+    return () => {
+      el.removeEventListener("scroll", onScroll);
+      observer.disconnect();
+      if (frame) cancelAnimationFrame(frame);
+    };
+  }, [measure]);
+
+  return { containerRef, ...range };
+}
@@ -0,0 +1,130 @@
+import {
+  ProcessResponse,
+  ProcessStreamEvent,
+  ScheduleData,
+  ScheduleDelta,
+  ScheduleDiff,
+  WeekData,
+  WeekSliceResponse,
+} from '@/types/schedule';
+
+export const API_URL = 'http://localhost:8000';
+
+export interface WeekFilters {
+  groups?: string[];
+  teacher?: string;
+  room?: string;
+}
+
+export async function processWorkbook(file: File): Promise<{ status: number; body: ProcessResponse | null }> {
+  const formData = new FormData();
+  formData.append('file', file);
+
+  // lean=1: сервер отдаёт только сводку, недели подгружаются по одной (или дельтой)
+  const response = await fetch(`${API_URL}/process?lean=1`, {
+    method: 'POST',
+    body: formData,
+  });
+  return { status: response.status, body: await response.json().catch(() => null) };
+}
+
+// Потоковый /process: события NDJSON приходят по мере готовности (неделя за неделей)
+export async function streamProcess(
+  file: File,
+  onEvent: (event: ProcessStreamEvent) => void,
+): Promise<void> {
+  const formData = new FormData();
+  formData.append('file', file);
+
+  const response = await fetch(`${API_URL}/process/stream`, {
+    method: 'POST',
+    body: formData,
+  });
+  if (!response.ok || !response.body) {
+    const body: ProcessResponse | null = await response.json().catch(() => null);
+    onEvent({ event: 'error', status: response.status, body });
+    return;
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let newline = buffer.indexOf('\n');
+    while (newline >= 0) {
+      const line = buffer.slice(0, newline).trim();
+      buffer = buffer.slice(newline + 1);
+      if (line) onEvent(JSON.parse(line));
+      newline = buffer.indexOf('\n');
+    }
+  }
+}
+
+// Версия результата на сервере: вместе с sha256 файла даёт schedule_id ещё до загрузки
+export async function fetchResultVersion(): Promise<string> {
+  const response = await fetch(`${API_URL}/version`);
+  if (!response.ok) {
+    throw new Error('Не удалось получить версию результата');
+  }
+  const result: { optimizer_version: string } = await response.json();
+  return result.optimizer_version;
+}
+
+export async function fetchScheduleWeek(
+  scheduleId: string,
+  semester: string,
+  week: number,
+  filters: WeekFilters = {},
+): Promise<WeekData> {
+  const params = new URLSearchParams();
+  if (filters.groups?.length) params.set('groups', filters.groups.join(','));
+  if (filters.teacher) params.set('teacher', filters.teacher);
+  if (filters.room) params.set('room', filters.room);
+
+  const query = params.toString();
+  const url = `${API_URL}/schedules/${scheduleId}/semesters/${encodeURIComponent(semester)}/weeks/${week}${query ? `?${query}` : ''}`;
+  const response = await fetch(url);
+  if (!response.ok) {
+    throw new Error(`Не удалось загрузить неделю ${week}`);
+  }
+  const result: WeekSliceResponse = await response.json();
+  return result.week;
+}
+
+export async function fetchFullSchedule(scheduleId: string): Promise<ScheduleData> {
+  const response = await fetch(`${API_URL}/schedules/${scheduleId}`);
+  if (!response.ok) {
+    throw new Error('Не удалось загрузить расписание');
+  }
+  const result: ProcessResponse = await response.json();
+  return result.data as ScheduleData;
+}
+
+// null — прежней версии на сервере уже нет (вытеснена из кэша): нужен полный результат
+export async function fetchScheduleDelta(scheduleId: string, since: string): Promise<ScheduleDelta | null> {
+  const response = await fetch(`${API_URL}/schedules/${scheduleId}/delta?since=${encodeURIComponent(since)}`);
+  if (response.status === 404) return null;
+  if (!response.ok) {
+    throw new Error('Не удалось загрузить изменения расписания');
+  }
+  return response.json();
+}
+
+export async function fetchScheduleDiff(scheduleId: string, since: string): Promise<ScheduleDiff> {
+  const response = await fetch(`${API_URL}/schedules/${scheduleId}/diff?since=${encodeURIComponent(since)}`);
+  if (!response.ok) {
+    throw new Error('Не удалось загрузить список изменений');
+  }
+  return response.json();
+}
+
+// Zip с файлом на каждую группу/преподавателя (ics и xlsx); сервер собирает архив потоком
+export function scheduleExportUrl(scheduleId: string, semester?: string): string {
+  const params = new URLSearchParams({ format: 'ics,xlsx', kind: 'group,teacher' });
+  if (semester) params.set('semester', semester);
+  return `${API_URL}/schedules/${scheduleId}/export?${params}`;
+}
@@ -0,0 +1,76 @@
+import { CachedSchedule } from '@/types/schedule';
+
+// IndexedDB-кэш готовых расписаний. Работает и в окне, и в воркере (localStorage — только в окне).
+const DB_NAME = 'schedule-cache';
+const DB_VERSION = 1;
+const STORE = 'schedules';
+const MAX_ENTRIES = 10;
+
+const LAST_KEY = 'schedule:last';
+
+function request<T>(req: IDBRequest<T>): Promise<T> {
+  return new Promise((resolve, reject) => {
+    req.onsuccess = () => resolve(req.result);
+    req.onerror = () => reject(req.error);
+  });
+}
+
+let dbPromise: Promise<IDBDatabase> | null = null;
+
+function openDb(): Promise<IDBDatabase> {
+  if (!dbPromise) {
+    const req = indexedDB.open(DB_NAME, DB_VERSION);
+    req.onupgradeneeded = () => {
+      const store = req.result.createObjectStore(STORE, { keyPath: 'schedule_id' });
+      store.createIndex('saved_at', 'saved_at');
+    };
+    dbPromise = request(req);
+    // неудачное открытие (приватный режим и т.п.) не кэшируем — попробуем в следующий раз
+    dbPromise.catch(() => { dbPromise = null; });
+  }
+  return dbPromise;
+}
+
+export async function getCachedSchedule(scheduleId: string): Promise<CachedSchedule | null> {
+  const db = await openDb();
+  const result = await request(db.transaction(STORE).objectStore(STORE).get(scheduleId));
+  return (result as CachedSchedule | undefined) ?? null;
+}
+
+export async function putCachedSchedule(schedule: CachedSchedule): Promise<void> {
+  const db = await openDb();
+  const tx = db.transaction(STORE, 'readwrite');
+  const store = tx.objectStore(STORE);
+  store.put(schedule);
+
+  // держим только последние MAX_ENTRIES расписаний: старые удаляем по saved_at
+  const count = await request(store.count());
+  if (count > MAX_ENTRIES) {
+    let extra = count - MAX_ENTRIES;
+    const cursorReq = store.index('saved_at').openCursor();
+    cursorReq.onsuccess = () => {
+      const cursor = cursorReq.result;
+      if (!cursor || extra <= 0) return;
+      if (cursor.primaryKey !== schedule.schedule_id) {
+        cursor.delete();
+        extra--;
+      }
+      cursor.continue();
+    };
+  }
+
+  await new Promise<void>((resolve, reject) => {
+    tx.oncomplete = () => resolve();
+    tx.onerror = () => reject(tx.error);
+    tx.onabort = () => reject(tx.error);
+  });
+}
+
+export function rememberLastSchedule(scheduleId: string | null) {
+  if (scheduleId) localStorage.setItem(LAST_KEY, scheduleId);
+  else localStorage.removeItem(LAST_KEY);
+}
+
+export function lastScheduleId(): string | null {
+  return localStorage.getItem(LAST_KEY);
+}
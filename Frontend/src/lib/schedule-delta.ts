@@ -0,0 +1,34 @@
+import { CachedSchedule, ScheduleData, ScheduleDelta, WeekData } from '@/types/schedule';
+
+// Новая версия = прежняя (из IndexedDB) + изменения с сервера. Совпавшие недели
+// переиспользуются как есть — по ссылке, поэтому и перерисовываются только изменённые.
+export function applyScheduleDelta(previous: CachedSchedule, delta: ScheduleDelta): CachedSchedule {
+  const data: ScheduleData = { semesters: {} };
+
+  for (const [sem, semDelta] of Object.entries(delta.semesters)) {
+    const { weeks: changedWeeks, days: changedDays, removed_weeks: removedWeeks, ...meta } = semDelta;
+    const removed = new Set(removedWeeks);
+    const byNumber = new Map<number, WeekData>();
+    for (const week of previous.data.semesters[sem]?.weeks ?? []) {
+      if (!removed.has(week.week_number)) byNumber.set(week.week_number, week);
+    }
+    for (const week of changedWeeks) byNumber.set(week.week_number, week);
+    for (const { week_number, week_fingerprint, day_index, day } of changedDays) {
+      const week = byNumber.get(week_number);
+      if (!week) throw new Error(`Неделя ${week_number} отсутствует в прежней версии`);
+      const days = [...week.days];
+      days[day_index] = day;
+      byNumber.set(week_number, { ...week, days, fingerprint: week_fingerprint });
+    }
+
+    const weeks = [...byNumber.values()].sort((a, b) => a.week_number - b.week_number);
+    // прежняя версия в кэше не та, что думает сервер — такую дельту применять нельзя
+    const expected = meta.fingerprints;
+    if (expected && weeks.some(w => expected[String(w.week_number)]?.week !== w.fingerprint)) {
+      throw new Error(`Семестр ${sem}: после применения изменений отпечатки не совпали`);
+    }
+    data.semesters[sem] = { ...meta, weeks, week_numbers: weeks.map(w => w.week_number) };
+  }
+
+  return { schedule_id: delta.schedule_id, data, warnings: delta.warnings, saved_at: Date.now() };
+}
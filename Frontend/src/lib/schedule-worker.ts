@@ -0,0 +1,54 @@
+import { CachedSchedule, ScheduleWorkerEvent } from '@/types/schedule';
+import type { ScheduleWorkerMessage, ScheduleWorkerRequest } from '@/workers/schedule.worker';
+
+// Один воркер на вкладку; запросы различаются по id
+let worker: Worker | null = null;
+let nextId = 0;
+const handlers = new Map<number, (message: ScheduleWorkerMessage) => void>();
+
+function getWorker(): Worker {
+  if (!worker) {
+    worker = new Worker(new URL('../workers/schedule.worker.ts', import.meta.url), { type: 'module' });
+    worker.onmessage = (e: MessageEvent<ScheduleWorkerMessage>) => handlers.get(e.data.id)?.(e.data);
+  }
+  return worker;
+}
+
+type WithoutId<T> = T extends unknown ? Omit<T, 'id'> : never;
+
+function send(request: WithoutId<ScheduleWorkerRequest>, onMessage: (message: ScheduleWorkerMessage) => void) {
+  const id = ++nextId;
+  handlers.set(id, onMessage);
+  getWorker().postMessage({ ...request, id });
+  return () => handlers.delete(id);
+}
+
+// Загрузка файла целиком в воркере: сначала поиск в IndexedDB, затем дельта относительно
+// previousId (если та версия есть в IndexedDB), иначе /process/stream.
+// События те же, что у streamProcess, плюс 'ready' с готовым проиндексированным расписанием.
+export function processInWorker(
+  file: File,
+  onEvent: (event: ScheduleWorkerEvent) => void,
+  previousId?: string | null,
+): Promise<void> {
+  return new Promise((resolve, reject) => {
+    const done = send({ type: 'process', file, previousId }, message => {
+      if (message.type === 'event') {
+        onEvent(message.event);
+        return;
+      }
+      done();
+      if (message.type === 'failed') reject(new Error(message.message));
+      else resolve();
+    });
+  });
+}
+
+export function restoreSchedule(scheduleId: string): Promise<CachedSchedule | null> {
+  return new Promise(resolve => {
+    const done = send({ type: 'restore', scheduleId }, message => {
+      done();
+      resolve(message.type === 'restored' ? message.schedule : null);
+    });
+  });
+}
@@ -1,13 +1,13 @@
-import { useState } from 'react';
+import { useEffect, useRef, useState } from 'react';
 import { FileUpload } from '@/components/FileUpload';
 import { ValidationErrors } from '@/components/ValidationErrors';
 import { ScheduleView } from '@/components/ScheduleView';
-import { ProcessResponse, ScheduleData, ValidationReport } from '@/types/schedule';
+import { CachedSchedule, ScheduleData, ScheduleWorkerEvent, ValidationReport } from '@/types/schedule';
 import { Button } from '@/components/ui/button';
 import { CalendarDays, RefreshCw, Sparkles, FileCheck, Clock } from 'lucide-react';
 import { useToast } from '@/hooks/use-toast';
-
-const API_URL = 'http://localhost:8000';
+import { processInWorker, restoreSchedule } from '@/lib/schedule-worker';
+import { lastScheduleId, rememberLastSchedule } from '@/lib/schedule-cache';
 
 export default function Index() {
   const [selectedFile, setSelectedFile] = useState<File | null>(null);
@@ -15,13 +15,39 @@ export default function Index() {
   const [validationReport, setValidationReport] = useState<ValidationReport | null>(null);
   const [scheduleData, setScheduleData] = useState<ScheduleData | null>(null);
   const [warnings, setWarnings] = useState<Record<string, string[]>>({});
+  const [scheduleId, setScheduleId] = useState<string | null>(null);
+  const [generation, setGeneration] = useState<{ done: number; total: number } | null>(null);
+  // версия, относительно которой пришла дельта: по ней показываем, что изменилось
+  const [changesSince, setChangesSince] = useState<string | null>(null);
+  // последнее показанное расписание переживает «Новый файл»: правленую книгу грузим дельтой
+  const previousScheduleId = useRef<string | null>(lastScheduleId());
   const { toast } = useToast();
 
+  const showSchedule = (schedule: CachedSchedule) => {
+    setScheduleData(schedule.data);
+    setWarnings(schedule.warnings);
+    setScheduleId(schedule.schedule_id);
+    rememberLastSchedule(schedule.schedule_id);
+    previousScheduleId.current = schedule.schedule_id;
+  };
+
+  // после перезагрузки страницы — последнее расписание из IndexedDB, без загрузки и генерации
+  useEffect(() => {
+    const lastId = lastScheduleId();
+    if (!lastId) return;
+    let cancelled = false;
+    restoreSchedule(lastId).then(schedule => {
+      if (schedule && !cancelled) showSchedule(schedule);
+    });
+    return () => { cancelled = true; };
+  }, []);
+
   const handleFileSelect = (file: File) => {
     setSelectedFile(file);
     setValidationReport(null);
     setScheduleData(null);
     setWarnings({});
+    setScheduleId(null);
   };
 
   const handleClear = () => {
@@ -29,6 +55,9 @@ export default function Index() {
     setValidationReport(null);
     setScheduleData(null);
     setWarnings({});
+    setScheduleId(null);
+    setChangesSince(null);
+    rememberLastSchedule(null);
   };
 
   const handleProcess = async () => {
@@ -37,34 +66,67 @@ export default function Index() {
     setIsLoading(true);
     setValidationReport(null);
     setScheduleData(null);
+    setScheduleId(null);
+    setGeneration(null);
+    setChangesSince(null);
 
-    const formData = new FormData();
-    formData.append('file', selectedFile);
+    // Расписание собирается по мере прихода недель: первую можно смотреть,
+    // пока остальные ещё генерируются
+    const handleEvent = (event: ScheduleWorkerEvent) => {
+      switch (event.event) {
+        case 'semester_started': {
+          const { event: _event, semester, ...meta } = event;
+          setScheduleData(prev => ({
+            semesters: { ...(prev?.semesters ?? {}), [semester]: { ...meta, weeks: [] } },
+          }));
+          break;
+        }
+        case 'week_done':
+          setScheduleData(prev => {
+            const sem = prev?.semesters[event.semester];
+            if (!prev || !sem) return prev;
+            return {
+              semesters: { ...prev.semesters, [event.semester]: { ...sem, weeks: [...sem.weeks, event.week_data] } },
+            };
+          });
+          if (event.total) setGeneration({ done: event.done ?? 0, total: event.total });
+          break;
+        case 'done':
+          setGeneration(null);
+          break;
+        case 'ready':
+          // воркер уже собрал недели и индексы (фильтры) — просто показываем
+          showSchedule(event.schedule);
+          setGeneration(null);
+          setChangesSince(event.source === 'delta' ? event.previous ?? null : null);
+          toast({
+            title: 'Успешно!',
+            description: {
+              local: 'Расписание загружено из локального кэша',
+              server: 'Расписание успешно сгенерировано',
+              delta: 'Расписание обновлено: загружены только изменения',
+            }[event.source],
+          });
+          break;
+        case 'error':
+          setScheduleData(null);
+          setGeneration(null);
+          setValidationReport(event.body?.report || null);
+          toast({
+            title: event.body?.report ? 'Ошибка валидации' : 'Ошибка генерации',
+            description: event.body?.report
+              ? `Найдено ${event.body.report.summary.errors || 0} ошибок`
+              : event.body?.message || `Сервер вернул ошибку ${event.status}`,
+            variant: 'destructive',
+          });
+          break;
+      }
+    };
 
     try {
-      const response = await fetch(`${API_URL}/process`, {
-        method: 'POST',
-        body: formData,
-      });
-
-      const result: ProcessResponse = await response.json();
-
-      if (!result.ok) {
-        setValidationReport(result.report || null);
-        toast({
-          title: 'Ошибка валидации',
-          description: `Найдено ${result.report?.summary.errors || 0} ошибок`,
-          variant: 'destructive',
-        });
-      } else {
-        setScheduleData(result.data || null);
-        setWarnings(result.warnings || {});
-        toast({
-          title: 'Успешно!',
-          description: 'Расписание успешно сгенерировано',
-        });
-      }
+      await processInWorker(selectedFile, handleEvent, previousScheduleId.current);
     } catch (error) {
+      setGeneration(null);
       toast({
         title: 'Ошибка соединения',
         description: 'Не удалось подключиться к серверу. Убедитесь, что бэкенд запущен.',
@@ -213,7 +275,13 @@ export default function Index() {
             )}
           </div>
         ) : (
-          <ScheduleView data={scheduleData} warnings={warnings} />
+          <ScheduleView
+            data={scheduleData}
+            warnings={warnings}
+            scheduleId={scheduleId}
+            generation={generation}
+            changesSince={changesSince}
+          />
         )}
       </main>
 
@@ -14,17 +14,28 @@ export interface PairData {
 export interface DayData {
   day_name: string;
   pairs: PairData[];
+  fingerprint?: string;
 }
 
 export interface WeekData {
   week_number: number;
   days: DayData[];
+  groups?: string[];
+  fingerprint?: string;
 }
 
+// Отпечатки содержимого по неделям (из сводки): сравниваются без загрузки самих недель
+export type WeekFingerprints = Record<string, { week: string; days: string[] }>;
+
 export interface SemesterData {
   groups: string[];
   teachers: string[];
   weeks: WeekData[];
+  rooms?: string[];
+  week_numbers?: number[];
+  teacher_groups?: Record<string, string[]>;
+  room_groups?: Record<string, string[]>;
+  fingerprints?: WeekFingerprints;
 }
 
 export interface ScheduleData {
@@ -58,10 +69,122 @@ export interface ValidationReport {
   };
 }
 
+// Счётчики оптимизатора (ScheduleOptimizer.COUNTERS) за неделю
+export type PlacementCounters = Record<string, number>;
+
+export interface SemesterStats {
+  total: PlacementCounters;
+  weeks: Record<string, PlacementCounters>;
+}
+
+// KPI семестра (QualityEvaluator): score — штраф по правилам calculate_slot_score, меньше — лучше
+export interface QualityReport {
+  score: number;
+  soft_penalty: number;
+  group_pairs: number;
+  group_windows: number;
+  group_days_with_windows: number;
+  edge_pairs: number;
+  adjacent_pairs: number;
+  max_pairs_per_day: number;
+  day_balance_std: number;
+  // дни групп, где пар меньше Min_Lessons_Per_Day
+  group_short_days: number;
+  teacher_idle_gaps: number;
+  teacher_days_with_gaps: number;
+  teacher_single_pair_days: number;
+  teacher_conflicts: number;
+  room_conflicts: number;
+  room_overflows: number;
+  room_waste: number;
+  room_utilization: number;
+}
+
 export interface ProcessResponse {
   ok: boolean;
   stage: string;
   data?: ScheduleData;
   report?: ValidationReport;
   warnings?: Record<string, string[]>;
+  stats?: Record<string, SemesterStats>;
+  quality?: Record<string, QualityReport>;
+  schedule_id?: string;
+  message?: string;
+}
+
+// GET /schedules/{id}/delta?since=...: изменившиеся недели целиком или отдельные дни
+export interface SemesterDelta extends Omit<SemesterData, 'weeks'> {
+  weeks: WeekData[];
+  days: { week_number: number; week_fingerprint: string; day_index: number; day: DayData }[];
+  removed_weeks: number[];
+}
+
+export interface ScheduleDelta {
+  ok: boolean;
+  schedule_id: string;
+  since: string;
+  warnings: Record<string, string[]>;
+  stats?: Record<string, SemesterStats>;
+  semesters: Record<string, SemesterDelta>;
+  removed_semesters: string[];
+}
+
+export interface ScheduleChange {
+  semester: string;
+  week: number;
+  day: number;
+  day_name: string;
+  pair: number;
+  group: string;
+  before: SlotInfo | null;
+  after: SlotInfo | null;
 }
+
+export interface ScheduleDiff {
+  ok: boolean;
+  schedule_id: string;
+  since: string;
+  total: number;
+  weeks_changed: number;
+  truncated: boolean;
+  changes: ScheduleChange[];
+  removed_weeks: Record<string, number[]>;
+}
+
+export interface WeekSliceResponse {
+  ok: boolean;
+  schedule_id: string;
+  semester: string;
+  week: WeekData;
+}
+
+export type ProcessStreamEvent =
+  | { event: 'received' | 'validated' | 'checked' }
+  | ({ event: 'semester_started'; semester: string } & Omit<SemesterData, 'weeks'>)
+  | { event: 'week_done'; semester: string; week: number; done?: number; total?: number; stats?: PlacementCounters; week_data: WeekData }
+  | {
+      event: 'done';
+      schedule_id: string;
+      cache: 'hit' | 'miss';
+      warnings: Record<string, string[]>;
+      stats?: Record<string, SemesterStats>;
+      quality?: Record<string, QualityReport>;
+      timings?: Record<string, number>;
+      resources?: { peak_rss_mb?: number; rss_growth_mb?: number };
+      summary: ScheduleData;
+    }
+  | { event: 'error'; status: number; body: ProcessResponse | null };
+
+// Расписание, разобранное и проиндексированное в воркере; хранится в IndexedDB по schedule_id
+// (sha256 книги + версия результата)
+export interface CachedSchedule {
+  schedule_id: string;
+  data: ScheduleData;
+  warnings: Record<string, string[]>;
+  saved_at: number;
+}
+
+// source: 'delta' — с сервера пришли только изменения относительно previous (schedule_id)
+export type ScheduleWorkerEvent =
+  | ProcessStreamEvent
+  | { event: 'ready'; source: 'local' | 'server' | 'delta'; schedule: CachedSchedule; previous?: string };
@@ -0,0 +1,154 @@
+// Разбор потока /process/stream, индексация и запись в IndexedDB — вне главного потока,
+// чтобы многомегабайтный ответ не подвешивал интерфейс.
+import { fetchResultVersion, fetchScheduleDelta, processWorkbook, streamProcess } from '@/lib/api';
+import { getCachedSchedule, putCachedSchedule } from '@/lib/schedule-cache';
+import { applyScheduleDelta } from '@/lib/schedule-delta';
+import { CachedSchedule, ScheduleData, ScheduleWorkerEvent, SemesterData, WeekData } from '@/types/schedule';
+
+export type ScheduleWorkerRequest =
+  | { id: number; type: 'process'; file: File; previousId?: string | null }
+  | { id: number; type: 'restore'; scheduleId: string };
+
+export type ScheduleWorkerMessage =
+  | { id: number; type: 'event'; event: ScheduleWorkerEvent }
+  | { id: number; type: 'restored'; schedule: CachedSchedule | null }
+  | { id: number; type: 'finished' }
+  | { id: number; type: 'failed'; message: string };
+
+// в tsconfig только DOM-типы, поэтому описываем нужную часть области воркера сами
+const ctx = self as unknown as {
+  postMessage(message: ScheduleWorkerMessage): void;
+  onmessage: ((e: MessageEvent<ScheduleWorkerRequest>) => void) | null;
+};
+
+async function sha256Hex(file: File): Promise<string> {
+  const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+}
+
+// Индексы по неделе, преподавателю и аудитории: week_numbers, teacher_groups, room_groups.
+// Сервер присылает их в сводке; если их нет — собираем из недель сами.
+function indexSemester(meta: Partial<SemesterData>, streamedWeeks: WeekData[]): SemesterData {
+  const byNumber = new Map<number, WeekData>();
+  for (const week of streamedWeeks) byNumber.set(week.week_number, week);
+  const weeks = [...byNumber.values()].sort((a, b) => a.week_number - b.week_number);
+
+  let teacherGroups = meta.teacher_groups;
+  let roomGroups = meta.room_groups;
+  if (!teacherGroups || !roomGroups) {
+    const teachers: Record<string, Set<string>> = {};
+    const rooms: Record<string, Set<string>> = {};
+    for (const week of weeks) {
+      for (const day of week.days) {
+        for (const pair of day.pairs) {
+          for (const [group, slot] of Object.entries(pair.slots)) {
+            if (!slot) continue;
+            (teachers[slot.teacher] ??= new Set()).add(group);
+            (rooms[slot.room] ??= new Set()).add(group);
+          }
+        }
+      }
+    }
+    const toSorted = (index: Record<string, Set<string>>) =>
+      Object.fromEntries(Object.entries(index).map(([key, groups]) => [key, [...groups].sort()]));
+    teacherGroups ??= toSorted(teachers);
+    roomGroups ??= toSorted(rooms);
+  }
+
+  return {
+    ...meta,
+    groups: meta.groups ?? [],
+    teachers: meta.teachers ?? Object.keys(teacherGroups).sort(),
+    rooms: meta.rooms ?? Object.keys(roomGroups).sort(),
+    weeks,
+    week_numbers: weeks.map(w => w.week_number),
+    teacher_groups: teacherGroups,
+    room_groups: roomGroups,
+  };
+}
+
+// Перегенерация после правки книги: сервер отдаёт сводку (/process?lean=1), а недели —
+// только изменившиеся относительно прежней версии. false — дельта не получилась, нужен полный поток.
+async function processAsDelta(file: File, previous: CachedSchedule, emit: (event: ScheduleWorkerEvent) => void) {
+  emit({ event: 'received' });
+  const { status, body } = await processWorkbook(file);
+  if (!body?.ok || !body.schedule_id) {
+    if (status >= 500 || !body) return false;
+    emit({ event: 'error', status, body });
+    return true;
+  }
+
+  const delta = await fetchScheduleDelta(body.schedule_id, previous.schedule_id);
+  if (!delta) return false;
+  const schedule = applyScheduleDelta(previous, delta);
+  emit({ event: 'ready', source: 'delta', schedule, previous: previous.schedule_id });
+  await putCachedSchedule(schedule).catch(() => undefined);
+  return true;
+}
+
+async function processFile(id: number, file: File, previousId?: string | null) {
+  const emit = (event: ScheduleWorkerEvent) => ctx.postMessage({ id, type: 'event', event });
+
+  // ключ кэша = schedule_id сервера: sha256 книги + версия результата
+  const [hash, version] = await Promise.all([sha256Hex(file), fetchResultVersion().catch(() => null)]);
+  if (version) {
+    const cached = await getCachedSchedule(`${hash}-${version}`).catch(() => null);
+    if (cached) {
+      emit({ event: 'ready', source: 'local', schedule: cached });
+      return;
+    }
+  }
+
+  const previous = previousId ? await getCachedSchedule(previousId).catch(() => null) : null;
+  if (previous && await processAsDelta(file, previous, emit).catch(() => false)) return;
+
+  const semesters: Record<string, { meta: Omit<SemesterData, 'weeks'>; weeks: WeekData[] }> = {};
+  // объект, а не let: присваивание внутри колбэка TS не видит при сужении типа
+  const result: { schedule: CachedSchedule | null } = { schedule: null };
+
+  await streamProcess(file, event => {
+    switch (event.event) {
+      case 'semester_started': {
+        const { event: _event, semester, ...meta } = event;
+        semesters[semester] = { meta, weeks: [] };
+        break;
+      }
+      case 'week_done':
+        semesters[event.semester]?.weeks.push(event.week_data);
+        break;
+      case 'done': {
+        const data: ScheduleData = { semesters: {} };
+        const summary = event.summary?.semesters ?? {};
+        for (const sem of new Set([...Object.keys(semesters), ...Object.keys(summary)])) {
+          const { weeks: _weeks, ...summaryMeta } = summary[sem] ?? { weeks: [] };
+          data.semesters[sem] = indexSemester({ ...semesters[sem]?.meta, ...summaryMeta }, semesters[sem]?.weeks ?? []);
+        }
+        result.schedule = { schedule_id: event.schedule_id, data, warnings: event.warnings || {}, saved_at: Date.now() };
+        break;
+      }
+    }
+    emit(event);
+  });
+
+  const { schedule } = result;
+  if (schedule) {
+    emit({ event: 'ready', source: 'server', schedule });
+    // кэш — оптимизация: квота/приватный режим не должны ломать показ
+    await putCachedSchedule(schedule).catch(() => undefined);
+  }
+}
+
+ctx.onmessage = async (e: MessageEvent<ScheduleWorkerRequest>) => {
+  const req = e.data;
+  try {
+    if (req.type === 'process') {
+      await processFile(req.id, req.file, req.previousId);
+      ctx.postMessage({ id: req.id, type: 'finished' });
+    } else {
+      const schedule = await getCachedSchedule(req.scheduleId).catch(() => null);
+      ctx.postMessage({ id: req.id, type: 'restored', schedule });
+    }
+  } catch (error) {
+    ctx.postMessage({ id: req.id, type: 'failed', message: String(error) });
+  }
+};